@@ -1,11 +1,14 @@
 import os
 import tkinter as tk
 from tkinter import filedialog, messagebox, ttk
-from pathlib import Path
-import zipfile
-import tempfile
 import sys
-import shutil
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from microstock_core.patterns import RenamePattern, is_rename_pattern
+from microstock_core.renaming import rename_batch
+from microstock_core.scanning import walk_files
+from microstock_core.startup import report_startup
 
 class BatchRenamerGUI:
     def __init__(self, root):
@@ -17,6 +20,9 @@ class BatchRenamerGUI:
         # Variables
         self.selected_files = []
         self.new_name = tk.StringVar(value="NewName")
+        self.name_regex = tk.StringVar()
+        self.cancel_event = threading.Event()
+        self.is_running = False
         
         # GUI Setup
         self.create_widgets()
@@ -34,6 +40,11 @@ class BatchRenamerGUI:
         frame_name.pack(pady=10, padx=10, fill=tk.X)
         tk.Label(frame_name, text="New Base Name:").pack(side=tk.LEFT)
         tk.Entry(frame_name, textvariable=self.new_name, width=30).pack(side=tk.LEFT, padx=5)
+        # A name with {tokens} is a pattern, e.g. {exif:DateTimeOriginal:%Y%m%d}_{n:04}; see microstock_core/patterns.py
+        frame_regex = tk.Frame(self.root)
+        frame_regex.pack(padx=10, fill=tk.X)
+        tk.Label(frame_regex, text="Match (regex, for {1}, {2}...):").pack(side=tk.LEFT)
+        tk.Entry(frame_regex, textvariable=self.name_regex, width=22).pack(side=tk.LEFT, padx=5)
         
         # Action Buttons
         btn_frame = tk.Frame(self.root)
@@ -56,8 +67,12 @@ class BatchRenamerGUI:
         self.progress.pack(pady=20)
         
         # Big Rename Button
-        tk.Button(self.root, text="START RENAMING", command=self.rename_items,
-                 bg='#FF9800', fg='white', height=2, width=25, font=('Arial', 10, 'bold')).pack(pady=10)
+        self.start_button = tk.Button(self.root, text="START RENAMING", command=self.rename_items,
+                 bg='#FF9800', fg='white', height=2, width=25, font=('Arial', 10, 'bold'))
+        self.start_button.pack(pady=10)
+        self.cancel_button = tk.Button(self.root, text="CANCEL", command=self.cancel_renaming,
+                 bg='#9E9E9E', fg='white', width=15, state=tk.DISABLED)
+        self.cancel_button.pack()
     
     def select_files(self):
         files = filedialog.askopenfilenames(title="Select Files to Rename")
@@ -68,11 +83,7 @@ class BatchRenamerGUI:
     def select_folder(self):
         folder = filedialog.askdirectory(title="Select Folder with Files")
         if folder:
-            self.selected_files = []
-            for root, _, files in os.walk(folder):
-                for file in files:
-                    file_path = os.path.join(root, file)
-                    self.selected_files.append(file_path)
+            self.selected_files = walk_files(folder)
             self.selected_label.config(text=f"Selected: {len(self.selected_files)} files")
     
     def rename_items(self):
@@ -86,64 +97,67 @@ class BatchRenamerGUI:
             messagebox.showerror("Error", "Please enter a base name!")
             return
         
-        try:
-            self.progress["maximum"] = len(self.selected_files)
-            self.root.update()
-            
-            for file_path in self.selected_files:
-                if file_path.lower().endswith('.zip'):
-                    self.rename_files_in_zip(file_path, new_name)
-                else:
-                    self.rename_regular_file(file_path, new_name)
-                
-                self.progress["value"] += 1
-                self.root.update_idletasks()
-            
-            messagebox.showinfo("Success", "All files renamed successfully!")
-            self.safe_quit()
-            
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to rename: {str(e)}")
-            self.safe_quit()
-
-    def rename_regular_file(self, file_path, new_name):
-        """Rename regular files (non-zip)"""
-        path = Path(file_path)
-        new_filename = f"{new_name}{path.suffix}"
-        new_path = path.with_name(new_filename)
-        
-        # Handle duplicates
-        counter = 1
-        while new_path.exists():
-            new_filename = f"{new_name}_{counter}{path.suffix}"
-            new_path = path.with_name(new_filename)
-            counter += 1
-        
-        path.rename(new_path)
-
-    def rename_files_in_zip(self, zip_path, new_name):
-        """Rename files inside ZIP archives"""
-        temp_dir = tempfile.mkdtemp()
-        temp_zip = os.path.join(temp_dir, "temp.zip")
+        if self.is_running:
+            return
         
+        pattern = None
+        if is_rename_pattern(new_name):
+            try:
+                pattern = RenamePattern(new_name, self.name_regex.get().strip())
+            except ValueError as e:
+                messagebox.showerror("Error", f"Invalid name pattern: {e}")
+                return
+        
+        # Archives are rewritten on a worker pool; the window keeps updating meanwhile
+        self.is_running = True
+        self.cancel_event.clear()
+        self.progress["maximum"] = len(self.selected_files)
+        self.progress["value"] = 0
+        self.start_button.config(state=tk.DISABLED)
+        self.cancel_button.config(state=tk.NORMAL)
+        threading.Thread(target=self.rename_worker, args=(list(self.selected_files), new_name, pattern),
+                         daemon=True).start()
+    
+    def rename_worker(self, files, new_name, pattern=None):
+        errors = []
         try:
-            with zipfile.ZipFile(zip_path, 'r') as zin:
-                with zipfile.ZipFile(temp_zip, 'w') as zout:
-                    for item in zin.infolist():
-                        if not item.is_dir():
-                            # Extract file extension
-                            _, ext = os.path.splitext(item.filename)
-                            # Create new filename
-                            new_filename = f"{new_name}{ext}"
-                            # Add file with new name to temp zip
-                            zout.writestr(new_filename, zin.read(item.filename))
-            
-            # Replace original with renamed version
-            os.remove(zip_path)
-            shutil.move(temp_zip, zip_path)
-            
+            errors = rename_batch(files, new_name, pattern, self.cancel_event,
+                                  on_planned=lambda total: self.root.after(0, self.set_progress_total, total),
+                                  on_step=lambda zip_path: self.root.after(0, self.step_progress, zip_path))
+        except Exception as e:
+            errors = [(files[0], f"Renaming stopped: {e}")]
         finally:
-            shutil.rmtree(temp_dir, ignore_errors=True)
+            # Always re-enables the Start button, even when the batch fails
+            self.root.after(0, self.rename_finished, errors)
+    
+    def set_progress_total(self, total):
+        # Files that already have their target name are not renamed, so the bar is sized from the plan
+        self.progress["maximum"] = max(total, 1)
+    
+    def step_progress(self, zip_path=None):
+        self.progress["value"] += 1
+        if zip_path:
+            self.selected_label.config(text=f"Repacked {os.path.basename(zip_path)} "
+                                            f"({int(self.progress['value'])}/{int(self.progress['maximum'])})")
+    
+    def cancel_renaming(self):
+        self.cancel_event.set()
+        self.cancel_button.config(state=tk.DISABLED)
+    
+    def rename_finished(self, errors):
+        self.is_running = False
+        self.start_button.config(state=tk.NORMAL)
+        self.cancel_button.config(state=tk.DISABLED)
+        if self.cancel_event.is_set():
+            messagebox.showinfo("Cancelled", f"Renaming cancelled after {int(self.progress['value'])} of "
+                                             f"{int(self.progress['maximum'])} files. Unfinished archives were left unchanged.")
+            return
+        if errors:
+            details = "\n".join(f"{os.path.basename(path)}: {error}" for path, error in errors[:10])
+            messagebox.showerror("Error", f"Failed to rename {len(errors)} file(s):\n{details}")
+        else:
+            messagebox.showinfo("Success", "All files renamed successfully!")
+        self.safe_quit()
 
     def safe_quit(self):
         """Ensures complete application exit"""
@@ -155,4 +169,5 @@ if __name__ == "__main__":
     root = tk.Tk()
     app = BatchRenamerGUI(root)
     root.protocol("WM_DELETE_WINDOW", app.safe_quit)
+    report_startup(root, "Batch File Renamer")
     root.mainloop()
@@ -1,26 +1,41 @@
 import os
+import sys
 import tkinter as tk
 from tkinter import filedialog, messagebox, ttk
-from PIL import Image
-import piexif
-import piexif.helper
-from datetime import datetime
-import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from microstock_core.batch import FIELD_MODES, MODE_KEEP, MODE_MERGE, MODE_REPLACE, apply_batch_template
+from microstock_core.fileio import atomic_replace, write_temp_file
+from microstock_core.metadata import (build_xmp, load_exif_dict, prefetch_metadata, read_metadata, read_raw_metadata,
+                                      split_keywords, update_exif_fields, write_metadata)
+from microstock_core.scanning import list_folder_images
+from microstock_core.startup import report_startup
+
+PREFETCH_COUNT = 8
 
 class MetadataEditorGUI:
     def __init__(self, root):
         self.root = root
         self.root.title("Image Metadata Editor")
-        self.root.geometry("600x500")
+        self.root.geometry("700x620")
         self.root.resizable(False, False)
         
         self.selected_image = ""
+        self.selected_images = []
+        self.batch_running = False
+        self.browse_list = []
+        self.browse_index = 0
         self.title_var = tk.StringVar()
         self.artist_var = tk.StringVar()
         self.copyright_var = tk.StringVar()
         self.rating_var = tk.IntVar(value=0)
         self.comment_var = tk.StringVar()
         self.subject_var = tk.StringVar()
+        self.mode_vars = {name: tk.StringVar(value=MODE_REPLACE)
+                          for name in ("title", "artist", "copyright", "rating", "comment", "subject")}
+        self.mode_vars["subject"].set(MODE_MERGE)
         
         self.create_widgets()
     
@@ -28,8 +43,16 @@ class MetadataEditorGUI:
         tk.Label(self.root, text="IMAGE METADATA EDITOR", font=('Arial', 14, 'bold')).pack(pady=10)
         self.selected_label = tk.Label(self.root, text="No image selected", wraplength=550)
         self.selected_label.pack(pady=5)
-        tk.Button(self.root, text="🖼️ SELECT IMAGE", command=self.select_image,
-                 bg='#4CAF50', fg='white', height=2, width=20).pack(pady=10)
+        select_frame = tk.Frame(self.root)
+        select_frame.pack(pady=10)
+        tk.Button(select_frame, text="🖼️ SELECT IMAGE", command=self.select_image,
+                 bg='#4CAF50', fg='white', height=2, width=20).pack(side=tk.LEFT, padx=5)
+        tk.Button(select_frame, text="🗂️ SELECT IMAGES (BATCH)", command=self.select_images,
+                 bg='#009688', fg='white', height=2, width=22).pack(side=tk.LEFT, padx=5)
+        tk.Button(select_frame, text="◀", command=lambda: self.browse(-1), height=2, width=3).pack(side=tk.LEFT, padx=2)
+        tk.Button(select_frame, text="▶", command=lambda: self.browse(1), height=2, width=3).pack(side=tk.LEFT, padx=2)
+        self.root.bind("<Prior>", lambda e: self.browse(-1))
+        self.root.bind("<Next>", lambda e: self.browse(1))
         fields_frame = tk.Frame(self.root)
         fields_frame.pack(pady=10, padx=20, fill=tk.X)
         tk.Label(fields_frame, text="Title/Description:").grid(row=0, column=0, sticky='w', pady=5)
@@ -45,12 +68,21 @@ class MetadataEditorGUI:
         tk.Entry(fields_frame, textvariable=self.comment_var, width=50).grid(row=4, column=1, padx=5)
         tk.Label(fields_frame, text="Subject/Keywords:").grid(row=5, column=0, sticky='w', pady=5)
         tk.Entry(fields_frame, textvariable=self.subject_var, width=50).grid(row=5, column=1, padx=5)
+        # Batch mode: per-field merge/replace rules
+        tk.Label(fields_frame, text="Batch rule").grid(row=0, column=2, sticky='w', padx=5)
+        for row, name in enumerate(("title", "artist", "copyright", "rating", "comment", "subject")):
+            values = (MODE_REPLACE, MODE_KEEP) if name == "rating" else FIELD_MODES
+            ttk.Combobox(fields_frame, textvariable=self.mode_vars[name], values=values,
+                         state="readonly", width=9).grid(row=row, column=2, padx=5)
+        tk.Label(self.root, text="Batch tokens: {filename} = file name without extension, {index} = position in selection",
+                 fg='#555555').pack()
         self.progress = ttk.Progressbar(self.root, orient=tk.HORIZONTAL, length=400, mode='determinate')
         self.progress.pack(pady=20)
         btn_frame = tk.Frame(self.root)
         btn_frame.pack(pady=10)
-        tk.Button(btn_frame, text="💾 UPDATE METADATA", command=self.update_metadata,
-                 bg='#2196F3', fg='white', height=2, width=15).pack(side=tk.LEFT, padx=5)
+        self.update_button = tk.Button(btn_frame, text="💾 UPDATE METADATA", command=self.update_metadata,
+                 bg='#2196F3', fg='white', height=2, width=15)
+        self.update_button.pack(side=tk.LEFT, padx=5)
         tk.Button(btn_frame, text="🔴 EXIT", command=self.safe_quit,
                  bg='#f44336', fg='white', height=2, width=15).pack(side=tk.LEFT, padx=5)
     
@@ -58,39 +90,57 @@ class MetadataEditorGUI:
         filetypes = (('Image files', '*.jpg *.jpeg *.png *.tiff *.tif'), ('All files', '*.*'))
         filename = filedialog.askopenfilename(title="Select Image File", filetypes=filetypes)
         if filename:
-            self.selected_image = filename
-            self.selected_label.config(text=f"Selected: {os.path.basename(filename)}")
-            self.load_existing_metadata()
+            folder = os.path.dirname(filename)
+            self.browse_list = list_folder_images(folder)
+            normalized = [os.path.normcase(p) for p in self.browse_list]
+            target = os.path.normcase(os.path.join(folder, os.path.basename(filename)))
+            self.browse_index = normalized.index(target) if target in normalized else 0
+            self.open_image(filename)
+
+    def open_image(self, filename):
+        self.selected_image = filename
+        self.selected_images = []
+        self.selected_label.config(text=f"Selected: {os.path.basename(filename)}")
+        self.load_existing_metadata()
+        # Read ahead so stepping through the folder hits the cache
+        ahead = self.browse_list[self.browse_index + 1:self.browse_index + 1 + PREFETCH_COUNT]
+        if ahead:
+            threading.Thread(target=prefetch_metadata, args=(ahead,), daemon=True).start()
+
+    def browse(self, step):
+        """Show the previous/next image of the selected image's folder"""
+        if not self.browse_list or self.selected_images:
+            return
+        self.browse_index = (self.browse_index + step) % len(self.browse_list)
+        self.open_image(self.browse_list[self.browse_index])
+
+    def select_images(self):
+        filetypes = (('Image files', '*.jpg *.jpeg *.png *.tiff *.tif'), ('All files', '*.*'))
+        filenames = filedialog.askopenfilenames(title="Select Images for Batch Edit", filetypes=filetypes)
+        if filenames:
+            self.selected_image = ""
+            self.selected_images = list(filenames)
+            self.selected_label.config(text=f"Batch: {len(self.selected_images)} images selected")
     
     def load_existing_metadata(self):
         try:
-            img = Image.open(self.selected_image)
-            if 'exif' in img.info:
-                exif_dict = piexif.load(img.info['exif'])
-                self.title_var.set(exif_dict["0th"].get(piexif.ImageIFD.ImageDescription, b'').decode('utf-8', errors='ignore'))
-                self.artist_var.set(exif_dict["0th"].get(piexif.ImageIFD.Artist, b'').decode('utf-8', errors='ignore'))
-                self.copyright_var.set(exif_dict["0th"].get(piexif.ImageIFD.Copyright, b'').decode('utf-8', errors='ignore'))
-                user_comment = exif_dict["Exif"].get(piexif.ExifIFD.UserComment, b'')
-                if user_comment:
-                    try:
-                        self.comment_var.set(piexif.helper.UserComment.load(user_comment))
-                    except:
-                        self.comment_var.set("")
-            # Try to load subject from XMP if available
-            if hasattr(img, 'info') and 'xmp' in img.info:
-                try:
-                    xmp = img.info['xmp'].decode('utf-8')
-                    if '<dc:subject>' in xmp:
-                        start = xmp.find('<dc:subject>') + len('<dc:subject>')
-                        end = xmp.find('</dc:subject>')
-                        self.subject_var.set(xmp[start:end])
-                except:
-                    pass
-            img.close()
+            record = read_metadata(self.selected_image)
+            self.title_var.set(record.title)
+            self.artist_var.set(record.artist)
+            self.copyright_var.set(record.copyright)
+            self.comment_var.set(record.comment)
+            self.rating_var.set(record.rating)
+            self.subject_var.set(", ".join(record.keywords))
         except Exception as e:
             messagebox.showerror("Error", f"Could not load metadata: {str(e)}")
     
     def update_metadata(self):
+        if self.batch_running:
+            messagebox.showwarning("Busy", "A batch update is already running.")
+            return
+        if self.selected_images:
+            self.update_metadata_batch()
+            return
         if not self.selected_image:
             messagebox.showerror("Error", "Please select an image first!")
             return
@@ -99,17 +149,13 @@ class MetadataEditorGUI:
         if not messagebox.askyesno("Confirm", "This will modify the original file. Continue?"):
             return
             
+        temp_path = None
         try:
             self.progress["value"] = 0
             self.root.update()
             
-            # Open the original image
-            img = Image.open(self.selected_image)
-            
             # Load existing EXIF or create new
-            exif_dict = piexif.load(img.info['exif']) if 'exif' in img.info else {
-                "0th": {}, "Exif": {}, "GPS": {}, "1st": {}, "thumbnail": None
-            }
+            exif_dict = load_exif_dict(read_raw_metadata(self.selected_image)[0])
             
             # Update metadata fields
             self.update_exif_data(exif_dict)
@@ -118,7 +164,7 @@ class MetadataEditorGUI:
             xmp = self.create_xmp_metadata()
             
             # Save to temporary file first (safety measure)
-            temp_path = self.save_to_temp_file(img, exif_dict, xmp)
+            temp_path = self.save_to_temp_file(exif_dict, xmp)
             
             # Replace original file
             self.replace_original_file(temp_path)
@@ -130,73 +176,73 @@ class MetadataEditorGUI:
             messagebox.showerror("Error", f"Failed to update metadata: {str(e)}")
             self.cleanup_temp_file(temp_path)
     
+    def update_metadata_batch(self):
+        """Apply the current fields as a template to all selected images"""
+        count = len(self.selected_images)
+        if not messagebox.askyesno("Confirm", f"This will modify {count} original files. Continue?"):
+            return
+        template = {
+            "title": self.title_var.get(),
+            "artist": self.artist_var.get(),
+            "copyright": self.copyright_var.get(),
+            "comment": self.comment_var.get(),
+            "subject": self.subject_var.get(),
+            "rating": self.rating_var.get(),
+        }
+        modes = {name: var.get() for name, var in self.mode_vars.items()}
+        self.batch_running = True
+        self.update_button.config(state="disabled")
+        self.progress["maximum"] = count
+        self.progress["value"] = 0
+        threading.Thread(target=self.run_batch, args=(list(self.selected_images), template, modes),
+                         daemon=True).start()
+
+    def run_batch(self, paths, template, modes):
+        """Worker thread: update files on a thread pool and report progress to the Tk loop"""
+        errors = []
+        workers = min(8, (os.cpu_count() or 1) + 4)
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(apply_batch_template, path, index, template, modes): path
+                       for index, path in enumerate(paths, start=1)}
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                except Exception as e:
+                    errors.append(f"{os.path.basename(futures[future])}: {e}")
+                self.root.after(0, self.progress.step, 1)
+        self.root.after(0, self.on_batch_finished, len(paths), errors)
+
+    def on_batch_finished(self, total, errors):
+        self.batch_running = False
+        self.update_button.config(state="normal")
+        if errors:
+            details = "\n".join(errors[:10])
+            messagebox.showwarning("Batch Finished",
+                                   f"Updated {total - len(errors)} of {total} files.\n\n{details}")
+        else:
+            messagebox.showinfo("Batch Finished", f"Updated {total} files successfully!")
+
     def update_exif_data(self, exif_dict):
         """Update EXIF dictionary with current form values"""
-        if self.title_var.get():
-            exif_dict["0th"][piexif.ImageIFD.ImageDescription] = self.title_var.get().encode('utf-8')
-        if self.artist_var.get():
-            exif_dict["0th"][piexif.ImageIFD.Artist] = self.artist_var.get().encode('utf-8')
-        if self.copyright_var.get():
-            exif_dict["0th"][piexif.ImageIFD.Copyright] = self.copyright_var.get().encode('utf-8')
-        if self.comment_var.get():
-            exif_dict["Exif"][piexif.ExifIFD.UserComment] = piexif.helper.UserComment.dump(
-                self.comment_var.get(), encoding="unicode")
-        
-        # Update timestamps
-        now = datetime.now().strftime("%Y:%m:%d %H:%M:%S")
-        exif_dict["0th"][piexif.ImageIFD.DateTime] = now
-        exif_dict["Exif"][piexif.ExifIFD.DateTimeOriginal] = now
-        exif_dict["Exif"][piexif.ExifIFD.DateTimeDigitized] = now
+        update_exif_fields(exif_dict, {
+            "title": self.title_var.get(),
+            "artist": self.artist_var.get(),
+            "copyright": self.copyright_var.get(),
+            "comment": self.comment_var.get(),
+        })
     
     def create_xmp_metadata(self):
         """Create XMP metadata string with rating and subject"""
-        return f"""<x:xmpmeta xmlns:x="adobe:ns:meta/" x:xmptk="XMP Core 5.4.0">
-    <rdf:RDF xmlns:rdf="http://www.w3.org/1999/02/22-rdf-syntax-ns#">
-        <rdf:Description rdf:about="" xmlns:xmp="http://ns.adobe.com/xap/1.0/">
-            <xmp:Rating>{self.rating_var.get()}</xmp:Rating>
-        </rdf:Description>
-        <rdf:Description rdf:about="" xmlns:dc="http://purl.org/dc/elements/1.1/">
-            <dc:subject>
-                <rdf:Bag>
-                    <rdf:li>{self.subject_var.get()}</rdf:li>
-                </rdf:Bag>
-            </dc:subject>
-        </rdf:Description>
-    </rdf:RDF>
-</x:xmpmeta>""".encode('utf-8')
+        return build_xmp(self.rating_var.get(), split_keywords(self.subject_var.get()))
     
-    def save_to_temp_file(self, img, exif_dict, xmp):
-        """Save image with new metadata to temporary file"""
-        temp_path = os.path.join(tempfile.gettempdir(), f"temp_{os.path.basename(self.selected_image)}")
-        exif_bytes = piexif.dump(exif_dict)
-        
-        if self.selected_image.lower().endswith(('.jpg', '.jpeg')):
-            img.save(temp_path, exif=exif_bytes, quality=95, xmp=xmp)
-        elif self.selected_image.lower().endswith('.png'):
-            img.save(temp_path, exif=exif_bytes, xmp=xmp)
-        else:
-            img.save(temp_path)
-        
-        img.close()
-        return temp_path
+    def save_to_temp_file(self, exif_dict, xmp):
+        """Save image with new metadata to a unique temporary file next to the original"""
+        return write_temp_file(self.selected_image,
+                               lambda f: write_metadata(self.selected_image, f, exif_dict, xmp))
     
     def replace_original_file(self, temp_path):
-        """Replace original file with the temporary file"""
-        # Make backup of original file
-        backup_path = self.selected_image + ".bak"
-        os.replace(self.selected_image, backup_path)
-        
-        try:
-            # Move temp file to original location
-            os.replace(temp_path, self.selected_image)
-            
-            # If everything succeeded, remove backup
-            os.remove(backup_path)
-        except Exception as e:
-            # Restore from backup if something went wrong
-            if os.path.exists(backup_path):
-                os.replace(backup_path, self.selected_image)
-            raise e
+        """Atomically replace original file with the temporary file"""
+        atomic_replace(temp_path, self.selected_image)
     
     def cleanup_temp_file(self, temp_path):
         """Clean up temporary file if it exists"""
@@ -214,4 +260,5 @@ if __name__ == "__main__":
     root = tk.Tk()
     app = MetadataEditorGUI(root)
     root.protocol("WM_DELETE_WINDOW", app.safe_quit)
+    report_startup(root, "Image Metadata Editor")
     root.mainloop()
\ No newline at end of file
@@ -1,56 +1,78 @@
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
+import asyncio
 import os
-import csv
+import queue
 import json
 import time
 import threading
-from PIL import Image, UnidentifiedImageError, ExifTags
-import google.generativeai as genai
-import piexif
-import piexif.helper
-import tempfile # For temporary JPG conversion
-import sys 
-import pathlib
-
-# tkinterdnd2 import
-try:
-    from tkinterdnd2 import DND_FILES, TkinterDnD
-    DND_ENABLED = True
-except ImportError:
-    DND_ENABLED = False
-    print("tkinterdnd2 library not found. Drag and drop will be disabled.")
-    print("Install it with: pip install tkinterdnd2")
+from microstock_core.aio import AsyncBatch
+from microstock_core.conversion import MemoryBudget, convert_many, convert_to_jpeg
+from microstock_core.csvexport import CSV_PROFILES, StreamingCsvWriter, export_items
+from microstock_core.fileio import config_dir
+from microstock_core.importer import ItemIndex, embed_items, read_metadata_rows, resolve_row_path
+from microstock_core.keypool import KeyPool, KeyPoolCancelled, parse_keys
+from microstock_core.keywords import KeywordNormalizer
+from microstock_core.metadata import EMBEDDABLE_EXTENSIONS, embed_stock_metadata
+from microstock_core.pairing import VECTOR_EXTENSIONS, PairingIndex, expand_group_items
+from microstock_core.prefetch import UploadPrefetcher, make_prepare_executor
+from microstock_core.profiles import compile_prompt, load_profiles, save_profiles, schema_config
+from microstock_core.profiling import StageProfiler
+from microstock_core.renaming import apply_renames, plan_renames, title_to_filename
+from microstock_core.responses import METADATA_FIELDS, parse_metadata_json
+from microstock_core.scanning import list_folder_images, probe_image, probe_size
+from microstock_core.startup import report_startup
+from microstock_core.thumbnails import THUMB_SIZE, LruCache, ThumbnailCache
+from microstock_core.usage import UsageTotals, estimate_batch, usage_counts
+
+# Heavy modules are imported on first use so the window shows right away:
+# google.generativeai on Validate/Start, PIL on the first image operation,
+# the search index (sqlite3) and the folder watcher (ctypes) when first opened,
+# tkinterdnd2 just after the window is drawn.
+genai = None
+
+def load_genai():
+    """Imports the Gemini SDK the first time it is needed."""
+    global genai
+    if genai is None:
+        import google.generativeai
+        genai = google.generativeai
+    return genai
+
+def attach_key_client(model, asynchronous, client):
+    """Makes a GenerativeModel send through client (made with its own API key) instead of the SDK's global key.
+    The SDK has no public option for this, so its private per-model client attributes are set here, and only here."""
+    attribute = "_async_client" if asynchronous else "_client"
+    if attribute not in vars(model):
+        raise RuntimeError(f"This google-generativeai version has no GenerativeModel.{attribute}; "
+                           "several API keys need a version that has it, use a single key otherwise.")
+    setattr(model, attribute, client)
+    return model
 
 CONFIG_FILE = "api_config.json"
 
 
 # --- Configuration ---
-APP_NAME = "ImageMetadataGenerator" # Give a name for your application
-
-def get_config_dir():
-    """Finds the user's own configuration directory."""
-    if sys.platform == "win32": # For Windows
-        path = pathlib.Path(os.getenv("APPDATA", "")) / APP_NAME
-    elif sys.platform == "darwin": # For macOS 
-        path = pathlib.Path.home() / "Library" / "Application Support" / APP_NAME
-    else: # For Linux and other Unix-like systems
-        path = pathlib.Path.home() / ".config" / APP_NAME
-    
-    # If the directory does not exist, create it.
-    path.mkdir(parents=True, exist_ok=True)
-    return path
-
-CONFIG_DIR = get_config_dir()
+CONFIG_DIR = config_dir() # The user's own configuration directory (see microstock_core.fileio), created if missing
 CONFIG_FILE = CONFIG_DIR / "api_config.json" # Now CONFIG_FILE is a path object
+INDEX_FILE = CONFIG_DIR / "metadata_index.sqlite" # Full-text index of every completed item
+THUMBNAIL_DIR = CONFIG_DIR / "thumbnails" # Preview thumbnails keyed by path + mtime
+SYNONYMS_FILE = CONFIG_DIR / "keyword_synonyms.txt" # Optional 'variant = keyword' lines merged into the keyword clean-up
+PROFILES_FILE = CONFIG_DIR / "prompt_profiles.json" # User prompt profiles, layered over the built-in ones
+SUPPORTED_EXTENSIONS = (".jpg",".jpeg",".png",".webp",".bmp",".tiff")
+MODEL_NAME = 'gemini-1.5-flash-latest' # Model of the Default profile
+REQUEST_DEADLINE = 90 # Seconds per Gemini request
+MAX_UPLOAD_SIDE = 2048 # Larger images are downsized before upload
+PREFETCH_AHEAD = 8 # Images prepared ahead of the next free request slot
+PREVIEW_CACHE_ITEMS = 300 # PhotoImages kept in memory for the preview pane
+PREVIEW_NEIGHBOURS = 8 # Rows above and below the selection whose previews are made ahead
+CONVERT_MEMORY_MB = 0 # RAM cap for decoded pixels during JPG conversion; 0 = a quarter of physical memory
+TITLE_WORD_RANGE, KEYWORD_ITEM_RANGE, DESC_WORD_RANGE = (5, 20), (5, 50), (25, 150) # Slider limits; profile values are clamped to them
 
 # --- Main Application Class ---
 class ImageMetadataApp:
     def __init__(self, master_root):
-        if DND_ENABLED:
-            self.master = TkinterDnD.Tk()
-        else:
-            self.master = tk.Tk()
+        self.master = tk.Tk()
         
         self.master.title("Image Metadata Generator (Gemini 1.5 Flash - JSON Mode)")
         self.master.geometry("1000x750")
@@ -63,30 +85,67 @@ class ImageMetadataApp:
         self.keyword_items_limit = tk.IntVar(value=40) # Default 10-15 items
         self.desc_word_limit = tk.IntVar(value=100)     # Default 50-100 words
 
+        self.structured_output = tk.BooleanVar(value=True)
+        self.use_schema = True
+        self.parallel_requests = tk.IntVar(value=4) # 1 = one request at a time on a worker thread
+
         self.is_processing = False
         self.is_paused = False
         self.stop_processing_flag = threading.Event()
+        self.async_batch = None
+        self.prefetcher = None
+        self.upload_pool = None # Spawned once on the first batch and reused; watch mode starts a batch per file
+        self.csv_profile = tk.StringVar(value="Default")
+        self.profiles = load_profiles(PROFILES_FILE)
+        self.profile_name = tk.StringVar(value="Default")
+        self.active_profile = "Default" # Profile whose results the table shows
+        self.batch_profile = None # Profile snapshot of the running batch
+        self.key_pool = None # KeyPool over the validated keys; holds one client per key and model
+        self.key_clients = {} # api key -> GenerativeServiceClient, one connection per key
+        self.key_clients_lock = threading.Lock() # Workers may ask for the same key's client at once
+        self.stream_csv = tk.BooleanVar(value=False)
+        self.live_csv = None # StreamingCsvWriter while a batch streams rows
+        self.search_index = None # MetadataIndex, opened on first use
+        self.watcher = None # FolderWatcher while watch mode is on
+        self.ui_events = queue.Queue() # (callback, args) posted by the asyncio thread for the Tk loop
         self.file_data = []
+        self.profiler = StageProfiler()
+        self.usage = UsageTotals(MODEL_NAME)
+        self.keyword_normalizer = KeywordNormalizer.from_file(SYNONYMS_FILE)
+        self.thumbnails = ThumbnailCache(THUMBNAIL_DIR)
+        self.preview_images = LruCache(PREVIEW_CACHE_ITEMS) # filepath -> PhotoImage
+        self.convert_budget = MemoryBudget(CONVERT_MEMORY_MB * 1024 * 1024) # Shared by every JPG conversion
         
-        self.gemini_model = None
 
         self.create_widgets()
         
-        if DND_ENABLED:
-            self.tree.drop_target_register(DND_FILES)
-            self.tree.dnd_bind('<<Drop>>', self.handle_drop)
+        self.master.after(200, self.enable_drag_and_drop)
         
         self.master.protocol("WM_DELETE_WINDOW", self.on_closing)
 
-    def _create_prompt(self):
-        # Using exact word/item limits from sliders
-        return f"""Analyze this image and generate metadata in JSON format with these fields:
-- "title": A descriptive title (exactly {self.title_word_limit.get()} words)
-- "keywords": Comma-separated relevant keywords (exactly {self.keyword_items_limit.get()} items)
-- "description": A detailed description (exactly {self.desc_word_limit.get()} words)
+    def enable_drag_and_drop(self):
+        """Loads tkinterdnd2 into the running window and makes the table a drop target."""
+        try:
+            from tkinterdnd2 import DND_FILES, TkinterDnD
+        except ImportError:
+            print("tkinterdnd2 library not found. Drag and drop will be disabled.")
+            print("Install it with: pip install tkinterdnd2")
+            return
+        try:
+            getattr(TkinterDnD, "require", TkinterDnD._require)(self.master)
+            self.tree.drop_target_register(DND_FILES)
+            self.tree.dnd_bind('<<Drop>>', self.handle_drop)
+        except (tk.TclError, AttributeError) as e:
+            print(f"Drag and drop unavailable: {e}")
 
-Return *only* the JSON object itself, without any surrounding text or markdown, like this:
-{{"title": "...", "keywords": "...", "description": "..."}}"""
+    def _current_profile(self):
+        """The selected profile with the sliders' limits and the schema checkbox applied."""
+        return self.profiles[self.profile_name.get()]._replace(
+            title_words=self.title_word_limit.get(), keyword_items=self.keyword_items_limit.get(),
+            description_words=self.desc_word_limit.get(), structured=bool(self.structured_output.get()))
+    def _create_prompt(self, fields=METADATA_FIELDS, profile=None):
+        # Compiled once per profile and field set; fields narrows the request when re-asking
+        return compile_prompt(profile or self._current_profile(), tuple(fields))
 
 
     def on_closing(self):
@@ -94,17 +153,22 @@ Return *only* the JSON object itself, without any surrounding text or markdown,
         if self.is_processing:
             if messagebox.askyesno("Exit", "Processing ongoing. Exit and stop?"):
                 self.stop_processing_flag.set()
+                if self.async_batch: self.async_batch.cancel()
                 if hasattr(self, 'processing_thread') and self.processing_thread.is_alive():
                     self.processing_thread.join(timeout=2)
-                self.master.destroy()
+                self.shutdown_background_work(); self.master.destroy()
             else: return
-        else: self.master.destroy()
+        else: self.shutdown_background_work(); self.master.destroy()
+    def shutdown_background_work(self):
+        if self.watcher: self.watcher.stop(); self.watcher = None
+        self.close_search_index(); self.thumbnails.close()
+        if self.upload_pool: self.upload_pool.shutdown(wait=False, cancel_futures=True); self.upload_pool = None
 
     def create_widgets(self):
         # --- API Key Section --- (No changes)
         api_frame = ttk.LabelFrame(self.master, text="API Configuration", padding=10)
         api_frame.pack(fill="x", padx=10, pady=5)
-        ttk.Label(api_frame, text="Api Key:").grid(row=0, column=0, padx=5, pady=5, sticky="w")
+        ttk.Label(api_frame, text="Api Key(s):").grid(row=0, column=0, padx=5, pady=5, sticky="w")
         self.api_key_entry = ttk.Entry(api_frame, textvariable=self.api_key, width=40, show="*")
         self.api_key_entry.grid(row=0, column=1, padx=5, pady=5, sticky="ew")
         ttk.Button(api_frame, text="Validate", command=self.validate_api).grid(row=0, column=2, padx=5, pady=5)
@@ -116,23 +180,35 @@ Return *only* the JSON object itself, without any surrounding text or markdown,
         limits_frame.pack(fill="x", padx=10, pady=5)
 
         ttk.Label(limits_frame, text="Title Words:").grid(row=0, column=0, padx=5, pady=5, sticky="w")
-        self.title_slider = ttk.Scale(limits_frame, from_=5, to=20, orient="horizontal", variable=self.title_word_limit, command=lambda v: self.title_limit_val_label.config(text=f"{int(float(v))}"))
+        self.title_slider = ttk.Scale(limits_frame, from_=TITLE_WORD_RANGE[0], to=TITLE_WORD_RANGE[1], orient="horizontal", variable=self.title_word_limit, command=lambda v: self.title_limit_val_label.config(text=f"{int(float(v))}"))
         self.title_slider.grid(row=0, column=1, padx=5, pady=5, sticky="ew")
         self.title_limit_val_label = ttk.Label(limits_frame, text=str(self.title_word_limit.get()), width=3)
         self.title_limit_val_label.grid(row=0, column=2, padx=5, pady=5)
 
         ttk.Label(limits_frame, text="Keyword Items:").grid(row=1, column=0, padx=5, pady=5, sticky="w")
-        self.keyword_slider = ttk.Scale(limits_frame, from_=5, to=25, orient="horizontal", variable=self.keyword_items_limit, command=lambda v: self.keyword_limit_val_label.config(text=f"{int(float(v))}"))
+        self.keyword_slider = ttk.Scale(limits_frame, from_=KEYWORD_ITEM_RANGE[0], to=KEYWORD_ITEM_RANGE[1], orient="horizontal", variable=self.keyword_items_limit, command=lambda v: self.keyword_limit_val_label.config(text=f"{int(float(v))}"))
         self.keyword_slider.grid(row=1, column=1, padx=5, pady=5, sticky="ew")
         self.keyword_limit_val_label = ttk.Label(limits_frame, text=str(self.keyword_items_limit.get()), width=3)
         self.keyword_limit_val_label.grid(row=1, column=2, padx=5, pady=5)
 
         ttk.Label(limits_frame, text="Desc Words:").grid(row=2, column=0, padx=5, pady=5, sticky="w")
-        self.desc_slider = ttk.Scale(limits_frame, from_=25, to=150, orient="horizontal", variable=self.desc_word_limit, command=lambda v: self.desc_limit_val_label.config(text=f"{int(float(v))}"))
+        self.desc_slider = ttk.Scale(limits_frame, from_=DESC_WORD_RANGE[0], to=DESC_WORD_RANGE[1], orient="horizontal", variable=self.desc_word_limit, command=lambda v: self.desc_limit_val_label.config(text=f"{int(float(v))}"))
         self.desc_slider.grid(row=2, column=1, padx=5, pady=5, sticky="ew")
         self.desc_limit_val_label = ttk.Label(limits_frame, text=str(self.desc_word_limit.get()), width=3)
         self.desc_limit_val_label.grid(row=2, column=2, padx=5, pady=5)
         
+        ttk.Checkbutton(limits_frame, text="Structured output (JSON schema)", variable=self.structured_output).grid(row=3, column=0, columnspan=2, padx=5, sticky="w")
+        parallel_frame = ttk.Frame(limits_frame)
+        parallel_frame.grid(row=3, column=1, columnspan=2, padx=5, sticky="e")
+        ttk.Label(parallel_frame, text="Parallel Requests:").pack(side="left")
+        ttk.Spinbox(parallel_frame, from_=1, to=256, textvariable=self.parallel_requests, width=5).pack(side="left", padx=5)
+        profile_frame = ttk.Frame(limits_frame)
+        profile_frame.grid(row=4, column=0, columnspan=3, padx=5, pady=(5,0), sticky="w")
+        ttk.Label(profile_frame, text="Profile:").pack(side="left")
+        self.profile_combo = ttk.Combobox(profile_frame, textvariable=self.profile_name, values=list(self.profiles), state="readonly", width=20)
+        self.profile_combo.pack(side="left", padx=5)
+        self.profile_combo.bind("<<ComboboxSelected>>", self.select_profile)
+        ttk.Button(profile_frame, text="Save Profile...", command=self.save_profile).pack(side="left", padx=2)
         limits_frame.grid_columnconfigure(1, weight=1)
 
         # --- Input & Processing Controls Section --- (No changes)
@@ -143,23 +219,43 @@ Return *only* the JSON object itself, without any surrounding text or markdown,
         ttk.Label(input_controls_frame, text="Input:").pack(side="left", padx=(0,5))
         ttk.Button(input_controls_frame, text="Select Image(s)", command=self.select_image).pack(side="left", padx=2)
         ttk.Button(input_controls_frame, text="Select Folder", command=self.select_folder).pack(side="left", padx=2)
-        ttk.Button(input_controls_frame, text="Start", command=self.start_processing).pack(side="left", padx=(10,2))
+        self.watch_button = ttk.Button(input_controls_frame, text="Watch Folder", command=self.toggle_watch)
+        self.watch_button.pack(side="left", padx=2)
+        ttk.Button(input_controls_frame, text="Estimate", command=self.show_estimate).pack(side="left", padx=(10,2))
+        ttk.Button(input_controls_frame, text="Start", command=self.start_processing).pack(side="left", padx=2)
         self.pause_button = ttk.Button(input_controls_frame, text="Pause", command=self.pause_processing, state="disabled")
         self.pause_button.pack(side="left", padx=2)
+        self.stop_button = ttk.Button(input_controls_frame, text="Stop", command=self.stop_processing, state="disabled")
+        self.stop_button.pack(side="left", padx=2)
         ttk.Button(input_controls_frame, text="Retry Failed", command=self.retry_failed).pack(side="left", padx=2)
         ttk.Button(input_controls_frame, text="Clear List", command=self.clear_table).pack(side="left", padx=(10,2))
         action_buttons_frame = ttk.LabelFrame(controls_frame_outer, text="File Actions", padding=10)
         action_buttons_frame.pack(side="left", padx=(10,0))
+        ttk.Combobox(action_buttons_frame, textvariable=self.csv_profile, values=list(CSV_PROFILES), state="readonly", width=12).pack(side="left", padx=2)
         ttk.Button(action_buttons_frame, text="Export CSV", command=self.export_csv).pack(side="left", padx=2)
+        ttk.Checkbutton(action_buttons_frame, text="Stream", variable=self.stream_csv).pack(side="left", padx=2)
+        ttk.Button(action_buttons_frame, text="Import", command=self.import_metadata).pack(side="left", padx=2)
         ttk.Button(action_buttons_frame, text="Rename File(s)", command=self.rename_files).pack(side="left", padx=2)
         ttk.Button(action_buttons_frame, text="Embed Metadata", command=self.embed_metadata).pack(side="left", padx=2)
         ttk.Button(action_buttons_frame, text="Export As JPG", command=self.export_as_jpg).pack(side="left", padx=2)
 
+        # --- Live Throughput Panel ---
+        throughput_frame = ttk.LabelFrame(self.master, text="Throughput", padding=5)
+        throughput_frame.pack(fill="x", padx=10, pady=(5,0))
+        self.throughput_label = ttk.Label(throughput_frame, text="Idle", anchor="w")
+        self.throughput_label.pack(side="left", fill="x", expand=True)
+        ttk.Button(throughput_frame, text="Export Trace", command=self.export_trace).pack(side="right", padx=2)
+        ttk.Button(throughput_frame, text="Search Index", command=self.open_search_panel).pack(side="right", padx=2)
+
         # --- File Data Table Section --- (No changes)
         table_frame = ttk.LabelFrame(self.master, text="Files", padding=10)
         table_frame.pack(fill="both", expand=True, padx=10, pady=5)
         self.select_all_var = tk.BooleanVar()
         ttk.Checkbutton(table_frame, text="Select All / Deselect All", variable=self.select_all_var, command=self.toggle_select_all).pack(anchor="w")
+        preview_frame = ttk.Frame(table_frame, width=THUMB_SIZE + 10)
+        preview_frame.pack(side="right", fill="y", padx=(5,0)); preview_frame.pack_propagate(False)
+        self.preview_label = ttk.Label(preview_frame, text="No preview", anchor="n", compound="top", wraplength=THUMB_SIZE, justify="center")
+        self.preview_label.pack(fill="both", expand=True)
         columns = ("select", "filename", "title", "keyword", "description", "status")
         self.tree = ttk.Treeview(table_frame, columns=columns, show="headings")
         self.tree.heading("select", text="Sel"); self.tree.heading("filename", text="Filename")
@@ -173,6 +269,7 @@ Return *only* the JSON object itself, without any surrounding text or markdown,
         self.tree.configure(yscrollcommand=vsb.set, xscrollcommand=hsb.set)
         self.tree.pack(fill="both", expand=True)
         self.tree.bind("<ButtonRelease-1>", self.on_tree_click)
+        self.tree.bind("<<TreeviewSelect>>", self.show_preview)
         self.status_bar = ttk.Label(self.master, text="Ready", relief=tk.SUNKEN, anchor=tk.W)
         self.status_bar.pack(side=tk.BOTTOM, fill=tk.X, padx=0, pady=0)
 
@@ -199,56 +296,111 @@ Return *only* the JSON object itself, without any surrounding text or markdown,
             # It is better to show the full path in the error message
             messagebox.showerror("API Key", f"There was a problem saving the API key. ({CONFIG_FILE}):\n{e}")
 
-
-
-
-
-
-
     def validate_api(self):
-        key = self.api_key.get()
-        if not key: messagebox.showwarning("API Validation", "API Key empty."); self.gemini_model=None; return False
-        try:
-            self.status_bar.config(text="Validating API Key..."); self.master.update_idletasks()
-            genai.configure(api_key=key)
-            model_to_test = genai.GenerativeModel('gemini-1.5-flash-latest')
-            model_to_test.generate_content("test connection", request_options={'timeout': 10})
-            self.gemini_model = model_to_test
-            messagebox.showinfo("API Validation", "API Key valid."); self.status_bar.config(text="API Key Validated.")
-            return True
-        except Exception as e:
-            self.gemini_model=None; messagebox.showerror("API Validation", f"API Key invalid/network error: {e}")
+        """Tests every key in the field (comma separated, optional '=requests per minute') and pools the valid ones."""
+        keys = parse_keys(self.api_key.get())
+        if not keys: messagebox.showwarning("API Validation", "API Key empty."); self.key_pool=None; return False
+        self.status_bar.config(text=f"Validating {len(keys)} API Key(s)..."); self.master.update_idletasks()
+        genai = load_genai(); genai.configure(api_key=keys[0][0]); self.key_clients = {} # Connections of replaced keys are dropped
+        model_name = self._current_profile().model
+        valid, failed = [], []
+        for key, rpm in keys:
+            try: self._make_client(key, model_name).generate_content("test connection", request_options={'timeout': 10}); valid.append((key, rpm))
+            except Exception as e: failed.append(f"...{key[-4:]}: {e}")
+        if not valid:
+            self.key_pool=None; messagebox.showerror("API Validation", "API Key invalid/network error:\n" + "\n".join(failed))
             self.status_bar.config(text="API Key Validation Failed."); return False
+        self.key_pool = KeyPool(valid, self._make_client)
+        if failed: messagebox.showwarning("API Validation", f"{len(valid)} key(s) valid; not used:\n" + "\n".join(failed))
+        else: messagebox.showinfo("API Validation", "API Key valid." if len(valid) == 1 else f"All {len(valid)} API keys valid.")
+        self.status_bar.config(text=f"{len(valid)} API Key(s) Validated."); return True
+
+    def _make_client(self, key, model_name, asynchronous=False):
+        """GenerativeModel that sends with its own key; sync calls share one connection per key."""
+        genai = load_genai()
+        from google.ai import generativelanguage as glm
+        model = genai.GenerativeModel(model_name)
+        # The SDK keeps one global key and creates these clients from it when they are unset, so each key gets its own here
+        if asynchronous: return attach_key_client(model, True, glm.GenerativeServiceAsyncClient(client_options={"api_key": key})) # Bound to the batch's event loop
+        with self.key_clients_lock:
+            if key not in self.key_clients: self.key_clients[key] = glm.GenerativeServiceClient(client_options={"api_key": key})
+            return attach_key_client(model, False, self.key_clients[key])
+    def select_profile(self, event=None):
+        """Loads the profile's limits and shows each item's results for it; items without results for it go back to Pending."""
+        if self.is_processing:
+            self.profile_name.set(self.active_profile); messagebox.showwarning("Profile", "Cannot switch profiles while processing."); return
+        profile = self.profiles[self.profile_name.get()]
+        for var, label, value, (low, high) in ((self.title_word_limit, self.title_limit_val_label, profile.title_words, TITLE_WORD_RANGE),
+                                               (self.keyword_items_limit, self.keyword_limit_val_label, profile.keyword_items, KEYWORD_ITEM_RANGE),
+                                               (self.desc_word_limit, self.desc_limit_val_label, profile.description_words, DESC_WORD_RANGE)):
+            value = min(max(value, low), high); var.set(value); label.config(text=str(value))
+        self.structured_output.set(profile.structured)
+        previous, self.active_profile = self.active_profile, profile.name
+        if previous == profile.name: return
+        restored = pending = 0
+        for item in self.file_data:
+            results = item.setdefault("results", {})
+            # What the table shows belongs to the previous profile (imported metadata included)
+            if item["status"] == "Completed": results[previous] = {k: item[k] for k in ("title", "keyword", "description")}
+            if profile.name in results: item.update(results[profile.name], status="Completed"); restored += 1
+            elif item["status"] == "Completed": item.update(title="", keyword="", description="", status="Pending"); pending += 1
+            else: continue
+            self.update_treeview_item(item)
+        self.status_bar.config(text=f"Profile '{profile.name}': {restored} item(s) restored from earlier results, {pending} to process.")
+    def save_profile(self):
+        """Saves the current model, template, limits and schema setting under a name."""
+        from tkinter import simpledialog
+        name = simpledialog.askstring("Save Profile", "Profile name:", initialvalue=self.profile_name.get(), parent=self.master)
+        if not name or not name.strip(): return
+        name = name.strip(); self.profiles[name] = self._current_profile()._replace(name=name)
+        try: save_profiles(PROFILES_FILE, self.profiles)
+        except Exception as e: messagebox.showerror("Save Profile", f"There was a problem saving the profiles. ({PROFILES_FILE}):\n{e}"); return
+        self.profile_combo.config(values=list(self.profiles))
+        self.profile_name.set(name); self.active_profile = name # The table's results now belong to the saved profile
+        self.status_bar.config(text=f"Profile '{name}' saved.")
 
     # --- File Handling & Table Methods --- (No changes)
+    @staticmethod
+    def _display_name(item):
+        """File name plus the extensions of its companion vectors, e.g. 'kite.jpg (+EPS)'."""
+        if not item.get("companions"): return item["filename"]
+        return f"{item['filename']} (+{', '.join(os.path.splitext(c)[1][1:].upper() for c in item['companions'])})"
+    def _new_item(self, abs_fp, companions=()):
+        """Adds a row to the table and returns its item dict."""
+        item = {"selected":False,"filepath":abs_fp,"filename":os.path.basename(abs_fp),"companions":list(companions),
+                "title":"","keyword":"","description":"","status":"Pending"}
+        item["id"] = self.tree.insert("", "end", values=("☐",self._display_name(item),"","","","Pending"))
+        self.file_data.append(item)
+        return item
+    def _add_paths(self, filepaths):
+        """Adds new images (vectors are swapped for their JPG preview and kept as its companions); returns the new items."""
+        known = {i['filepath'] for i in self.file_data}
+        existing = [os.path.abspath(fp.strip('{}')) for fp in filepaths if os.path.isfile(fp.strip('{}'))]
+        pairs, orphans = PairingIndex().pair(existing) # One listing per directory
+        for path in orphans: print(f"Skipping vector without a JPG/PNG preview: {path}")
+        added = []
+        for abs_fp, companions in pairs:
+            if abs_fp in known: continue
+            if not probe_image(abs_fp): print(f"Skipping unidentified: {abs_fp}"); continue
+            added.append(self._new_item(abs_fp, companions)); known.add(abs_fp)
+        return added
     def add_files_to_list(self, filepaths):
-        new_added=0
-        for fp_raw in filepaths:
-            fp = fp_raw.strip('{}')
-            if not os.path.isfile(fp): continue
-            abs_fp = os.path.abspath(fp)
-            if not any(i['filepath'] == abs_fp for i in self.file_data):
-                try:
-                    with Image.open(fp): pass
-                    item_id = self.tree.insert("", "end", values=("☐",os.path.basename(fp),"","","","Pending"))
-                    self.file_data.append({"id":item_id,"selected":False,"filepath":abs_fp,"filename":os.path.basename(fp),
-                                           "title":"","keyword":"","description":"","status":"Pending"})
-                    new_added+=1
-                except UnidentifiedImageError: print(f"Skipping unidentified: {fp}")
-                except Exception as e: print(f"Error adding {fp}: {e}")
-        if new_added > 0: self.status_bar.config(text=f"Added {new_added} file(s).")
+        added = self._add_paths(filepaths)
+        if added:
+            paired = sum(1 for i in added if i["companions"])
+            self.status_bar.config(text=f"Added {len(added)} file(s)" + (f", {paired} with vector companions." if paired else "."))
         self.update_select_all_checkbox_state()
     def update_treeview_item(self, item_data):
         if self.tree.exists(item_data["id"]):
-            self.tree.item(item_data["id"], values=("☑" if item_data["selected"] else "☐", item_data["filename"],
+            self.tree.item(item_data["id"], values=("☑" if item_data["selected"] else "☐", self._display_name(item_data),
                                                     item_data["title"],item_data["keyword"],item_data["description"],item_data["status"]))
     def select_image(self):
-        fps = filedialog.askopenfilenames(title="Select Images", filetypes=(("Images", "*.jpg *.jpeg *.png *.webp *.bmp *.tiff"),("All","*.*")))
+        fps = filedialog.askopenfilenames(title="Select Images", filetypes=(("Images", "*.jpg *.jpeg *.png *.webp *.bmp *.tiff *.eps *.ai *.svg"),("All","*.*")))
         if fps: self.add_files_to_list(fps)
     def select_folder(self):
         f_path = filedialog.askdirectory(title="Select Folder")
         if f_path:
-            fps = [os.path.join(f_path,f) for f in os.listdir(f_path) if f.lower().endswith((".jpg",".jpeg",".png",".webp",".bmp",".tiff"))]
+            fps = list_folder_images(f_path, SUPPORTED_EXTENSIONS)
             if fps: self.add_files_to_list(fps)
             else: messagebox.showinfo("Select Folder", "No supported images found.")
     def handle_drop(self, event):
@@ -257,7 +409,7 @@ Return *only* the JSON object itself, without any surrounding text or markdown,
             import re; paths = re.findall(r'\{([^}]+)\}|([^{}\s]+)', fps_str)
             fps = [p[0] if p[0] else p[1] for p in paths]
         else: fps = fps_str.split()
-        valid_fps = [fp for fp in fps if os.path.isfile(fp.strip('{}')) and fp.lower().endswith((".jpg",".jpeg",".png",".webp",".bmp",".tiff"))]
+        valid_fps = [fp for fp in fps if os.path.isfile(fp.strip('{}')) and fp.lower().endswith(SUPPORTED_EXTENSIONS + VECTOR_EXTENSIONS)]
         if valid_fps: self.add_files_to_list(valid_fps)
         elif fps: messagebox.showwarning("Drag & Drop", "No valid images dropped.")
     def on_tree_click(self, event):
@@ -280,68 +432,394 @@ Return *only* the JSON object itself, without any surrounding text or markdown,
         if messagebox.askyesno("Confirm Clear", "Clear all items?"):
             for i in self.tree.get_children(): self.tree.delete(i)
             self.file_data.clear(); self.select_all_var.set(False)
+            self.preview_label.config(image="", text="No preview"); self.preview_images.clear()
             self.status_bar.config(text="List cleared.")
+    def show_preview(self, event=None):
+        """Shows the focused row's thumbnail and makes the neighbours' thumbnails ahead of scrolling."""
+        iid = self.tree.focus()
+        item = next((i for i in self.file_data if i["id"] == iid), None)
+        if item is None: return
+        photo = self.preview_images.get(item["filepath"])
+        if photo: self.preview_label.config(image=photo, text=item["filename"])
+        else: self.preview_label.config(image="", text=f"Loading {item['filename']}...")
+        rows, before, after = [iid], iid, iid
+        for _ in range(PREVIEW_NEIGHBOURS):
+            after = after and self.tree.next(after); before = before and self.tree.prev(before)
+            rows += [r for r in (after, before) if r]
+        paths = {i["id"]: i["filepath"] for i in self.file_data if i["id"] in rows}
+        for row in rows:
+            path = paths.get(row)
+            if path and path not in self.preview_images:
+                self.thumbnails.submit(path, lambda p, image, error: self.master.after(0, self._thumbnail_ready, p, image, error))
+    def _thumbnail_ready(self, path, image, error):
+        from PIL import ImageTk
+        if image is not None: self.preview_images.put(path, ImageTk.PhotoImage(image))
+        item = next((i for i in self.file_data if i["id"] == self.tree.focus()), None)
+        if item is None or item["filepath"] != path: return
+        if image is None: self.preview_label.config(image="", text=f"No preview: {error}")
+        else: self.preview_label.config(image=self.preview_images.get(path), text=item["filename"])
 
     # --- Processing Methods ---
-    def start_processing(self): # (No changes)
-        if self.is_processing: messagebox.showinfo("Processing", "Already in progress."); return
-        if not self.api_key.get(): messagebox.showerror("API Error", "Enter API key."); return
-        if not self.gemini_model and not self.validate_api(): messagebox.showerror("API Error", "Validate API key."); return
+    def _items_to_process(self):
         to_process = [i for i in self.file_data if i["selected"] and i["status"] not in ["Completed","Processing..."]]
         if not to_process:
             to_process = [i for i in self.file_data if i["status"] not in ["Completed","Processing..."]]
-            if not to_process: messagebox.showinfo("Processing", "No items to process."); return
+        return to_process
+    def show_estimate(self):
+        """Shows the predicted tokens, cost and time for the items Start would process."""
+        to_process = self._items_to_process()
+        if not to_process: messagebox.showinfo("Estimate", "No items to process."); return
+        sizes = []
+        for item in to_process:
+            size = probe_size(item["filepath"]) # Header-only read, cheap enough for the Tk thread
+            if not size or not max(size): print(f"Estimate: could not read size of {item['filename']}"); continue
+            scale = min(1.0, MAX_UPLOAD_SIDE / max(size)) # Uploads are downsized to MAX_UPLOAD_SIDE
+            sizes.append((round(size[0] * scale), round(size[1] * scale)))
+        api_stage = self.profiler.snapshot()["stages"].get("api")
+        seconds_per_image = api_stage["avg_ms"] / 1000 if api_stage else None
+        profile = self._current_profile()
+        limits = (profile.title_words, profile.keyword_items, profile.description_words)
+        est = estimate_batch(sizes, self._create_prompt(profile=profile), limits, profile.model, seconds_per_image)
+        minutes, seconds = divmod(int(est["seconds"]), 60)
+        messagebox.showinfo("Estimate", f"Images: {est['images']}\n"
+                                        f"Input tokens: ~{est['input_tokens']:,}\n"
+                                        f"Output tokens: ~{est['output_tokens']:,}\n"
+                                        f"Cost: ~${est['cost_usd']:.4f} ({profile.model})\n"
+                                        f"Time: ~{minutes}m {seconds:02d}s"
+                                        + ("" if seconds_per_image else " (no timing data yet, assuming defaults)"))
+    def start_processing(self):
+        if self.is_processing: messagebox.showinfo("Processing", "Already in progress."); return
+        if not self.api_key.get(): messagebox.showerror("API Error", "Enter API key."); return
+        if not self.key_pool and not self.validate_api(): messagebox.showerror("API Error", "Validate API key."); return
+        to_process = self._items_to_process()
+        if not to_process: messagebox.showinfo("Processing", "No items to process."); return
+        if self.stream_csv.get() and not self._open_live_csv(): return
+        self._run_batch(to_process)
+    def _run_batch(self, to_process):
         self.is_processing=True; self.is_paused=False; self.stop_processing_flag.clear()
-        self.pause_button.config(text="Pause",state="normal"); self.status_bar.config(text="Processing...")
+        self.pause_button.config(text="Pause",state="normal"); self.stop_button.config(state="normal")
+        self.status_bar.config(text="Processing...")
+        # One profile snapshot per batch: its prompt and schema are reused for every request, its model's clients by the key pool
+        self.batch_profile = self._current_profile(); self.use_schema = self.batch_profile.structured
+        self.usage.model_name = self.batch_profile.model
+        self.profiler.reset(len(to_process)); self.usage.reset(); self.refresh_throughput()
+        try: parallel = max(1, self.parallel_requests.get())
+        except tk.TclError: parallel = 1
+        if parallel > 1:
+            # All requests run on one asyncio loop; results come back through ui_events
+            prompt = self._create_prompt(profile=self.batch_profile)
+            self._start_prefetch(to_process, parallel + PREFETCH_AHEAD)
+            self.async_batch = AsyncBatch(parallel, REQUEST_DEADLINE)
+            self.processing_thread = self.async_batch.start(to_process, lambda item: self._process_item_async(item, prompt),
+                                                            on_finished=self._async_batch_finished)
+            self._drain_ui_events()
+            return
         self.processing_thread = threading.Thread(target=self.process_files_thread, args=(to_process,),daemon=True)
         self.processing_thread.start()
-    def _generate_gemini_content_json(self, pil_image, prompt_text): # (No changes)
-        if self.stop_processing_flag.is_set(): return None, "Stopped"
+    def toggle_watch(self):
+        """Watch mode: new images dropped into a folder are added, tagged and embedded without any clicks."""
+        if self.watcher:
+            self.watcher.stop(); self.watcher = None
+            self.watch_button.config(text="Watch Folder"); self.status_bar.config(text="Stopped watching."); return
+        if not self.api_key.get(): messagebox.showerror("API Error", "Enter API key."); return
+        if not self.key_pool and not self.validate_api(): messagebox.showerror("API Error", "Validate API key."); return
+        folder = filedialog.askdirectory(title="Watch Folder")
+        if not folder: return
+        from microstock_core.watch import FolderWatcher
+        try: self.watcher = FolderWatcher(folder, lambda paths: self.master.after(0, self._ingest_watched, paths), SUPPORTED_EXTENSIONS).start()
+        except OSError as e: messagebox.showerror("Watch Folder", f"Cannot watch {folder}: {e}"); return
+        self.watch_button.config(text="Stop Watching"); self.status_bar.config(text=f"Watching {folder} for new images...")
+    def _ingest_watched(self, paths):
+        added = self._add_paths(paths) # Skips paths already listed: our own renames/conversions land in the watched folder too
+        for item in added: item["watched"] = True
+        if added: self.status_bar.config(text=f"Watch folder: {len(added)} new image(s)."); self._start_watched()
+    def _start_watched(self):
+        """Starts a batch for the watched items still pending; called again when each batch finishes."""
+        if self.is_processing or not self.watcher: return
+        to_process = [i for i in self.file_data if i.get("watched") and i["status"] == "Pending"]
+        if to_process: self._run_batch(to_process)
+    def _embed_watched(self, item_data):
+        if item_data.get("watched") and item_data["status"] == "Completed" and item_data["filepath"].lower().endswith(EMBEDDABLE_EXTENSIONS):
+            self._embed_single_file_metadata(item_data, item_data["filepath"])
+    def _open_live_csv(self):
+        """Asks where to stream rows of completed items during the batch. Returns False to cancel the start."""
+        filepath = filedialog.asksaveasfilename(defaultextension=".csv", title="Stream CSV To",
+                                                filetypes=[("CSV files", "*.csv"), ("All files", "*.*")])
+        if not filepath: return False
+        try: self.live_csv = StreamingCsvWriter(filepath, CSV_PROFILES[self.csv_profile.get()])
+        except Exception as e: messagebox.showerror("Stream CSV", f"Cannot open {filepath}: {e}"); return False
+        return True
+    def _stream_row(self, item_data):
+        if self.live_csv and item_data["status"] == "Completed":
+            try:
+                for row in expand_group_items([item_data]): self.live_csv.write(row)
+            except Exception as e: print(f"Stream CSV error: {e}")
+    def _get_search_index(self):
+        if self.search_index is None:
+            from microstock_core.search import MetadataIndex
+            try: self.search_index = MetadataIndex(str(INDEX_FILE))
+            except Exception as e: print(f"Metadata index unavailable: {e}"); self.search_index = False
+        return self.search_index
+    def _index_row(self, item_data):
+        """Queues a completed item for the search index; hashing and writing happen on the index's writer thread."""
+        if item_data["status"] == "Completed" and self._get_search_index(): self.search_index.queue(item_data)
+    def close_search_index(self):
+        if self.search_index: self.search_index.close(); self.search_index = None
+    def stop_processing(self):
+        """Stops the batch; with parallel requests, calls in flight are cancelled right away."""
+        if not self.is_processing: return
+        self.stop_processing_flag.set(); self.is_paused = False
+        if self.async_batch: self.async_batch.cancel()
+        if self.prefetcher: self.prefetcher.close()
+        self.stop_button.config(state="disabled"); self.status_bar.config(text="Stopping...")
+    def _start_prefetch(self, items, ahead):
+        """Starts decoding/downsizing/encoding upload payloads on a process pool, at most `ahead` at a time."""
+        if self.upload_pool is None: self.upload_pool = make_prepare_executor()
+        self.prefetcher = UploadPrefetcher([(i["id"], i["filepath"]) for i in items], ahead=ahead, max_side=MAX_UPLOAD_SIDE,
+                                           executor=self.upload_pool)
+    def _take_prepared(self, item_data):
+        """Future of the prepared upload part for an item (records the worker's encode time)."""
+        future = self.prefetcher.take(item_data["id"])
+        def record(f):
+            if not f.cancelled() and f.exception() is None: self.profiler.record("encode", f.result()[1], item_data["filename"])
+        future.add_done_callback(record)
+        return future
+    def _async_batch_finished(self):
+        if self.prefetcher: self.prefetcher.close()
+        self._post(self.on_processing_finished)
+    def _post(self, callback, *args):
+        """Queues a UI update from the asyncio thread; _drain_ui_events runs it on the Tk loop."""
+        self.ui_events.put((callback, args))
+    def _drain_ui_events(self):
+        while True:
+            try: callback, args = self.ui_events.get_nowait()
+            except queue.Empty: break
+            callback(*args)
+        if self.is_processing or not self.ui_events.empty(): self.master.after(50, self._drain_ui_events)
+    def _generate_gemini_content_json(self, image_part, prompt_text, fields=METADATA_FIELDS):
+        """Returns (json_text, status, (input_tokens, output_tokens))."""
+        if self.stop_processing_flag.is_set(): return None, "Stopped", (0, 0)
         try:
-            response = self.gemini_model.generate_content([prompt_text, pil_image], request_options={'timeout':90})
-            return response.text.strip() if response and response.text else None, "Completed"
+            kwargs = {"generation_config": schema_config(tuple(fields))} if self.use_schema else {}
+            # The pool sends on the key with the most quota left and moves the request to another key on 429
+            def send(**kw): return self.key_pool.call(lambda model: model.generate_content([prompt_text, image_part], request_options={'timeout':REQUEST_DEADLINE}, **kw),
+                                                      self.batch_profile.model, self.stop_processing_flag)
+            try:
+                response = send(**kwargs)
+            except Exception as e:
+                # Older SDKs/models reject response_schema; fall back to prompt-only JSON for the rest of the batch
+                if not kwargs or "response_" not in str(e): raise
+                print(f"Structured output not supported, falling back to plain JSON prompt: {e}")
+                self.use_schema = False
+                response = send()
+            return response.text.strip() if response and response.text else None, "Completed", usage_counts(response)
+        except KeyPoolCancelled:
+            return None, "Stopped", (0, 0)
         except Exception as e:
-            print(f"Gemini API error: {e}")
-            if "API key not valid" in str(e) or "API_KEY_INVALID" in str(e): return None, "API Key Error"
-            return None, f"API Error: {str(e)[:50]}"
-    def process_files_thread(self, items_to_process): # (No changes)
-        prompt = self._create_prompt()
-        for item_data in items_to_process:
-            if self.stop_processing_flag.is_set(): item_data["status"]="Stopped"; self.master.after(0,self.update_treeview_item,item_data); break
-            while self.is_paused:
-                if self.stop_processing_flag.is_set(): break
-                time.sleep(0.5)
-            if self.stop_processing_flag.is_set(): item_data["status"]="Stopped"; self.master.after(0,self.update_treeview_item,item_data); break
-            item_data["status"]="Processing..."; self.master.after(0,self.update_treeview_item,item_data)
+            return self._api_error(e)
+    async def _generate_gemini_content_json_async(self, image_part, prompt_text, fields=METADATA_FIELDS):
+        """Async twin of _generate_gemini_content_json, bounded by the batch's per-request deadline."""
+        options = {'timeout': REQUEST_DEADLINE}
+        try:
+            kwargs = {"generation_config": schema_config(tuple(fields))} if self.use_schema else {}
+            def send(**kw): return self.key_pool.call_async(
+                lambda model: self.async_batch.request(model.generate_content_async([prompt_text, image_part], request_options=options, **kw)),
+                self.batch_profile.model)
             try:
-                with Image.open(item_data['filepath']) as pil_image:
-                    img_to_send = pil_image
-                    if pil_image.mode not in ['RGB','RGBA']: img_to_send = pil_image.convert('RGB')
-                    json_text, api_status = self._generate_gemini_content_json(img_to_send, prompt)
-                if api_status == "API Key Error":
-                    item_data["status"]=api_status; self.master.after(0,self.update_treeview_item,item_data)
-                    self.master.after(0,lambda: messagebox.showerror("API Error","API Key error. Processing stopped."))
-                    break
-                if api_status != "Completed" or not json_text:
-                    item_data["status"] = api_status if api_status != "Completed" else "No Response"
-                    self.master.after(0,self.update_treeview_item,item_data); continue
+                response = await send(**kwargs)
+            except Exception as e:
+                if not kwargs or "response_" not in str(e): raise
+                print(f"Structured output not supported, falling back to plain JSON prompt: {e}")
+                self.use_schema = False
+                response = await send()
+            return response.text.strip() if response and response.text else None, "Completed", usage_counts(response)
+        except asyncio.TimeoutError:
+            return None, "Timed Out", (0, 0)
+        except Exception as e:
+            return self._api_error(e)
+    def _api_error(self, e):
+        print(f"Gemini API error: {e}")
+        if "API key not valid" in str(e) or "API_KEY_INVALID" in str(e): return None, "API Key Error", (0, 0)
+        return None, f"API Error: {str(e)[:50]}", (0, 0)
+    def _record_usage(self, item_data, tokens):
+        if not any(tokens): return
+        item_data["input_tokens"] = item_data.get("input_tokens", 0) + tokens[0]
+        item_data["output_tokens"] = item_data.get("output_tokens", 0) + tokens[1]
+        item_data["cost_usd"] = round(item_data.get("cost_usd", 0) + self.usage.add(*tokens), 6)
+    def _request_metadata(self, image_part, prompt, item_data):
+        """Asks for all fields, repairs the answer locally and re-asks once for fields still missing.
+        Returns (metadata, missing_fields, status)."""
+        name = item_data["filename"]
+        for key in ("input_tokens", "output_tokens", "cost_usd"): item_data.pop(key, None)
+        # Covers upload + model time; the image part is already encoded
+        with self.profiler.stage("api", name): json_text, api_status, tokens = self._generate_gemini_content_json(image_part, prompt)
+        self._record_usage(item_data, tokens)
+        if api_status != "Completed": return {}, list(METADATA_FIELDS), api_status
+        if not json_text: return {}, list(METADATA_FIELDS), "No Response"
+        with self.profiler.stage("parse", name): metadata, missing = parse_metadata_json(json_text)
+        if missing and not self.stop_processing_flag.is_set():
+            print(f"Incomplete JSON for {name}, asking again for: {', '.join(missing)}")
+            self.profiler.count("reasks")
+            with self.profiler.stage("reask", name):
+                json_text, api_status, tokens = self._generate_gemini_content_json(image_part, self._create_prompt(missing, self.batch_profile), missing)
+            self._record_usage(item_data, tokens)
+            if api_status == "Completed" and json_text:
+                extra, missing = parse_metadata_json(json_text, missing)
+                metadata.update(extra)
+        return metadata, missing, "Completed"
+    async def _request_metadata_async(self, image_part, prompt, item_data):
+        """Async twin of _request_metadata."""
+        name = item_data["filename"]
+        for key in ("input_tokens", "output_tokens", "cost_usd"): item_data.pop(key, None)
+        with self.profiler.stage("api", name): json_text, api_status, tokens = await self._generate_gemini_content_json_async(image_part, prompt)
+        self._record_usage(item_data, tokens)
+        if api_status != "Completed": return {}, list(METADATA_FIELDS), api_status
+        if not json_text: return {}, list(METADATA_FIELDS), "No Response"
+        with self.profiler.stage("parse", name): metadata, missing = parse_metadata_json(json_text)
+        if missing:
+            print(f"Incomplete JSON for {name}, asking again for: {', '.join(missing)}")
+            self.profiler.count("reasks")
+            with self.profiler.stage("reask", name):
+                json_text, api_status, tokens = await self._generate_gemini_content_json_async(image_part, self._create_prompt(missing, self.batch_profile), missing)
+            self._record_usage(item_data, tokens)
+            if api_status == "Completed" and json_text:
+                extra, missing = parse_metadata_json(json_text, missing)
+                metadata.update(extra)
+        return metadata, missing, "Completed"
+    def _apply_result(self, item_data, metadata, missing):
+        # Case variants, plurals and synonyms are folded and the list is cut to the batch profile's item count
+        # (runs on worker/async threads, so the snapshot is used instead of the Tk slider variable)
+        item_data["title"]=metadata.get("title",""); item_data["keyword"]=self.keyword_normalizer.clean_text(metadata.get("keywords",""), self.batch_profile.keyword_items)
+        item_data["description"]=metadata.get("description","")
+        item_data["status"]="Completed" if not missing else "Bad JSON"
+        if not missing: item_data.setdefault("results", {})[self.batch_profile.name] = {k: item_data[k] for k in ("title", "keyword", "description")}
+        if missing: self.profiler.count("bad_json")
+    async def _process_item_async(self, item_data, prompt):
+        """One image on the asyncio path: read/encode off-loop, then request metadata."""
+        from PIL import UnidentifiedImageError
+        name = item_data["filename"]
+        while self.is_paused and not self.stop_processing_flag.is_set(): await asyncio.sleep(0.2)
+        if self.stop_processing_flag.is_set(): return
+        item_data["status"]="Processing..."; self._post(self.update_treeview_item, item_data)
+        try:
+            # Prepared on the process pool ahead of time; this only waits if the pipeline fell behind
+            with self.profiler.stage("prefetch_wait", name): image_part, _ = await asyncio.wrap_future(self._take_prepared(item_data))
+            metadata, missing, api_status = await self._request_metadata_async(image_part, prompt, item_data)
+            if api_status == "API Key Error":
+                item_data["status"]=api_status; self.async_batch.cancel()
+                self._post(messagebox.showerror, "API Error", "API Key error. Processing stopped.")
+            elif api_status != "Completed": item_data["status"]=api_status; self.profiler.count("api_errors")
+            else: self._apply_result(item_data, metadata, missing)
+        except asyncio.CancelledError:
+            item_data["status"]="Stopped"; self._post(self.update_treeview_item, item_data); raise
+        except UnidentifiedImageError: item_data["status"]="Bad Image"; self.profiler.count("bad_images")
+        except Exception as e: print(f"Processing Error: {e}"); item_data["status"]=f"Error: {str(e)[:30]}"; self.profiler.count("errors")
+        if item_data.get("watched"): await asyncio.to_thread(self._embed_watched, item_data)
+        self._stream_row(item_data); self._index_row(item_data)
+        self.profiler.item_done(name, item_data["status"])
+        self._post(self.update_treeview_item, item_data)
+    def process_files_thread(self, items_to_process):
+        from PIL import UnidentifiedImageError
+        prompt = self._create_prompt(profile=self.batch_profile)
+        stage = self.profiler.stage
+        self._start_prefetch(items_to_process, PREFETCH_AHEAD)
+        try:
+            for item_data in items_to_process:
+                if self.stop_processing_flag.is_set(): item_data["status"]="Stopped"; self.master.after(0,self.update_treeview_item,item_data); break
+                if self.is_paused:
+                    with stage("paused"):
+                        while self.is_paused:
+                            if self.stop_processing_flag.is_set(): break
+                            time.sleep(0.5)
+                if self.stop_processing_flag.is_set(): item_data["status"]="Stopped"; self.master.after(0,self.update_treeview_item,item_data); break
+                item_data["status"]="Processing..."; self.master.after(0,self.update_treeview_item,item_data)
+                name = item_data["filename"]
                 try:
-                    if json_text.startswith("```json"): json_text = json_text.strip("```json").strip("`").strip()
-                    metadata = json.loads(json_text)
-                    item_data["title"]=metadata.get("title",""); item_data["keyword"]=metadata.get("keywords","")
-                    item_data["description"]=metadata.get("description",""); item_data["status"]="Completed"
-                except json.JSONDecodeError as je: print(f"JSON Decode Error: {je} for {json_text}"); item_data["status"]="Bad JSON"
-                except Exception as ep: print(f"Parse Error: {ep}"); item_data["status"]="Parse Error"
-            except UnidentifiedImageError: item_data["status"]="Bad Image"
-            except Exception as e: print(f"Processing Error: {e}"); item_data["status"]=f"Error: {str(e)[:30]}"
-            self.master.after(0,self.update_treeview_item,item_data)
+                    # The next images are decoded, downsized and encoded on a process pool while this one uploads
+                    with stage("prefetch_wait", name): image_part, _ = self._take_prepared(item_data).result()
+                    metadata, missing, api_status = self._request_metadata(image_part, prompt, item_data)
+                    if api_status == "API Key Error":
+                        item_data["status"]=api_status; self.master.after(0,self.update_treeview_item,item_data)
+                        self.master.after(0,lambda: messagebox.showerror("API Error","API Key error. Processing stopped."))
+                        break
+                    if api_status != "Completed":
+                        item_data["status"] = api_status
+                        self.profiler.count("api_errors"); self.profiler.item_done(name, item_data["status"])
+                        self.master.after(0,self.update_treeview_item,item_data); continue
+                    self._apply_result(item_data, metadata, missing)
+                except UnidentifiedImageError: item_data["status"]="Bad Image"; self.profiler.count("bad_images")
+                except Exception as e: print(f"Processing Error: {e}"); item_data["status"]=f"Error: {str(e)[:30]}"; self.profiler.count("errors")
+                self._embed_watched(item_data); self._stream_row(item_data); self._index_row(item_data)
+                self.profiler.item_done(name, item_data["status"])
+                self.master.after(0,self.update_treeview_item,item_data)
+        finally:
+            self.prefetcher.close()
         self.master.after(0,self.on_processing_finished)
     def on_processing_finished(self): # (No changes)
         self.is_processing=False; self.is_paused=False; self.pause_button.config(text="Pause",state="disabled")
+        self.stop_button.config(state="disabled"); self.async_batch = None
+        if self.live_csv:
+            self.live_csv.close(); print(f"Streamed {self.live_csv.rows} CSV row(s)"); self.live_csv = None
         api_err = any(i["status"]=="API Key Error" for i in self.file_data)
         if self.stop_processing_flag.is_set(): self.status_bar.config(text="Processing stopped by user.")
         elif api_err: self.status_bar.config(text="Processing stopped due to API Key Error.")
         else: self.status_bar.config(text="Processing finished.")
+        if self.usage.requests: self.status_bar.config(text=f"{self.status_bar.cget('text')} {self.usage.summary()}")
+        if self.key_pool and len(self.key_pool) > 1: print(f"Requests per key: {self.key_pool.summary()}")
+        self.refresh_throughput()
+        if self.watcher and not self.stop_processing_flag.is_set(): self.master.after(0, self._start_watched) # Images that arrived during the batch
+    def refresh_throughput(self):
+        """Updates the live throughput panel (and token totals) once a second while a batch runs."""
+        self.throughput_label.config(text=self.profiler.summary_line())
+        if self.is_processing:
+            if not self.is_paused and not self.stop_processing_flag.is_set(): self.status_bar.config(text=f"Processing... {self.usage.summary()}")
+            self.master.after(1000, self.refresh_throughput)
+    def export_trace(self):
+        filepath = filedialog.asksaveasfilename(defaultextension=".jsonl", title="Save Timing Trace As",
+                                                filetypes=[("JSON Lines", "*.jsonl"), ("All files", "*.*")])
+        if not filepath: return
+        try:
+            count = self.profiler.export_trace(filepath)
+            self.status_bar.config(text=f"Trace exported ({count} events): {os.path.basename(filepath)}")
+        except Exception as e:
+            messagebox.showerror("Export Trace", f"Error exporting trace: {e}")
+    def open_search_panel(self):
+        """Keyword/phrase/prefix search over every item indexed so far, with keyword frequencies for the matches."""
+        if not self._get_search_index(): messagebox.showerror("Search Index", "The metadata index could not be opened."); return
+        from microstock_core.search import SEARCH_MODES
+        win = tk.Toplevel(self.master); win.title("Search Metadata Index"); win.geometry("900x550")
+        query, mode = tk.StringVar(), tk.StringVar(value=SEARCH_MODES[0])
+        bar = ttk.Frame(win, padding=5); bar.pack(fill="x")
+        entry = ttk.Entry(bar, textvariable=query); entry.pack(side="left", fill="x", expand=True, padx=2)
+        ttk.Combobox(bar, textvariable=mode, values=SEARCH_MODES, state="readonly", width=8).pack(side="left", padx=2)
+        results = ttk.Treeview(win, columns=("filename", "title", "keywords"), show="headings")
+        for col, width in (("filename", 200), ("title", 300), ("keywords", 350)):
+            results.heading(col, text=col.capitalize()); results.column(col, width=width, anchor="w")
+        results.pack(fill="both", expand=True, padx=5)
+        stats_label = ttk.Label(win, text="", anchor="w", wraplength=880, justify="left"); stats_label.pack(fill="x", padx=5, pady=5)
+        found, top = {}, []
+        def show(rows, stats, elapsed):
+            results.delete(*results.get_children()); found.clear(); top[:] = [k for k, _ in stats]
+            for row in rows: found[results.insert("", "end", values=(os.path.basename(row["path"]), row["title"], row["keywords"]))] = row
+            stats_label.config(text=f"{len(rows)} result(s) in {elapsed*1000:.0f} ms of {self.search_index.count():,} indexed. "
+                                    f"Top keywords: " + ", ".join(f"{k} ({n})" for k, n in stats))
+        def search(event=None):
+            text, how = query.get().strip(), mode.get()
+            def worker():
+                started = time.perf_counter()
+                try:
+                    rows = self.search_index.search(text, how, 500) if text else []
+                    stats = self.search_index.keyword_stats(text or None, how, 30)
+                except Exception as e:
+                    error = f"Search error: {e}"; self.master.after(0, lambda: stats_label.config(text=error)); return
+                self.master.after(0, lambda: win.winfo_exists() and show(rows, stats, time.perf_counter() - started))
+            threading.Thread(target=worker, daemon=True).start()
+        def copy(text):
+            if text: win.clipboard_clear(); win.clipboard_append(text); self.status_bar.config(text="Keywords copied to clipboard.")
+        ttk.Button(bar, text="Search", command=search).pack(side="left", padx=2)
+        ttk.Button(bar, text="Copy Keywords", command=lambda: copy(", ".join(found[i]["keywords"] for i in results.selection()))).pack(side="left", padx=2)
+        ttk.Button(bar, text="Copy Top Keywords", command=lambda: copy(", ".join(top))).pack(side="left", padx=2)
+        entry.bind("<Return>", search); entry.focus_set(); search()
     def pause_processing(self): # (No changes)
         if not self.is_processing: return
         self.is_paused = not self.is_paused; self.pause_button.config(text="Resume" if self.is_paused else "Pause")
@@ -387,44 +865,71 @@ Return *only* the JSON object itself, without any surrounding text or markdown,
         if not filepath: return
 
         try:
-            # Define fieldnames to match the keys in your item_data dictionary more directly
-            fieldnames = ['filename', 'filepath', 'title', 'keyword', 'description', 'status']
-            with open(filepath, 'w', newline='', encoding='utf-8') as csvfile:
-                writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-                writer.writeheader()
-                for item_data in items_to_export:
-                    # Create a row dictionary ensuring all fieldnames are present
-                    row_to_write = {fn: item_data.get(fn, "") for fn in fieldnames}
-                    writer.writerow(row_to_write)
-            messagebox.showinfo("Export CSV", f"Data exported to {filepath}")
+            # Columns, delimiter and keyword limits come from the selected agency profile
+            profile_name = self.csv_profile.get()
+            export_items(filepath, expand_group_items(items_to_export), CSV_PROFILES[profile_name]) # One row per file of each pair
+            messagebox.showinfo("Export CSV", f"Data exported to {filepath} ({profile_name} format)")
             self.status_bar.config(text=f"CSV exported: {os.path.basename(filepath)}")
         except Exception as e:
             messagebox.showerror("Export CSV", f"Error exporting CSV: {e}")
 
+    def import_metadata(self):
+        """Loads edited titles/keywords/descriptions from CSV or JSONL and offers to embed them right away."""
+        if self.is_processing: messagebox.showwarning("Import", "Cannot import while processing."); return
+        filepath = filedialog.askopenfilename(title="Import Metadata",
+                                              filetypes=[("CSV or JSON Lines", "*.csv *.jsonl *.ndjson"), ("All files", "*.*")])
+        if not filepath: return
+        try: rows = read_metadata_rows(filepath)
+        except Exception as e: messagebox.showerror("Import", f"Could not read {os.path.basename(filepath)}: {e}"); return
+        index = ItemIndex(self.file_data)
+        base_dir = os.path.dirname(filepath)
+        updated, added, unmatched = {}, 0, 0
+        for row in rows:
+            if not any(key in row for key in ("title", "keyword", "description")): continue
+            item = index.find(row)
+            if item is None:
+                # Not in the table yet: add it if the row points at an existing image
+                abs_fp = resolve_row_path(row, base_dir)
+                if not abs_fp or not probe_image(abs_fp): unmatched += 1; continue
+                item = self._new_item(abs_fp); index.register(item); added += 1
+            for key in ("title", "keyword", "description"):
+                if key in row: item[key] = row[key]
+            item["status"] = "Completed"
+            updated[item["id"]] = item
+        for item in updated.values(): self.update_treeview_item(item); self._index_row(item)
+        self.update_select_all_checkbox_state()
+        summary = f"Imported {len(updated)} item(s) ({added} added to the list, {unmatched} row(s) not matched)."
+        self.status_bar.config(text=summary)
+        if updated and messagebox.askyesno("Import", f"{summary}\n\nEmbed the imported metadata into the files now?"):
+            self.embed_in_background(list(updated.values()))
+    def embed_in_background(self, items):
+        """Embeds metadata into many JPG/TIFF files on a thread pool, reporting progress in the status bar."""
+        targets = [i for i in items if i["filepath"].lower().endswith(EMBEDDABLE_EXTENSIONS)]
+        skipped = len(items) - len(targets)
+        if not targets: messagebox.showinfo("Embed Metadata", "None of the items are JPG/TIFF files."); return
+        progress = {"done": 0}; lock = threading.Lock()
+        def on_done(item, error):
+            with lock:
+                progress["done"] += 1; done = progress["done"]
+            if done % 200 == 0: self.master.after(0, lambda: self.status_bar.config(text=f"Embedding... {done}/{len(targets)}"))
+        def worker():
+            with self.profiler.stage("embed_bulk"): errors = embed_items(targets, on_done=on_done)
+            self.master.after(0, self._embed_finished, len(targets), errors, skipped)
+        self.status_bar.config(text=f"Embedding... 0/{len(targets)}")
+        threading.Thread(target=worker, daemon=True).start()
+    def _embed_finished(self, total, errors, skipped):
+        for item, error in errors[:20]: print(f"Error embedding metadata for {item['filename']}: {error}")
+        self.status_bar.config(text=f"Embedded metadata in {total - len(errors)} files.")
+        messagebox.showinfo("Embed Metadata", f"Embedded metadata in {total - len(errors)} file(s). "
+                                              f"{len(errors)} errors, {skipped} non-JPG/TIFF skipped.")
+
     def _convert_to_jpg_and_update_item(self, item_data, target_filepath=None, delete_original_png=False):
         """Converts an image to JPG. Updates item_data if successful. Returns new JPG path or None."""
         original_filepath = item_data['filepath']
         try:
-            img = Image.open(original_filepath)
-            if img.mode == 'RGBA' or img.mode == 'P': # P mode for paletted PNGs often has transparency
-                img = img.convert('RGB') # Convert to RGB, removing alpha
-
-            if target_filepath is None: # If no target, create temp
-                # Create a temporary JPG file
-                temp_jpg_file = tempfile.NamedTemporaryFile(suffix=".jpg", delete=False)
-                new_jpg_path = temp_jpg_file.name
-                temp_jpg_file.close() # Close it so Pillow can write to it
-            else:
-                new_jpg_path = target_filepath
-            
-            # Preserve EXIF if any from original (though PNGs usually don't have much)
-            exif_data = img.info.get('exif')
-            if exif_data:
-                img.save(new_jpg_path, "JPEG", quality=90, optimize=True, exif=exif_data)
-            else:
-                img.save(new_jpg_path, "JPEG", quality=90, optimize=True)
-            img.close()
-
+            # With no target, convert_to_jpeg writes a temporary JPG
+            with self.profiler.stage("convert_jpg", item_data['filename']):
+                new_jpg_path = convert_to_jpeg(original_filepath, target_filepath, budget=self.convert_budget)
             print(f"Converted '{original_filepath}' to '{new_jpg_path}'")
             
             # If a permanent conversion, update item_data
@@ -447,29 +952,16 @@ Return *only* the JSON object itself, without any surrounding text or markdown,
 
     def _embed_single_file_metadata(self, item_data, filepath_to_embed):
         """Helper to embed metadata into a single file (assumed JPG/TIFF)."""
+        from PIL import UnidentifiedImageError
         try:
             if not filepath_to_embed.lower().endswith((".jpg", ".jpeg", ".tiff")):
                 print(f"Skipping metadata for {os.path.basename(filepath_to_embed)}: Not JPG/TIFF.")
                 return False
 
-            # Reload image to ensure we have the latest version, especially after conversion
-            with Image.open(filepath_to_embed) as img:
-                try:
-                    exif_dict = piexif.load(img.info.get('exif', b''))
-                except piexif.InvalidImageDataError:
-                    exif_dict = {"0th": {}, "Exif": {}, "GPS": {}, "1st": {}, "thumbnail": None}
-
-                if item_data.get("title"):
-                    exif_dict["0th"][piexif.ImageIFD.XPTitle] = item_data["title"].encode('utf-16le')
-                if item_data.get("keyword"):
-                    exif_dict["0th"][piexif.ImageIFD.XPKeywords] = item_data["keyword"].replace(",",";").strip().encode('utf-16le')
-                if item_data.get("description"):
-                    exif_dict["0th"][piexif.ImageIFD.ImageDescription] = item_data["description"].encode('utf-8')
-                    exif_dict["Exif"][piexif.ExifIFD.UserComment] = piexif.helper.dump_comment(item_data["description"])
-                
-                exif_bytes = piexif.dump(exif_dict)
-                # Save in place
-                img.save(filepath_to_embed, exif=exif_bytes) 
+            # Only the metadata segments are rewritten, JPG image data is kept as is
+            with self.profiler.stage("embed", os.path.basename(filepath_to_embed)):
+                embed_stock_metadata(filepath_to_embed, item_data.get("title", ""),
+                                     item_data.get("keyword", ""), item_data.get("description", ""))
             print(f"Embedded metadata for {os.path.basename(filepath_to_embed)}")
             return True
         except UnidentifiedImageError:
@@ -535,14 +1027,12 @@ Return *only* the JSON object itself, without any surrounding text or markdown,
 
 
     def export_as_jpg(self):
+        """Asks for each JPG's location, then converts in the background under the shared memory budget and embeds completed metadata."""
         items_to_export = self.get_selected_items_data(require_selected=True) # Don't require completed
         if not items_to_export: return
 
-        exported_and_embedded_count = 0
-        error_count = 0
-
+        targets, taken, renamed, cancelled = {}, set(), [], 0
         for item_data in items_to_export:
-            original_filepath = item_data['filepath']
             original_basename, _ = os.path.splitext(item_data['filename'])
             
             # Ask where to save the new JPG
@@ -553,75 +1043,86 @@ Return *only* the JSON object itself, without any surrounding text or markdown,
                 title=f"Export '{item_data['filename']}' as JPG"
             )
             if not new_jpg_save_path: # User cancelled
-                error_count +=1
-                continue
-
-            # Convert (or copy if already JPG) to the new path
-            converted_jpg_path = None
-            if original_filepath.lower() == new_jpg_save_path.lower() and original_filepath.lower().endswith((".jpg", ".jpeg")):
-                 # If saving to the same JPG path, we just need to ensure it's RGB and then embed
-                try:
-                    img = Image.open(original_filepath)
-                    if img.mode != 'RGB': img = img.convert('RGB')
-                    # Save it to ensure it's a clean JPG copy if any conversion happened
-                    img.save(new_jpg_save_path, "JPEG", quality=90, optimize=True)
-                    img.close()
-                    converted_jpg_path = new_jpg_save_path
-                except Exception as e:
-                    print(f"Error preparing existing JPG {original_filepath}: {e}")
-                    error_count+=1
-                    continue
-            else:
-                # Use the conversion helper, it will save to new_jpg_save_path
-                converted_jpg_path = self._convert_to_jpg_and_update_item(item_data, target_filepath=new_jpg_save_path, delete_original_png=False) # Don't update item_data here yet
-
-            if not converted_jpg_path:
-                error_count += 1
+                cancelled +=1
                 continue
-
-            # If metadata is available and generated, embed it into the new JPG
+            dst = os.path.abspath(new_jpg_save_path)
+            if os.path.normcase(dst) in taken:
+                # Two sources chose the same JPG (a.png and a.tif): number this one, as plan_renames does
+                stem, ext = os.path.splitext(dst); counter = 1
+                while os.path.normcase(f"{stem}_{counter}{ext}") in taken or os.path.exists(f"{stem}_{counter}{ext}"): counter += 1
+                dst = f"{stem}_{counter}{ext}"; renamed.append(f"{item_data['filename']} -> {os.path.basename(dst)}")
+            taken.add(os.path.normcase(dst)); targets[dst] = item_data
+        if not targets:
+            messagebox.showwarning("Export as JPG", "No files were exported due to errors or cancellations."); return
+
+        # JPGs are copied as they are; other images are decoded side by side only while their estimated size fits the budget
+        exported = []
+        def on_done(src, dst, error):
+            if error: print(f"Error converting {src} to JPG: {error}"); return
+            print(f"Converted '{src}' to '{dst}'")
+            item_data = targets[dst]
             if item_data["status"] == "Completed":
-                if self._embed_single_file_metadata(item_data, converted_jpg_path):
-                    print(f"Metadata embedded into exported JPG: {os.path.basename(converted_jpg_path)}")
-                else:
-                    print(f"Could not embed metadata into exported JPG: {os.path.basename(converted_jpg_path)}")
-                    # Continue with export, but note metadata embedding failure
-            
-            exported_and_embedded_count += 1
-            # If the export target is different from the item's current path,
-            # we don't update the item_data in the table, as it's an "export as" operation.
-            # If the user selected to overwrite an existing item, the conversion would have handled it.
-
-        if exported_and_embedded_count > 0:
-            messagebox.showinfo("Export as JPG", f"Successfully exported {exported_and_embedded_count} file(s) as JPG (metadata embedded where applicable).")
-            self.status_bar.config(text=f"Exported {exported_and_embedded_count} file(s) as JPG.")
-        elif error_count > 0 and exported_and_embedded_count == 0:
-             messagebox.showwarning("Export as JPG", "No files were exported due to errors or cancellations.")
-
-
-    def rename_files(self): # (No changes from previous version)
+                if self._embed_single_file_metadata(item_data, dst): print(f"Metadata embedded into exported JPG: {os.path.basename(dst)}")
+                else: print(f"Could not embed metadata into exported JPG: {os.path.basename(dst)}") # Export still counts
+            exported.append((item_data, dst))
+        def worker():
+            with self.profiler.stage("convert_jpg_bulk"):
+                failures = convert_many([(item["filepath"], dst) for dst, item in targets.items()], self.convert_budget, on_done=on_done)
+            self.master.after(0, self._export_finished, exported, len(failures) + cancelled, renamed)
+        self.status_bar.config(text=f"Exporting {len(targets)} file(s) as JPG...")
+        threading.Thread(target=worker, daemon=True).start()
+    def _export_finished(self, exported, error_count, renamed=()):
+        for item_data, dst in exported:
+            item_data['filepath'] = dst; item_data['filename'] = os.path.basename(dst); self.update_treeview_item(item_data)
+        if exported:
+            note = "\n\nSaved under a new name because another file was exported to the same JPG:\n" + "\n".join(renamed[:10]) if renamed else ""
+            messagebox.showinfo("Export as JPG", f"Successfully exported {len(exported)} file(s) as JPG (metadata embedded where applicable).{note}")
+            self.status_bar.config(text=f"Exported {len(exported)} file(s) as JPG.")
+        elif error_count > 0:
+            messagebox.showwarning("Export as JPG", "No files were exported due to errors or cancellations.")
+
+
+    def rename_files(self):
+        """Renames the items (and their companion vectors) after their titles in one background pass; name clashes get _1, _2, ... suffixes."""
+        if self.is_processing: messagebox.showwarning("Rename Files", "Cannot rename while processing."); return
         items_to_rename = self.get_selected_items_data(require_completed=True, require_selected=True)
         if not items_to_rename: return
-        renamed_count, error_count = 0,0
+        by_path, renames, skipped = {}, [], 0
         for item in items_to_rename:
-            if item["title"]:
-                _, ext = os.path.splitext(item["filepath"])
-                dir_n = os.path.dirname(item["filepath"])
-                new_fn_base = "".join(c if c.isalnum() or c in " _-" else "_" for c in item["title"]).strip()[:100]
-                if not new_fn_base: error_count+=1; continue
-                new_fp = os.path.join(dir_n, new_fn_base + ext)
-                if item["filepath"].lower() == new_fp.lower(): continue
-                if os.path.exists(new_fp) and not messagebox.askyesno("Exists",f"'{os.path.basename(new_fp)}' exists. Overwrite?"):
-                    error_count+=1; continue
-                try:
-                    os.rename(item["filepath"], new_fp)
-                    item["filepath"],item["filename"] = new_fp,os.path.basename(new_fp)
-                    self.update_treeview_item(item); renamed_count+=1
-                except Exception as e: messagebox.showerror("Rename Error",f"Could not rename {item['filename']}:\n{e}"); error_count+=1
-        messagebox.showinfo("Rename Files", f"Renamed {renamed_count} files. {error_count} errors/skips.")
-        self.status_bar.config(text=f"Renamed {renamed_count} files.")
+            base = title_to_filename(item["title"]) if item["title"] else ""
+            if not base: skipped+=1; continue
+            group = [item["filepath"]] + item.get("companions", [])
+            for path in group: by_path[path] = item
+            renames.append((group, base)) # A JPG and its EPS always get the same name
+        try: plan = plan_renames(renames)
+        except OSError as e: messagebox.showerror("Rename Files", f"Could not list the folder: {e}"); return
+        suffixed = sum(1 for path, new_path in plan if path == by_path[path]["filepath"] and os.path.splitext(os.path.basename(new_path))[0] != title_to_filename(by_path[path]["title"]))
+        def on_done(path, new_path, error):
+            if error is not None: return
+            item = by_path[path]
+            if path == item["filepath"]: item["filepath"], item["filename"] = new_path, os.path.basename(new_path)
+            else: item["companions"] = [new_path if c == path else c for c in item["companions"]]
+        def worker():
+            renamed, errors = 0, []
+            try:
+                with self.profiler.stage("rename_bulk"): renamed, errors = apply_renames(plan, on_done)
+            except Exception as e: errors = [(plan[0][0], str(e))]
+            finally:
+                items = list({id(by_path[p]): by_path[p] for p, _ in plan}.values())
+                self.master.after(0, self._rename_finished, items, renamed, errors, skipped, suffixed)
+        self.is_processing = True # Blocks batches, imports and a second rename until the files have their new names
+        self.status_bar.config(text=f"Renaming {len(plan)} file(s)...")
+        threading.Thread(target=worker, daemon=True).start()
+    def _rename_finished(self, items, renamed, errors, skipped, suffixed):
+        self.is_processing = False
+        for item in items: self.update_treeview_item(item)
+        for path, error in errors[:20]: print(f"Could not rename {os.path.basename(path)}: {error}")
+        self.status_bar.config(text=f"Renamed {renamed} files.")
+        messagebox.showinfo("Rename Files", f"Renamed {renamed} file(s), {suffixed} with a number added to avoid a clash.\n"
+                                            f"{len(errors)} error(s), {skipped} without a usable title.")
 
     def run(self):
+        report_startup(self.master, "Image Metadata Generator")
         self.master.mainloop()
 
 if __name__ == "__main__":
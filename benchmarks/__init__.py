@@ -0,0 +1,5 @@
+"""Benchmark harness for the Microstock Automate tools.
+
+Runs the generator pipeline against a local Gemini stand-in (no quota used) and the
+core engines against synthetic image corpora. See benchmarks/README.md.
+"""
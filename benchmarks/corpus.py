@@ -0,0 +1,36 @@
+"""Synthetic image corpora for the benchmarks."""
+import os
+import random
+
+RESOLUTIONS = {
+    "small": (640, 480),
+    "hd": (1920, 1080),
+    "12mp": (4000, 3000),
+}
+FORMATS = {"jpg": "JPEG", "png": "PNG", "tiff": "TIFF", "webp": "WEBP"}
+
+
+def make_image(size, seed):
+    """Gradient + noise image that compresses roughly like a photo"""
+    from PIL import Image, ImageChops
+    rng = random.Random(seed)
+    gradient = Image.linear_gradient("L").resize(size).rotate(rng.randrange(360))
+    noise = Image.effect_noise(size, rng.uniform(20, 60))
+    base = Image.merge("RGB", (gradient, noise, ImageChops.invert(gradient)))
+    tint = Image.new("RGB", size, tuple(rng.randrange(256) for _ in range(3)))
+    return Image.blend(base, tint, 0.3)
+
+
+def generate_corpus(directory, count=20, resolutions=("small", "hd"), formats=("jpg", "png"), seed=42):
+    """Write count images per resolution/format combination and return their paths"""
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for res_name in resolutions:
+        size = RESOLUTIONS[res_name]
+        for ext in formats:
+            for i in range(count):
+                path = os.path.join(directory, f"{res_name}_{i:04d}.{ext}")
+                if not os.path.exists(path):
+                    make_image(size, seed + i).save(path, FORMATS[ext])
+                paths.append(path)
+    return paths
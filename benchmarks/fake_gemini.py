@@ -0,0 +1,182 @@
+"""Local stand-in for google.generativeai used by the benchmarks.
+
+FakeGenerativeModel.generate_content() answers like the real SDK (``response.text``
+and ``response.usage_metadata``) after a configurable latency, and can inject
+errors, 429 bursts and malformed JSON.
+"""
+import asyncio
+import io
+import json
+import random
+import re
+import threading
+import time
+import types
+from typing import NamedTuple
+
+# Gemini bills a fixed number of tokens per image up to 384 px per side
+IMAGE_TOKENS = 258
+
+
+class FakeGeminiConfig(NamedTuple):
+    latency: float = 0.5           # Seconds per call
+    jitter: float = 0.2            # Extra random latency, 0..jitter seconds
+    error_rate: float = 0.0        # Probability of a generic 5xx error
+    burst_every: int = 0           # Start a 429 burst every N calls (0 = never)
+    burst_length: int = 3          # Calls rejected with 429 per burst
+    malformed_rate: float = 0.0    # Probability of a fenced, wrapped or truncated answer
+    seed: int = 1234
+
+
+class ResourceExhausted(Exception):
+    """Mimics google.api_core.exceptions.ResourceExhausted"""
+    code = 429
+
+
+class ServiceUnavailable(Exception):
+    """Mimics google.api_core.exceptions.ServiceUnavailable"""
+    code = 503
+
+
+class FakeStats:
+    """Thread-safe counters shared by all fake models of one run"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.errors = 0
+        self.rate_limited = 0
+        self.malformed = 0
+        self.bytes_uploaded = 0
+        self.prompt_tokens = 0
+        self.output_tokens = 0
+
+    def as_dict(self):
+        with self.lock:
+            return {name: getattr(self, name) for name in
+                    ("calls", "errors", "rate_limited", "malformed", "bytes_uploaded",
+                     "prompt_tokens", "output_tokens")}
+
+
+class _UsageMetadata(NamedTuple):
+    prompt_token_count: int
+    candidates_token_count: int
+    total_token_count: int
+
+
+class FakeResponse:
+    def __init__(self, text, usage_metadata):
+        self.text = text
+        self.usage_metadata = usage_metadata
+
+
+def payload_size(part):
+    """Bytes the SDK would upload for one content part"""
+    if isinstance(part, str):
+        return len(part.encode('utf-8'))
+    if isinstance(part, (bytes, bytearray)):
+        return len(part)
+    if isinstance(part, dict) and "data" in part:
+        return len(part["data"])
+    if hasattr(part, "save"):  # PIL image: the SDK re-encodes it before upload
+        buf = io.BytesIO()
+        fmt = "JPEG" if getattr(part, "format", None) == "JPEG" and part.mode == "RGB" else "PNG"
+        part.save(buf, fmt)
+        return buf.tell()
+    return 0
+
+
+def _words(rng, count):
+    vocabulary = ("sunset", "mountain", "river", "city", "people", "business", "nature", "travel",
+                  "abstract", "texture", "light", "colorful", "modern", "background", "summer")
+    return [rng.choice(vocabulary) for _ in range(count)]
+
+
+def _requested_fields(prompt):
+    """Field name -> requested word/item count, parsed from the prompt"""
+    return {name: int(count) for name, count in re.findall(r'- "(\w+)":.*?exactly (\d+)', prompt)}
+
+
+class FakeGenerativeModel:
+    def __init__(self, model_name="gemini-1.5-flash-latest", config=None, stats=None, **kwargs):
+        self.model_name = model_name
+        self.config = config or FakeGeminiConfig()
+        self.stats = stats or FakeStats()
+        self.kwargs = kwargs
+        self._rng = random.Random(self.config.seed)
+        self._rng_lock = threading.Lock()
+
+    def _plan(self, contents, generation_config=None):
+        """Decide the outcome of one call; returns (delay, exception, response)"""
+        parts = contents if isinstance(contents, (list, tuple)) else [contents]
+        uploaded = sum(payload_size(p) for p in parts)
+        prompt = " ".join(p for p in parts if isinstance(p, str))
+        images = sum(1 for p in parts if not isinstance(p, str))
+        cfg = self.config
+        with self._rng_lock:
+            delay = cfg.latency + self._rng.uniform(0, cfg.jitter)
+            roll_error, roll_malformed = self._rng.random(), self._rng.random()
+            rng = random.Random(self._rng.random())
+        with self.stats.lock:
+            self.stats.calls += 1
+            call_no = self.stats.calls
+            self.stats.bytes_uploaded += uploaded
+            in_burst = cfg.burst_every and (call_no - 1) % cfg.burst_every < cfg.burst_length and call_no > cfg.burst_length
+            if in_burst:
+                self.stats.rate_limited += 1
+                return delay * 0.1, ResourceExhausted("429 Resource has been exhausted (e.g. check quota)."), None
+            if roll_error < cfg.error_rate:
+                self.stats.errors += 1
+                return delay, ServiceUnavailable("503 The service is currently unavailable."), None
+
+        requested = _requested_fields(prompt) or {"title": 10, "keywords": 25, "description": 50}
+        answer = {}
+        for name, count in requested.items():
+            separator = ", " if name == "keywords" else " "
+            answer[name] = separator.join(_words(rng, count))
+        text = json.dumps(answer)
+        if roll_malformed < cfg.malformed_rate:
+            # With a JSON response schema the model can still be cut off, but never wraps the answer
+            schema_mode = bool(generation_config and generation_config.get("response_mime_type") == "application/json")
+            variant = 2 if schema_mode else rng.randrange(3)
+            if variant == 0:
+                text = f"```json\n{text}\n```"
+            elif variant == 1:
+                text = f"Here is the metadata you asked for:\n{text}\nLet me know if you need more."
+            else:
+                text = text[:rng.randrange(10, len(text) - 5)]
+            with self.stats.lock:
+                self.stats.malformed += 1
+        prompt_tokens = len(prompt) // 4 + images * IMAGE_TOKENS
+        output_tokens = len(text) // 4
+        with self.stats.lock:
+            self.stats.prompt_tokens += prompt_tokens
+            self.stats.output_tokens += output_tokens
+        usage = _UsageMetadata(prompt_tokens, output_tokens, prompt_tokens + output_tokens)
+        return delay, None, FakeResponse(text, usage)
+
+    def generate_content(self, contents, request_options=None, generation_config=None, **kwargs):
+        delay, error, response = self._plan(contents, generation_config)
+        time.sleep(delay)
+        if error:
+            raise error
+        return response
+
+    async def generate_content_async(self, contents, request_options=None, generation_config=None, **kwargs):
+        delay, error, response = self._plan(contents, generation_config)
+        await asyncio.sleep(delay)
+        if error:
+            raise error
+        return response
+
+
+def make_fake_genai(config=None, stats=None):
+    """Build a module object that can stand in for google.generativeai"""
+    stats = stats or FakeStats()
+    module = types.ModuleType("google.generativeai")
+    module.stats = stats
+    module.configured_keys = []
+    module.configure = lambda api_key=None, **kwargs: module.configured_keys.append(api_key)
+    module.GenerativeModel = lambda model_name="gemini-1.5-flash-latest", **kwargs: FakeGenerativeModel(
+        model_name, config=config, stats=stats, **kwargs)
+    return module
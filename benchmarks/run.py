@@ -0,0 +1,408 @@
+"""Benchmark runner: python -m benchmarks.run [--quick] [--output results.json] [--compare baseline.json]
+
+Each benchmark runs in its own subprocess so the peak RSS reported is its own.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from benchmarks.corpus import generate_corpus
+from benchmarks.fake_gemini import FakeGeminiConfig, make_fake_genai
+
+BENCHMARKS = ("process_files", "process_files_async", "embed", "export", "rename", "rename_pattern", "rename_zip")
+# A metric counts as a regression when it gets worse by more than this fraction
+REGRESSION_THRESHOLD = 0.10
+HIGHER_IS_BETTER = {"images_per_sec"}
+COMPARED_METRICS = ("images_per_sec", "p50_ms", "p95_ms", "peak_rss_mb")
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:  # Windows
+        return 0.0
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+def summarize(latencies, elapsed, **extra):
+    result = {
+        "images": len(latencies),
+        "seconds": round(elapsed, 3),
+        "images_per_sec": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+    }
+    result.update(extra)
+    return result
+
+
+def timed_each(func, items):
+    """Call func on every item sequentially; returns (latencies, elapsed)"""
+    latencies = []
+    start = time.perf_counter()
+    for item in items:
+        t0 = time.perf_counter()
+        func(item)
+        latencies.append(time.perf_counter() - t0)
+    return latencies, time.perf_counter() - start
+
+
+# --- Headless generator ---
+class _Var:
+    def __init__(self, value):
+        self.value = value
+
+    def get(self):
+        return self.value
+
+    def set(self, value):
+        self.value = value
+
+
+class _Widget:
+    """Accepts and ignores the widget calls made from the processing path"""
+
+    def config(self, **kwargs):
+        pass
+
+    configure = config
+
+    def cget(self, option):
+        return ""
+
+    def exists(self, item_id):
+        return True
+
+    def item(self, *args, **kwargs):
+        pass
+
+
+class _ImmediateMaster:
+    """Runs after() callbacks right away, on the calling thread"""
+
+    def after(self, delay, func=None, *args):
+        if func is not None:
+            func(*args)
+
+    def update_idletasks(self):
+        pass
+
+
+def make_headless_app(model, limits=(15, 40, 100), use_schema=True):
+    """Build an ImageMetadataApp without Tk that records per-item latency"""
+    import Metadata_Generator_Gemini as generator
+    from microstock_core.search import MetadataIndex
+
+    class HeadlessApp(generator.ImageMetadataApp):
+        def __init__(self):
+            self.master = _ImmediateMaster()
+            self.api_key = _Var("benchmark")
+            self.title_word_limit, self.keyword_items_limit, self.desc_word_limit = (_Var(v) for v in limits)
+            self.is_processing = False
+            self.is_paused = False
+            self.stop_processing_flag = threading.Event()
+            self.async_batch = None
+            self.prefetcher = None
+            self.upload_pool = None
+            self.live_csv = None
+            self.search_index = MetadataIndex(":memory:")
+            self.watcher = None
+            self.file_data = []
+            self.profiler = generator.StageProfiler()
+            self.usage = generator.UsageTotals(generator.MODEL_NAME)
+            self.keyword_normalizer = generator.KeywordNormalizer()
+            self.profiles = generator.load_profiles(None)
+            self.profile_name = _Var("Default")
+            self.active_profile = "Default"
+            self.structured_output = _Var(use_schema)
+            self.batch_profile = self._current_profile()
+            self.convert_budget = generator.MemoryBudget()
+            self.key_pool = generator.KeyPool(["benchmark"], lambda key, model_name, asynchronous: model)
+            self.use_schema = use_schema
+            self.tree = self.status_bar = self.pause_button = self.stop_button = self.throughput_label = _Widget()
+            self.started = {}
+            self.latencies = []
+            self.statuses = {}
+            self.lock = threading.Lock()
+
+        def _post(self, callback, *args):
+            callback(*args)
+
+        def update_treeview_item(self, item_data):
+            with self.lock:
+                if item_data["status"] == "Processing...":
+                    self.started[item_data["id"]] = time.perf_counter()
+                elif item_data["id"] in self.started:
+                    self.latencies.append(time.perf_counter() - self.started.pop(item_data["id"]))
+                    self.statuses[item_data["status"]] = self.statuses.get(item_data["status"], 0) + 1
+
+    return HeadlessApp()
+
+
+def bench_process_files(paths, fake_config, trace_path=None, use_schema=True, concurrency=1):
+    """The generator's thread path, or its asyncio path when concurrency > 1"""
+    import Metadata_Generator_Gemini as generator
+    fake = make_fake_genai(fake_config)
+    generator.genai = fake
+    app = make_headless_app(fake.GenerativeModel(generator.MODEL_NAME), use_schema=use_schema)
+    items = [{"id": str(i), "selected": False, "filepath": os.path.abspath(p), "filename": os.path.basename(p),
+              "title": "", "keyword": "", "description": "", "status": "Pending"}
+             for i, p in enumerate(paths)]
+    app.file_data = items
+    app.is_processing = True
+    app.profiler.reset(len(items))
+    start = time.perf_counter()
+    if concurrency > 1:
+        prompt = app._create_prompt()
+        app._start_prefetch(items, concurrency + generator.PREFETCH_AHEAD)
+        app.async_batch = generator.AsyncBatch(concurrency, generator.REQUEST_DEADLINE)
+        try:
+            app.async_batch.run(items, lambda item: app._process_item_async(item, prompt))
+        finally:
+            app.prefetcher.close()
+            app.upload_pool.shutdown()
+    else:
+        app.process_files_thread(items)
+    elapsed = time.perf_counter() - start
+    stats = fake.stats.as_dict()
+    if trace_path:
+        app.profiler.export_trace(trace_path)
+    return summarize(app.latencies, elapsed, bytes_uploaded=stats["bytes_uploaded"],
+                     input_tokens=app.usage.input_tokens, output_tokens=app.usage.output_tokens,
+                     cost_usd=round(app.usage.cost, 6), statuses=app.statuses,
+                     stages=app.profiler.snapshot()["stages"], fake_api=stats, concurrency=concurrency)
+
+
+def _jpeg_copies(paths, workdir):
+    """Copy the JPEG part of the corpus into workdir (embedding rewrites files in place)"""
+    copies = []
+    for path in paths:
+        if path.lower().endswith((".jpg", ".jpeg")):
+            dst = os.path.join(workdir, os.path.basename(path))
+            shutil.copyfile(path, dst)
+            copies.append(dst)
+    return copies
+
+
+def bench_embed(paths, workdir):
+    from microstock_core.metadata import embed_stock_metadata
+    copies = _jpeg_copies(paths, workdir)
+    keywords = ", ".join(f"keyword{i}" for i in range(40))
+    latencies, elapsed = timed_each(
+        lambda p: embed_stock_metadata(p, "Benchmark title for a synthetic image", keywords,
+                                       "A synthetic image used to time metadata embedding."), copies)
+    return summarize(latencies, elapsed)
+
+
+def bench_export(paths, workdir):
+    from microstock_core.conversion import convert_to_jpeg
+    latencies, elapsed = timed_each(
+        lambda p: convert_to_jpeg(p, os.path.join(workdir, os.path.splitext(os.path.basename(p))[0] + "_export.jpg")),
+        [p for p in paths if not p.lower().endswith((".jpg", ".jpeg"))])
+    return summarize(latencies, elapsed)
+
+
+def _copies(paths, workdir):
+    copies = []
+    for path in paths:
+        dst = os.path.join(workdir, os.path.basename(path))
+        shutil.copyfile(path, dst)
+        copies.append(dst)
+    return copies
+
+
+class _StepTimer:
+    """Per-file latencies of a batch call, taken as the gaps between its progress callbacks"""
+
+    def __init__(self):
+        self.start = self.last = time.perf_counter()
+        self.latencies = []
+
+    def step(self, *args):
+        now = time.perf_counter()
+        self.latencies.append(now - self.last)
+        self.last = now
+
+    def summary(self):
+        return summarize(self.latencies, time.perf_counter() - self.start)
+
+
+def bench_rename(paths, workdir):
+    """The generator's rename: one plan for the whole batch, then the renames"""
+    from microstock_core.renaming import apply_renames, plan_renames, title_to_filename
+    copies = _copies(paths, workdir)
+    timer = _StepTimer()
+    # Every file gets the same title so the unique-name path is exercised too
+    base = title_to_filename("Sunset over the mountains, golden hour!")
+    apply_renames(plan_renames([(p, base) for p in copies]), on_done=timer.step)
+    return timer.summary()
+
+
+def bench_rename_pattern(paths, workdir):
+    """The renamer tools' run with a pattern that reads pixel sizes from the headers"""
+    from microstock_core.patterns import RenamePattern
+    from microstock_core.renaming import rename_batch
+    copies = _copies(paths, workdir)
+    timer = _StepTimer()
+    errors = rename_batch(copies, "shot", RenamePattern("{name}_{n:04}_{w}x{h}"), on_step=timer.step)
+    return timer.summary() if not errors else {"error": f"{len(errors)} rename errors: {errors[0]}"}
+
+
+def bench_rename_zip(paths, workdir):
+    import zipfile
+    from microstock_core.archives import rename_zip_members
+    archives = []
+    for i in range(0, len(paths), 2):
+        archive = os.path.join(workdir, f"bundle_{i:04d}.zip")
+        with zipfile.ZipFile(archive, "w", zipfile.ZIP_DEFLATED) as zf:
+            for path in paths[i:i + 2]:
+                zf.write(path, os.path.basename(path))
+        archives.append(archive)
+    latencies, elapsed = timed_each(lambda p: rename_zip_members(p, "renamed"), archives)
+    return summarize(latencies, elapsed)
+
+
+def run_child(name, corpus_dir, fake_config, trace_path=None, use_schema=True, concurrency=32):
+    """Run one benchmark in this process and return its result dict"""
+    paths = sorted(os.path.join(corpus_dir, f) for f in os.listdir(corpus_dir))
+    if name == "process_files":
+        return bench_process_files(paths, fake_config, trace_path, use_schema)
+    if name == "process_files_async":
+        return bench_process_files(paths, fake_config, None, use_schema, concurrency)
+    with tempfile.TemporaryDirectory(prefix="microstock_bench_") as workdir:
+        return globals()[f"bench_{name}"](paths, workdir)
+
+
+def run_isolated(name, corpus_dir, fake_config, trace_path=None, use_schema=True, concurrency=32):
+    repo_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    cmd = [sys.executable, "-m", "benchmarks.run", "--child", name, "--corpus", corpus_dir,
+           "--fake-config", json.dumps(fake_config._asdict()), "--concurrency", str(concurrency)]
+    if trace_path:
+        cmd += ["--trace", os.path.abspath(trace_path)]
+    if not use_schema:
+        cmd.append("--no-schema")
+    proc = subprocess.run(cmd, cwd=repo_root, capture_output=True, text=True)
+    if proc.returncode != 0:
+        return {"error": proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else f"exit {proc.returncode}"}
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def compare(results, baseline):
+    """Return a list of human-readable regressions against a baseline results dict"""
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get("results", {}).get(name)
+        if not previous or "error" in current or "error" in previous:
+            continue
+        for metric in COMPARED_METRICS:
+            old, new = previous.get(metric), current.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            worse = -change if metric in HIGHER_IS_BETTER else change
+            if worse > REGRESSION_THRESHOLD:
+                regressions.append(f"{name}.{metric}: {old} -> {new} ({change:+.0%})")
+    return regressions
+
+
+def print_table(results):
+    print(f"{'benchmark':<21}{'images':>8}{'img/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'RSS MB':>9}{'uploaded':>12}")
+    for name, r in results.items():
+        if "error" in r:
+            print(f"{name:<21} ERROR: {r['error']}")
+            continue
+        uploaded = f"{r['bytes_uploaded'] / 1024 / 1024:.1f} MB" if "bytes_uploaded" in r else "-"
+        print(f"{name:<21}{r['images']:>8}{r['images_per_sec']:>10}{r['p50_ms']:>10}{r['p95_ms']:>10}"
+              f"{r['peak_rss_mb']:>9}{uploaded:>12}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the Microstock Automate tools offline.")
+    parser.add_argument("--corpus", help="Folder with benchmark images (generated when missing)")
+    parser.add_argument("--count", type=int, default=10, help="Images per resolution/format")
+    parser.add_argument("--resolutions", default="small,hd", help="Comma-separated: small, hd, 12mp")
+    parser.add_argument("--formats", default="jpg,png,tiff,webp", help="Comma-separated: jpg, png, tiff, webp")
+    parser.add_argument("--only", help="Comma-separated subset of: " + ", ".join(BENCHMARKS))
+    parser.add_argument("--quick", action="store_true", help="Small corpus and near-zero API latency")
+    parser.add_argument("--latency", type=float, default=0.2, help="Fake API latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.1)
+    parser.add_argument("--error-rate", type=float, default=0.02)
+    parser.add_argument("--burst-every", type=int, default=0, help="Start a 429 burst every N calls")
+    parser.add_argument("--burst-length", type=int, default=3)
+    parser.add_argument("--malformed-rate", type=float, default=0.05)
+    parser.add_argument("--output", help="Write results JSON here")
+    parser.add_argument("--compare", help="Baseline results JSON; exit 1 on regression")
+    parser.add_argument("--concurrency", type=int, default=32, help="Parallel requests for process_files_async")
+    parser.add_argument("--no-schema", action="store_true", help="Prompt-only JSON instead of a response schema")
+    parser.add_argument("--trace", help="Write the process_files stage trace (JSON lines) here")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    parser.add_argument("--fake-config", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        fake_config = FakeGeminiConfig(**json.loads(args.fake_config))
+        print(json.dumps(run_child(args.child, args.corpus, fake_config, args.trace, not args.no_schema,
+                                   args.concurrency)))
+        return 0
+
+    if args.quick:
+        args.count, args.resolutions, args.latency, args.jitter = 3, "small", 0.01, 0.0
+    fake_config = FakeGeminiConfig(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+                                   burst_every=args.burst_every, burst_length=args.burst_length,
+                                   malformed_rate=args.malformed_rate)
+    corpus_dir = args.corpus or os.path.join(tempfile.gettempdir(), "microstock_bench_corpus",
+                                             f"{args.resolutions}_{args.formats}_{args.count}".replace(",", "-"))
+    print(f"Corpus: {corpus_dir}")
+    generate_corpus(corpus_dir, args.count, args.resolutions.split(","), args.formats.split(","))
+
+    names = args.only.split(",") if args.only else BENCHMARKS
+    results = {}
+    for name in names:
+        print(f"Running {name}...")
+        results[name] = run_isolated(name, corpus_dir, fake_config, args.trace, not args.no_schema,
+                                     args.concurrency)
+    print_table(results)
+
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "platform": {"python": platform.python_version(), "system": platform.platform(),
+                     "cpus": os.cpu_count()},
+        "corpus": {"count": args.count, "resolutions": args.resolutions, "formats": args.formats},
+        "fake_api": fake_config._asdict(),
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"Results saved to {args.output}")
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f))
+        if regressions:
+            print("Regressions:")
+            for line in regressions:
+                print(f"  {line}")
+            return 1
+        print("No regressions against baseline.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,14 +1,19 @@
 import os
+import sys
 import tkinter as tk
 from tkinter import filedialog, messagebox, ttk
-from PIL import Image
-import piexif
-import piexif.helper
-from datetime import datetime
-import tempfile
-from pathlib import Path
-import zipfile
-import shutil
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from microstock_core.fileio import atomic_replace, write_temp_file
+from microstock_core.metadata import (build_xmp, load_exif_dict, prefetch_metadata, read_metadata, read_raw_metadata,
+                                      split_keywords, update_exif_fields, write_metadata)
+from microstock_core.patterns import RenamePattern, is_rename_pattern
+from microstock_core.renaming import rename_batch
+from microstock_core.scanning import list_folder_images, walk_files
+from microstock_core.startup import report_startup
+
+PREFETCH_COUNT = 8
 
 class FileManagementTool:
     def __init__(self, root):
@@ -35,6 +40,8 @@ class FileManagementTool:
     # ===== METADATA EDITOR FUNCTIONS =====
     def init_metadata_editor(self):
         self.selected_image = ""
+        self.browse_list = []
+        self.browse_index = 0
         self.title_var = tk.StringVar()
         self.artist_var = tk.StringVar()
         self.copyright_var = tk.StringVar()
@@ -46,8 +53,14 @@ class FileManagementTool:
         tk.Label(self.metadata_tab, text="IMAGE METADATA EDITOR", font=('Arial', 14, 'bold')).pack(pady=10)
         self.selected_label = tk.Label(self.metadata_tab, text="No image selected", wraplength=550)
         self.selected_label.pack(pady=5)
-        tk.Button(self.metadata_tab, text="🖼️ SELECT IMAGE", command=self.select_image,
-                 bg='#4CAF50', fg='white', height=2, width=20).pack(pady=10)
+        select_frame = tk.Frame(self.metadata_tab)
+        select_frame.pack(pady=10)
+        tk.Button(select_frame, text="🖼️ SELECT IMAGE", command=self.select_image,
+                 bg='#4CAF50', fg='white', height=2, width=20).pack(side=tk.LEFT, padx=5)
+        tk.Button(select_frame, text="◀", command=lambda: self.browse(-1), height=2, width=3).pack(side=tk.LEFT, padx=2)
+        tk.Button(select_frame, text="▶", command=lambda: self.browse(1), height=2, width=3).pack(side=tk.LEFT, padx=2)
+        self.metadata_tab.bind_all("<Prior>", lambda e: self.browse(-1))
+        self.metadata_tab.bind_all("<Next>", lambda e: self.browse(1))
         
         fields_frame = tk.Frame(self.metadata_tab)
         fields_frame.pack(pady=10, padx=20, fill=tk.X)
@@ -80,35 +93,38 @@ class FileManagementTool:
         filetypes = (('Image files', '*.jpg *.jpeg *.png *.tiff *.tif'), ('All files', '*.*'))
         filename = filedialog.askopenfilename(title="Select Image File", filetypes=filetypes)
         if filename:
-            self.selected_image = filename
-            self.selected_label.config(text=f"Selected: {os.path.basename(filename)}")
-            self.load_existing_metadata()
+            folder = os.path.dirname(filename)
+            self.browse_list = list_folder_images(folder)
+            normalized = [os.path.normcase(p) for p in self.browse_list]
+            target = os.path.normcase(os.path.join(folder, os.path.basename(filename)))
+            self.browse_index = normalized.index(target) if target in normalized else 0
+            self.open_image(filename)
+
+    def open_image(self, filename):
+        self.selected_image = filename
+        self.selected_label.config(text=f"Selected: {os.path.basename(filename)}")
+        self.load_existing_metadata()
+        # Read ahead so stepping through the folder hits the cache
+        ahead = self.browse_list[self.browse_index + 1:self.browse_index + 1 + PREFETCH_COUNT]
+        if ahead:
+            threading.Thread(target=prefetch_metadata, args=(ahead,), daemon=True).start()
+
+    def browse(self, step):
+        """Show the previous/next image of the selected image's folder"""
+        if not self.browse_list or self.notebook.select() != str(self.metadata_tab):
+            return
+        self.browse_index = (self.browse_index + step) % len(self.browse_list)
+        self.open_image(self.browse_list[self.browse_index])
     
     def load_existing_metadata(self):
         try:
-            img = Image.open(self.selected_image)
-            if 'exif' in img.info:
-                exif_dict = piexif.load(img.info['exif'])
-                self.title_var.set(exif_dict["0th"].get(piexif.ImageIFD.ImageDescription, b'').decode('utf-8', errors='ignore'))
-                self.artist_var.set(exif_dict["0th"].get(piexif.ImageIFD.Artist, b'').decode('utf-8', errors='ignore'))
-                self.copyright_var.set(exif_dict["0th"].get(piexif.ImageIFD.Copyright, b'').decode('utf-8', errors='ignore'))
-                user_comment = exif_dict["Exif"].get(piexif.ExifIFD.UserComment, b'')
-                if user_comment:
-                    try:
-                        self.comment_var.set(piexif.helper.UserComment.load(user_comment))
-                    except:
-                        self.comment_var.set("")
-            # Try to load subject from XMP if available
-            if hasattr(img, 'info') and 'xmp' in img.info:
-                try:
-                    xmp = img.info['xmp'].decode('utf-8')
-                    if '<dc:subject>' in xmp:
-                        start = xmp.find('<dc:subject>') + len('<dc:subject>')
-                        end = xmp.find('</dc:subject>')
-                        self.subject_var.set(xmp[start:end])
-                except:
-                    pass
-            img.close()
+            record = read_metadata(self.selected_image)
+            self.title_var.set(record.title)
+            self.artist_var.set(record.artist)
+            self.copyright_var.set(record.copyright)
+            self.comment_var.set(record.comment)
+            self.rating_var.set(record.rating)
+            self.subject_var.set(", ".join(record.keywords))
         except Exception as e:
             messagebox.showerror("Error", f"Could not load metadata: {str(e)}")
     
@@ -121,17 +137,13 @@ class FileManagementTool:
         if not messagebox.askyesno("Confirm", "This will modify the original file. Continue?"):
             return
             
+        temp_path = None
         try:
             self.metadata_progress["value"] = 0
             self.root.update()
             
-            # Open the original image
-            img = Image.open(self.selected_image)
-            
             # Load existing EXIF or create new
-            exif_dict = piexif.load(img.info['exif']) if 'exif' in img.info else {
-                "0th": {}, "Exif": {}, "GPS": {}, "1st": {}, "thumbnail": None
-            }
+            exif_dict = load_exif_dict(read_raw_metadata(self.selected_image)[0])
             
             # Update metadata fields
             self.update_exif_data(exif_dict)
@@ -140,7 +152,7 @@ class FileManagementTool:
             xmp = self.create_xmp_metadata()
             
             # Save to temporary file first (safety measure)
-            temp_path = self.save_to_temp_file(img, exif_dict, xmp)
+            temp_path = self.save_to_temp_file(exif_dict, xmp)
             
             # Replace original file
             self.replace_original_file(temp_path)
@@ -154,71 +166,25 @@ class FileManagementTool:
     
     def update_exif_data(self, exif_dict):
         """Update EXIF dictionary with current form values"""
-        if self.title_var.get():
-            exif_dict["0th"][piexif.ImageIFD.ImageDescription] = self.title_var.get().encode('utf-8')
-        if self.artist_var.get():
-            exif_dict["0th"][piexif.ImageIFD.Artist] = self.artist_var.get().encode('utf-8')
-        if self.copyright_var.get():
-            exif_dict["0th"][piexif.ImageIFD.Copyright] = self.copyright_var.get().encode('utf-8')
-        if self.comment_var.get():
-            exif_dict["Exif"][piexif.ExifIFD.UserComment] = piexif.helper.UserComment.dump(
-                self.comment_var.get(), encoding="unicode")
-        
-        # Update timestamps
-        now = datetime.now().strftime("%Y:%m:%d %H:%M:%S")
-        exif_dict["0th"][piexif.ImageIFD.DateTime] = now
-        exif_dict["Exif"][piexif.ExifIFD.DateTimeOriginal] = now
-        exif_dict["Exif"][piexif.ExifIFD.DateTimeDigitized] = now
+        update_exif_fields(exif_dict, {
+            "title": self.title_var.get(),
+            "artist": self.artist_var.get(),
+            "copyright": self.copyright_var.get(),
+            "comment": self.comment_var.get(),
+        })
     
     def create_xmp_metadata(self):
         """Create XMP metadata string with rating and subject"""
-        return f"""<x:xmpmeta xmlns:x="adobe:ns:meta/" x:xmptk="XMP Core 5.4.0">
-    <rdf:RDF xmlns:rdf="http://www.w3.org/1999/02/22-rdf-syntax-ns#">
-        <rdf:Description rdf:about="" xmlns:xmp="http://ns.adobe.com/xap/1.0/">
-            <xmp:Rating>{self.rating_var.get()}</xmp:Rating>
-        </rdf:Description>
-        <rdf:Description rdf:about="" xmlns:dc="http://purl.org/dc/elements/1.1/">
-            <dc:subject>
-                <rdf:Bag>
-                    <rdf:li>{self.subject_var.get()}</rdf:li>
-                </rdf:Bag>
-            </dc:subject>
-        </rdf:Description>
-    </rdf:RDF>
-</x:xmpmeta>""".encode('utf-8')
+        return build_xmp(self.rating_var.get(), split_keywords(self.subject_var.get()))
     
-    def save_to_temp_file(self, img, exif_dict, xmp):
-        """Save image with new metadata to temporary file"""
-        temp_path = os.path.join(tempfile.gettempdir(), f"temp_{os.path.basename(self.selected_image)}")
-        exif_bytes = piexif.dump(exif_dict)
-        
-        if self.selected_image.lower().endswith(('.jpg', '.jpeg')):
-            img.save(temp_path, exif=exif_bytes, quality=95, xmp=xmp)
-        elif self.selected_image.lower().endswith('.png'):
-            img.save(temp_path, exif=exif_bytes, xmp=xmp)
-        else:
-            img.save(temp_path)
-        
-        img.close()
-        return temp_path
+    def save_to_temp_file(self, exif_dict, xmp):
+        """Save image with new metadata to a unique temporary file next to the original"""
+        return write_temp_file(self.selected_image,
+                               lambda f: write_metadata(self.selected_image, f, exif_dict, xmp))
     
     def replace_original_file(self, temp_path):
-        """Replace original file with the temporary file"""
-        # Make backup of original file
-        backup_path = self.selected_image + ".bak"
-        os.replace(self.selected_image, backup_path)
-        
-        try:
-            # Move temp file to original location
-            os.replace(temp_path, self.selected_image)
-            
-            # If everything succeeded, remove backup
-            os.remove(backup_path)
-        except Exception as e:
-            # Restore from backup if something went wrong
-            if os.path.exists(backup_path):
-                os.replace(backup_path, self.selected_image)
-            raise e
+        """Atomically replace original file with the temporary file"""
+        atomic_replace(temp_path, self.selected_image)
     
     def cleanup_temp_file(self, temp_path):
         """Clean up temporary file if it exists"""
@@ -232,6 +198,9 @@ class FileManagementTool:
     def init_batch_renamer(self):
         self.selected_files = []
         self.new_name = tk.StringVar(value="NewName")
+        self.renamer_regex = tk.StringVar()
+        self.renamer_cancel_event = threading.Event()
+        self.renamer_running = False
         
         # Batch Renamer GUI
         tk.Label(self.renamer_tab, text="BATCH FILE RENAMER", font=('Arial', 14, 'bold')).pack(pady=10)
@@ -245,6 +214,11 @@ class FileManagementTool:
         frame_name.pack(pady=10, padx=10, fill=tk.X)
         tk.Label(frame_name, text="New Base Name:").pack(side=tk.LEFT)
         tk.Entry(frame_name, textvariable=self.new_name, width=30).pack(side=tk.LEFT, padx=5)
+        # A name with {tokens} is a pattern, e.g. {exif:DateTimeOriginal:%Y%m%d}_{n:04}; see microstock_core/patterns.py
+        frame_regex = tk.Frame(self.renamer_tab)
+        frame_regex.pack(padx=10, fill=tk.X)
+        tk.Label(frame_regex, text="Match (regex, for {1}, {2}...):").pack(side=tk.LEFT)
+        tk.Entry(frame_regex, textvariable=self.renamer_regex, width=22).pack(side=tk.LEFT, padx=5)
         
         # Action Buttons
         btn_frame = tk.Frame(self.renamer_tab)
@@ -267,8 +241,12 @@ class FileManagementTool:
         self.renamer_progress.pack(pady=20)
         
         # Big Rename Button
-        tk.Button(self.renamer_tab, text="START RENAMING", command=self.rename_items,
-                 bg='#FF9800', fg='white', height=2, width=25, font=('Arial', 10, 'bold')).pack(pady=10)
+        self.renamer_start_button = tk.Button(self.renamer_tab, text="START RENAMING", command=self.rename_items,
+                 bg='#FF9800', fg='white', height=2, width=25, font=('Arial', 10, 'bold'))
+        self.renamer_start_button.pack(pady=10)
+        self.renamer_cancel_button = tk.Button(self.renamer_tab, text="CANCEL", command=self.cancel_renaming,
+                 bg='#9E9E9E', fg='white', width=15, state=tk.DISABLED)
+        self.renamer_cancel_button.pack()
     
     def renamer_select_files(self):
         files = filedialog.askopenfilenames(title="Select Files to Rename")
@@ -279,11 +257,7 @@ class FileManagementTool:
     def renamer_select_folder(self):
         folder = filedialog.askdirectory(title="Select Folder with Files")
         if folder:
-            self.selected_files = []
-            for root, _, files in os.walk(folder):
-                for file in files:
-                    file_path = os.path.join(root, file)
-                    self.selected_files.append(file_path)
+            self.selected_files = walk_files(folder)
             self.renamer_selected_label.config(text=f"Selected: {len(self.selected_files)} files")
     
     def rename_items(self):
@@ -297,62 +271,66 @@ class FileManagementTool:
             messagebox.showerror("Error", "Please enter a base name!")
             return
         
-        try:
-            self.renamer_progress["maximum"] = len(self.selected_files)
-            self.root.update()
-            
-            for file_path in self.selected_files:
-                if file_path.lower().endswith('.zip'):
-                    self.rename_files_in_zip(file_path, new_name)
-                else:
-                    self.rename_regular_file(file_path, new_name)
-                
-                self.renamer_progress["value"] += 1
-                self.root.update_idletasks()
-            
-            messagebox.showinfo("Success", "All files renamed successfully!")
-            
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to rename: {str(e)}")
-    
-    def rename_regular_file(self, file_path, new_name):
-        """Rename regular files (non-zip)"""
-        path = Path(file_path)
-        new_filename = f"{new_name}{path.suffix}"
-        new_path = path.with_name(new_filename)
+        if self.renamer_running:
+            return
         
-        # Handle duplicates
-        counter = 1
-        while new_path.exists():
-            new_filename = f"{new_name}_{counter}{path.suffix}"
-            new_path = path.with_name(new_filename)
-            counter += 1
+        pattern = None
+        if is_rename_pattern(new_name):
+            try:
+                pattern = RenamePattern(new_name, self.renamer_regex.get().strip())
+            except ValueError as e:
+                messagebox.showerror("Error", f"Invalid name pattern: {e}")
+                return
         
-        path.rename(new_path)
+        # Archives are rewritten on a worker pool; the window keeps updating meanwhile
+        self.renamer_running = True
+        self.renamer_cancel_event.clear()
+        self.renamer_progress["maximum"] = len(self.selected_files)
+        self.renamer_progress["value"] = 0
+        self.renamer_start_button.config(state=tk.DISABLED)
+        self.renamer_cancel_button.config(state=tk.NORMAL)
+        threading.Thread(target=self.rename_worker, args=(list(self.selected_files), new_name, pattern),
+                         daemon=True).start()
     
-    def rename_files_in_zip(self, zip_path, new_name):
-        """Rename files inside ZIP archives"""
-        temp_dir = tempfile.mkdtemp()
-        temp_zip = os.path.join(temp_dir, "temp.zip")
-        
+    def rename_worker(self, files, new_name, pattern=None):
+        errors = []
         try:
-            with zipfile.ZipFile(zip_path, 'r') as zin:
-                with zipfile.ZipFile(temp_zip, 'w') as zout:
-                    for item in zin.infolist():
-                        if not item.is_dir():
-                            # Extract file extension
-                            _, ext = os.path.splitext(item.filename)
-                            # Create new filename
-                            new_filename = f"{new_name}{ext}"
-                            # Add file with new name to temp zip
-                            zout.writestr(new_filename, zin.read(item.filename))
-            
-            # Replace original with renamed version
-            os.remove(zip_path)
-            shutil.move(temp_zip, zip_path)
-            
+            errors = rename_batch(files, new_name, pattern, self.renamer_cancel_event,
+                                  on_planned=lambda total: self.root.after(0, self.renamer_set_total, total),
+                                  on_step=lambda zip_path: self.root.after(0, self.renamer_step_progress, zip_path))
+        except Exception as e:
+            errors = [(files[0], f"Renaming stopped: {e}")]
         finally:
-            shutil.rmtree(temp_dir, ignore_errors=True)
+            # Always re-enables the Start button, even when the batch fails
+            self.root.after(0, self.rename_finished, errors)
+    
+    def renamer_set_total(self, total):
+        # Files that already have their target name are not renamed, so the bar is sized from the plan
+        self.renamer_progress["maximum"] = max(total, 1)
+    
+    def renamer_step_progress(self, zip_path=None):
+        self.renamer_progress["value"] += 1
+        if zip_path:
+            self.renamer_selected_label.config(
+                text=f"Repacked {os.path.basename(zip_path)} "
+                     f"({int(self.renamer_progress['value'])}/{int(self.renamer_progress['maximum'])})")
+    
+    def cancel_renaming(self):
+        self.renamer_cancel_event.set()
+        self.renamer_cancel_button.config(state=tk.DISABLED)
+    
+    def rename_finished(self, errors):
+        self.renamer_running = False
+        self.renamer_start_button.config(state=tk.NORMAL)
+        self.renamer_cancel_button.config(state=tk.DISABLED)
+        if self.renamer_cancel_event.is_set():
+            messagebox.showinfo("Cancelled", f"Renaming cancelled after {int(self.renamer_progress['value'])} of "
+                                             f"{int(self.renamer_progress['maximum'])} files. Unfinished archives were left unchanged.")
+        elif errors:
+            details = "\n".join(f"{os.path.basename(path)}: {error}" for path, error in errors[:10])
+            messagebox.showerror("Error", f"Failed to rename {len(errors)} file(s):\n{details}")
+        else:
+            messagebox.showinfo("Success", "All files renamed successfully!")
     
     # ===== COMMON FUNCTIONS =====
     def safe_quit(self):
@@ -364,4 +342,5 @@ if __name__ == "__main__":
     root = tk.Tk()
     app = FileManagementTool(root)
     root.protocol("WM_DELETE_WINDOW", app.safe_quit)
+    report_startup(root, "File Management Tool")
     root.mainloop()
@@ -0,0 +1,60 @@
+"""Shared, GUI-free engines behind the Microstock Automate tools.
+
+The tools in this repository are thin Tkinter frontends over these modules, so
+the same code can be used (and benchmarked) from plain scripts. Tools import
+from the submodules directly; the names below are also available from the
+package itself, but each submodule is only imported on first access, so
+importing the package stays cheap.
+"""
+import importlib
+import time
+
+# report_startup() measures the time to the first window from here
+IMPORTED_AT = time.perf_counter()
+
+# submodule -> public names re-exported lazily by __getattr__
+_EXPORTS = {
+    "aio": ("AsyncBatch",),
+    "archives": ("ArchiveCancelled", "member_names", "rename_archives", "rename_zip_members"),
+    "batch": ("FIELD_MODES", "MODE_KEEP", "MODE_MERGE", "MODE_REPLACE", "apply_batch_template"),
+    "conversion": ("MemoryBudget", "convert_many", "convert_to_jpeg", "estimate_conversion_memory",
+                   "image_upload_part"),
+    "csvexport": ("CSV_PROFILES", "CsvProfile", "StreamingCsvWriter", "export_items"),
+    "fileio": ("atomic_replace", "config_dir", "replace_file", "write_temp_file"),
+    "importer": ("ItemIndex", "embed_items", "file_hash", "read_metadata_rows", "resolve_row_path"),
+    "keypool": ("KeyPool", "KeyPoolCancelled", "is_rate_limited", "parse_keys"),
+    "keywords": ("KeywordNormalizer", "load_synonyms"),
+    "metadata": ("EMBEDDABLE_EXTENSIONS", "ImageMetadata", "build_xmp", "embed_stock_metadata", "empty_exif_dict",
+                 "load_exif_dict", "merge_xmp", "prefetch_metadata", "read_metadata", "read_raw_metadata",
+                 "split_keywords", "update_exif_fields", "update_file_metadata", "write_metadata"),
+    "pairing": ("PREVIEW_EXTENSIONS", "VECTOR_EXTENSIONS", "PairingIndex", "expand_group_items", "group_by_stem"),
+    "patterns": ("RenamePattern", "exif_tags", "is_rename_pattern"),
+    "prefetch": ("UploadPrefetcher", "make_prepare_executor"),
+    "profiling": ("StageProfiler",),
+    "profiles": ("PROFILES", "PromptProfile", "compile_prompt", "load_profiles", "profile_from_dict",
+                 "save_profiles", "schema_config"),
+    "renaming": ("apply_renames", "plan_renames", "rename_batch", "rename_with_suffix", "title_to_filename",
+                 "unique_path"),
+    "responses": ("METADATA_FIELDS", "generation_config", "metadata_schema", "parse_metadata_json"),
+    "search": ("SEARCH_MODES", "MetadataIndex", "build_match"),
+    "scanning": ("IMAGE_EXTENSIONS", "list_folder_images", "probe_image", "probe_size", "walk_files"),
+    "startup": ("STARTUP_BUDGET_MS", "report_startup"),
+    "thumbnails": ("THUMB_SIZE", "LruCache", "ThumbnailCache", "make_thumbnail", "prune_cache"),
+    "usage": ("UsageTotals", "cost_usd", "estimate_batch", "image_tokens", "usage_counts"),
+    "watch": ("FolderWatcher",),
+}
+_MODULE_OF = {name: module for module, names in _EXPORTS.items() for name in names}
+__all__ = sorted(_MODULE_OF)
+
+
+def __getattr__(name):
+    module = _MODULE_OF.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{module}", __name__), name)
+    globals()[name] = value  # Later lookups skip __getattr__
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -0,0 +1,68 @@
+"""Asyncio batch runner for API-bound work.
+
+AsyncBatch runs one coroutine per item on a private event loop in a background
+thread. A semaphore bounds how many items are in flight, request() applies a
+per-request deadline and cancel() stops everything immediately, including calls
+that are still waiting for the server.
+"""
+import asyncio
+import threading
+
+
+class AsyncBatch:
+    def __init__(self, concurrency=8, deadline=90.0):
+        self.concurrency = max(1, int(concurrency))
+        self.deadline = deadline
+        self.loop = None
+        self.tasks = []
+        self.cancelled = False
+        self.thread = None
+
+    def start(self, items, job, on_finished=None):
+        """Run job(item) for every item in a background thread; on_finished() is called from that thread"""
+        def run():
+            try:
+                asyncio.run(self._main(items, job))
+            finally:
+                if on_finished:
+                    on_finished()
+        self.thread = threading.Thread(target=run, daemon=True)
+        self.thread.start()
+        return self.thread
+
+    def run(self, items, job):
+        """Blocking variant of start() for scripts and benchmarks"""
+        asyncio.run(self._main(items, job))
+
+    async def _main(self, items, job):
+        self.loop = asyncio.get_running_loop()
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def guarded(item):
+            async with semaphore:
+                await job(item)
+
+        self.tasks = [asyncio.ensure_future(guarded(item)) for item in items]
+        if self.cancelled:
+            self._cancel_all()
+        results = await asyncio.gather(*self.tasks, return_exceptions=True)
+        for result in results:
+            if isinstance(result, Exception):
+                print(f"Async job failed: {result}")
+
+    async def request(self, coro):
+        """Await one API call, giving up after the per-request deadline"""
+        return await asyncio.wait_for(coro, self.deadline)
+
+    def cancel(self):
+        """Cancel all pending and running jobs; safe to call from any thread"""
+        self.cancelled = True
+        if self.loop and not self.loop.is_closed():
+            try:
+                self.loop.call_soon_threadsafe(self._cancel_all)
+            except RuntimeError:  # Loop already finished
+                pass
+
+    def _cancel_all(self):
+        for task in self.tasks:
+            task.cancel()
@@ -0,0 +1,162 @@
+"""ZIP archive rewriting engine.
+
+Members are renamed by copying their compressed bytes as they are: compression
+method, date_time, attributes and comments are kept and nothing is inflated or
+deflated again. Names come from a template; members that share a stem (a
+JPG+EPS pair) share a number, and the result is always unique.
+
+rename_archives() rewrites many archives at once on a thread pool (zlib
+releases the GIL, so this uses every core). A shared semaphore bounds how many
+workers read or write the disk at the same time, and a cancel event stops the
+batch between chunks, leaving every original untouched.
+"""
+import os
+import struct
+import threading
+
+from .fileio import BUFFER_SIZE, replace_file
+
+# Workers allowed to read or write archive data at the same time
+IO_LIMIT = 4
+# {name} new base name, {n} number of the member's stem group, {stem}/{ext} of the original member
+MEMBER_TEMPLATE = "{name}{ext}"
+MEMBER_TEMPLATE_NUMBERED = "{name}_{n}{ext}"
+_LOCAL_HEADER = struct.Struct("<4s2B4HL2L2H")
+_DATA_DESCRIPTOR_FLAG = 0x08
+_ZIP64_LIMIT = (1 << 31) - 1
+
+
+class ArchiveCancelled(Exception):
+    pass
+
+
+def member_names(filenames, new_name, template=None):
+    """Map each member file name to a unique new name, keeping its folder
+
+    Without a template, a single file or pair becomes name.ext and anything
+    more name_1.ext, name_2.ext, ... with both files of a pair on one number.
+    """
+    groups, names = {}, {}
+    for filename in filenames:
+        folder, base = filename.rpartition("/")[::2]
+        groups.setdefault((folder, os.path.splitext(base)[0].lower()), len(groups) + 1)
+    if template is None:
+        template = MEMBER_TEMPLATE if len(groups) == 1 else MEMBER_TEMPLATE_NUMBERED
+    taken = set()
+    for filename in filenames:
+        folder, base = filename.rpartition("/")[::2]
+        stem, ext = os.path.splitext(base)
+        n = groups[(folder, stem.lower())]
+        new_base = template.format(name=new_name, n=n, stem=stem, ext=ext)
+        new_stem, new_ext = os.path.splitext(new_base)
+        counter = 2
+        while f"{folder}/{new_base}".lower() in taken:
+            new_base = f"{new_stem}_{counter}{new_ext}"
+            counter += 1
+        taken.add(f"{folder}/{new_base}".lower())
+        names[filename] = f"{folder}/{new_base}" if folder else new_base
+    return names
+
+
+def _strip_zip64_extra(extra):
+    """Drop the ZIP64 extra block; FileHeader and the central directory add a fresh one when needed"""
+    out, i = b"", 0
+    while i + 4 <= len(extra):
+        block_id, size = struct.unpack("<HH", extra[i:i + 4])
+        if block_id != 1:
+            out += extra[i:i + 4 + size]
+        i += 4 + size
+    return out
+
+
+def _copy_raw(zin, zout, item, new_filename, io_slots, cancel):
+    """Append item's compressed data to zout under a new name, without recompressing"""
+    import zipfile
+    info = zipfile.ZipInfo(new_filename, item.date_time)
+    for attr in ("compress_type", "comment", "create_system", "create_version", "extract_version",
+                 "flag_bits", "internal_attr", "external_attr", "CRC", "compress_size", "file_size"):
+        setattr(info, attr, getattr(item, attr))
+    info.extra = _strip_zip64_extra(item.extra)
+    zip64 = item.file_size > _ZIP64_LIMIT or item.compress_size > _ZIP64_LIMIT
+    # Find the data start from the source's local header (its extra field may differ from the central one)
+    with io_slots:
+        zin.fp.seek(item.header_offset)
+        header = _LOCAL_HEADER.unpack(zin.fp.read(_LOCAL_HEADER.size))
+    data_offset = item.header_offset + _LOCAL_HEADER.size + header[-2] + header[-1]
+    with zout._lock:
+        zout.fp.seek(zout.start_dir)
+        info.header_offset = zout.fp.tell()
+        zout.fp.write(info.FileHeader(zip64))
+        remaining, position = item.compress_size, data_offset
+        while remaining:
+            if cancel is not None and cancel.is_set():
+                raise ArchiveCancelled()
+            with io_slots:
+                zin.fp.seek(position)
+                block = zin.fp.read(min(remaining, BUFFER_SIZE))
+                if not block:
+                    raise zipfile.BadZipFile(f"Truncated member {item.filename}")
+                zout.fp.write(block)
+            remaining -= len(block)
+            position += len(block)
+        if info.flag_bits & _DATA_DESCRIPTOR_FLAG:
+            # Kept as-is so encrypted members still verify passwords the same way
+            fmt = "<4sLQQ" if zip64 else "<4sLLL"
+            zout.fp.write(struct.pack(fmt, b"PK\x07\x08", info.CRC, info.compress_size, info.file_size))
+        zout.start_dir = zout.fp.tell()
+        zout.filelist.append(info)
+        zout.NameToInfo[info.filename] = info
+        zout._didModify = True
+
+
+def rename_zip_members(zip_path, new_name, io_slots=None, cancel=None, template=None):
+    """Rename the files inside a ZIP archive after new_name (see member_names), in place
+
+    Compressed data is copied in BUFFER_SIZE blocks, so memory use does not
+    depend on member size. Raises ArchiveCancelled when cancel is set mid-way.
+    """
+    import zipfile  # Pulls in importlib.metadata and friends, only load it when needed
+    io_slots = io_slots or threading.BoundedSemaphore(1)
+
+    def write(f):
+        with zipfile.ZipFile(zip_path, 'r') as zin, zipfile.ZipFile(f, 'w') as zout:
+            zout.comment = zin.comment
+            items = zin.infolist()
+            names = member_names([i.filename for i in items if not i.is_dir()], new_name, template)
+            for item in items:
+                _copy_raw(zin, zout, item, names.get(item.filename, item.filename), io_slots, cancel)
+
+    replace_file(zip_path, write)
+
+
+def rename_archives(jobs, workers=None, io_limit=IO_LIMIT, cancel=None, on_done=None):
+    """Run rename_zip_members for every (zip path, new name) job in parallel
+
+    on_done(zip_path, error) is called from the worker threads after each
+    archive (error is None on success). Returns a list of (zip path, error
+    message) for the archives that failed; cancelled archives are not listed.
+    """
+    if not jobs:
+        return []
+    io_slots = threading.BoundedSemaphore(io_limit)
+    failures = []
+
+    def one(job):
+        zip_path, new_name = job
+        if cancel is not None and cancel.is_set():
+            return
+        try:
+            rename_zip_members(zip_path, new_name, io_slots, cancel)
+            error = None
+        except ArchiveCancelled:
+            return
+        except Exception as e:
+            error = str(e)
+            failures.append((zip_path, error))
+        if on_done:
+            on_done(zip_path, error)
+
+    from concurrent.futures import ThreadPoolExecutor
+    with ThreadPoolExecutor(max_workers=min(len(jobs), workers or os.cpu_count() or 1)) as pool:
+        list(pool.map(one, jobs))
+    return failures
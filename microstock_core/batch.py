@@ -0,0 +1,72 @@
+"""Batch template engine used by the metadata editors."""
+import os
+
+from .metadata import (exif_text_fields, load_exif_dict, merge_xmp, parse_xmp_fields, read_raw_metadata,
+                       split_keywords, update_exif_fields, update_file_metadata)
+
+# Field modes used by batch mode
+MODE_REPLACE = "Replace"
+MODE_MERGE = "Merge"
+MODE_KEEP = "Keep"
+FIELD_MODES = (MODE_REPLACE, MODE_MERGE, MODE_KEEP)
+
+
+def render_template(template, path, index):
+    """Fill {filename} and {index} tokens for one file"""
+    stem = os.path.splitext(os.path.basename(path))[0]
+    return template.replace("{filename}", stem).replace("{index}", str(index))
+
+
+def merge_field(name, existing, new, mode):
+    """Combine an existing field value with the new one according to mode"""
+    if name == "rating":
+        return new if mode == MODE_REPLACE or existing is None else existing
+    if mode == MODE_KEEP or not new:
+        return existing
+    if name == "subject":
+        merged = list(existing) if mode == MODE_MERGE else []
+        seen = {k.lower() for k in merged}
+        for k in new:
+            if k.lower() not in seen:
+                seen.add(k.lower())
+                merged.append(k)
+        return merged
+    if mode == MODE_REPLACE or not existing:
+        return new
+    return existing if new in existing else f"{existing} {new}"
+
+
+def apply_batch_template(path, index, template, modes):
+    """Apply a field template to one file in place (used by batch mode); returns False if nothing changed
+
+    Only the rating and keywords of the XMP packet are touched, and capture
+    dates are never changed.
+    """
+    exif_bytes, xmp_bytes = read_raw_metadata(path)
+    exif_dict = load_exif_dict(exif_bytes)
+    existing = exif_text_fields(exif_dict)
+    xmp_fields = parse_xmp_fields(xmp_bytes)
+    existing["rating"], existing["subject"] = xmp_fields["rating"], xmp_fields["subject"]
+
+    values = {}
+    for name in ("title", "artist", "copyright", "comment"):
+        values[name] = merge_field(name, existing[name], render_template(template[name], path, index), modes[name])
+    keywords = split_keywords(render_template(template["subject"], path, index))
+    values["subject"] = merge_field("subject", existing["subject"], keywords, modes["subject"])
+    values["rating"] = merge_field("rating", existing["rating"], template["rating"], modes["rating"])
+
+    # Unchanged fields are already in exif_dict, only write the ones that differ
+    changed = False
+    for name in ("title", "artist", "copyright", "comment"):
+        if values[name] == existing[name]:
+            values[name] = ""
+        else:
+            changed = True
+    xmp_changed = values["rating"] != existing["rating"] or values["subject"] != existing["subject"]
+    if not changed and not xmp_changed:
+        return False
+    update_exif_fields(exif_dict, values, capture_dates=False)
+    xmp = merge_xmp(xmp_bytes, values["rating"] or 0, values["subject"]) if xmp_changed else xmp_bytes
+
+    update_file_metadata(path, exif_dict, xmp)
+    return True
@@ -0,0 +1,178 @@
+"""Image format conversion under a shared memory budget.
+
+Decoded images are big: a 150 MP panorama is 450 MB as RGB, and a 16-bit
+TIFF twice that before conversion. convert_to_jpeg estimates each job's peak
+from the image header and reserves it from a MemoryBudget before decoding, so
+conversions running side by side never hold more than the budget in pixels.
+JPEG sources are copied without decoding at all.
+"""
+import io
+import os
+import shutil
+import tempfile
+import threading
+from contextlib import contextmanager, nullcontext
+
+from .fileio import BUFFER_SIZE, replace_file
+
+# Share of physical memory used for decoded pixels when no budget is configured
+MEMORY_FRACTION = 0.25
+FALLBACK_BUDGET = 2 * 1024 ** 3
+# Decoded bytes per pixel by PIL mode; anything else counts as 4
+MODE_BYTES = {"1": 1, "L": 1, "P": 1, "LA": 2, "PA": 2, "La": 2, "I;16": 2, "I;16L": 2, "I;16B": 2, "I;16N": 2,
+              "RGB": 3, "YCbCr": 3, "LAB": 3, "HSV": 3, "RGBA": 4, "RGBa": 4, "RGBX": 4, "CMYK": 4, "I": 4, "F": 4}
+# Modes written to JPEG as they are; others are converted first
+JPEG_MODES = ("RGB", "L", "CMYK")
+# Encoder buffers, EXIF and PIL bookkeeping on top of the pixel data
+OVERHEAD_BYTES = 16 * 1024 * 1024
+
+
+def default_memory_budget():
+    """MEMORY_FRACTION of physical memory, or FALLBACK_BUDGET where it cannot be read"""
+    try:
+        return int(os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") * MEMORY_FRACTION)
+    except (AttributeError, ValueError, OSError):
+        return FALLBACK_BUDGET  # Windows has no sysconf
+
+
+class MemoryBudget:
+    """Bytes of decoded image data that conversions may hold at once
+
+    reserve() blocks until the request fits. A job larger than the whole
+    budget waits until nothing else runs, then runs alone, so it is slow
+    instead of failing.
+    """
+
+    def __init__(self, limit=None):
+        self.limit = limit or default_memory_budget()
+        self.used = 0
+        self.peak = 0
+        self.condition = threading.Condition()
+
+    @contextmanager
+    def reserve(self, nbytes):
+        nbytes = min(nbytes, self.limit)
+        with self.condition:
+            self.condition.wait_for(lambda: self.used + nbytes <= self.limit)
+            self.used += nbytes
+            self.peak = max(self.peak, self.used)
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.used -= nbytes
+                self.condition.notify_all()
+
+
+def conversion_memory(img):
+    """Peak bytes convert_to_jpeg needs for an opened (not yet decoded) image"""
+    pixels = img.size[0] * img.size[1]
+    need = pixels * MODE_BYTES.get(img.mode, 4)
+    if img.mode.startswith("I;16"):
+        need += pixels * 5  # 32-bit intermediate, then 8-bit grey
+    elif img.mode not in JPEG_MODES:
+        need += pixels * 3  # RGB copy; the source is freed before encoding
+    return need + OVERHEAD_BYTES
+
+
+def estimate_conversion_memory(path):
+    """conversion_memory() from the file header alone; JPEG sources need none"""
+    from PIL import Image
+    with Image.open(path) as img:
+        return 0 if img.format == "JPEG" else conversion_memory(img)
+
+
+def _to_jpeg_mode(img):
+    if img.mode.startswith("I;16"):
+        # Scale 16-bit grey down to 8 bits instead of letting convert() clip it at 255
+        return img.convert("I").point(lambda v: v * (1 / 256)).convert("L")
+    if img.mode not in JPEG_MODES:  # Drops alpha/palette
+        return img.convert("RGB")
+    return img
+
+
+def convert_to_jpeg(src_path, dst_path=None, quality=90, budget=None):
+    """Convert an image to JPEG, keeping its EXIF. Returns the JPEG path (a temp file if dst_path is None)
+
+    JPEG sources are copied byte for byte. Other images reserve their
+    estimated decode memory from budget (a MemoryBudget) before loading.
+    """
+    from PIL import Image  # Imported on first use to keep tool startup fast
+    if dst_path is None:
+        fd, dst_path = tempfile.mkstemp(suffix=".jpg")
+        os.close(fd)
+    with Image.open(src_path) as source:
+        if source.format == "JPEG":
+            source.close()
+            if os.path.abspath(src_path) != os.path.abspath(dst_path):
+                with open(src_path, "rb") as f:
+                    replace_file(dst_path, lambda out: shutil.copyfileobj(f, out, BUFFER_SIZE))
+            return dst_path
+        exif_data = source.info.get('exif')
+        with budget.reserve(conversion_memory(source)) if budget else nullcontext():
+            img = _to_jpeg_mode(source)
+            if img is not source:
+                source.close()  # Frees the decoded source before the encoder allocates its buffers
+            save_args = {"quality": quality, "optimize": True}
+            if exif_data:
+                save_args["exif"] = exif_data
+            # The source may be the destination itself, so it is only replaced once fully written
+            replace_file(dst_path, lambda f: img.save(f, "JPEG", **save_args))
+            img.close()
+    return dst_path
+
+
+def convert_many(jobs, budget=None, workers=None, on_done=None):
+    """Run convert_to_jpeg for (src, dst) jobs on a thread pool under one MemoryBudget
+
+    Pillow releases the GIL while decoding and encoding, so jobs overlap;
+    the budget decides how many big images are decoded at once.
+    on_done(src, dst, error) follows each job. Returns [(src, error)].
+    """
+    budget = budget or MemoryBudget()
+    failures, lock = [], threading.Lock()
+
+    def run(job):
+        src, dst = job
+        try:
+            convert_to_jpeg(src, dst, budget=budget)
+            error = None
+        except Exception as e:
+            error = str(e)
+            with lock:
+                failures.append((src, error))
+        if on_done:
+            on_done(src, dst, error)
+
+    from concurrent.futures import ThreadPoolExecutor
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 4) as pool:
+        list(pool.map(run, jobs))
+    return failures
+
+
+# Formats Gemini accepts as inline data, keyed by probe_image() format name
+UPLOAD_MIME_TYPES = {"JPEG": "image/jpeg", "PNG": "image/png", "WEBP": "image/webp"}
+
+
+def image_upload_part(path, max_side=None, quality=90):
+    """Inline image part for generate_content
+
+    Files Gemini accepts are sent as-is when they fit within max_side; anything else
+    is decoded (JPEG in draft mode), downsized to max_side and encoded as JPEG.
+    """
+    from PIL import Image
+    from .scanning import probe_image
+    mime_type = UPLOAD_MIME_TYPES.get(probe_image(path))
+    with Image.open(path) as img:
+        if mime_type and (not max_side or max(img.size) <= max_side):
+            with open(path, 'rb') as f:
+                return {"mime_type": mime_type, "data": f.read()}
+        if max_side:
+            img.draft('RGB', (max_side, max_side))  # JPEG only: decode at a reduced scale
+        if img.mode not in ('RGB', 'L'):
+            img = img.convert('RGB')
+        if max_side and max(img.size) > max_side:
+            img.thumbnail((max_side, max_side), Image.LANCZOS, reducing_gap=3.0)
+        buf = io.BytesIO()
+        img.save(buf, "JPEG", quality=quality)
+    return {"mime_type": "image/jpeg", "data": buf.getvalue()}
@@ -0,0 +1,118 @@
+"""CSV export in the column layouts the stock agencies import.
+
+StreamingCsvWriter appends one row per finished item, so a batch never needs a
+final pass over everything; export_items() writes a whole list through the same
+writer in one pass.
+"""
+import csv
+import threading
+import time
+from typing import NamedTuple
+
+from .fileio import BUFFER_SIZE
+
+
+class CsvProfile(NamedTuple):
+    columns: tuple                  # (header, item key or None for an empty column)
+    delimiter: str = ","
+    keyword_separator: str = ", "
+    max_keywords: int = 0           # 0 = no limit
+    max_title: int = 0              # Characters, cut at a word boundary
+    max_description: int = 0
+
+
+CSV_PROFILES = {
+    "Default": CsvProfile(
+        (("filename", "filename"), ("filepath", "filepath"), ("title", "title"), ("keyword", "keyword"),
+         ("description", "description"), ("status", "status"), ("input_tokens", "input_tokens"),
+         ("output_tokens", "output_tokens"), ("cost_usd", "cost_usd"))),
+    "Adobe Stock": CsvProfile(
+        (("Filename", "filename"), ("Title", "title"), ("Keywords", "keyword"), ("Category", None),
+         ("Releases", None)),
+        max_keywords=49, max_title=200),
+    "Shutterstock": CsvProfile(
+        (("Filename", "filename"), ("Description", "description"), ("Keywords", "keyword"),
+         ("Categories", None), ("Editorial", None), ("Mature content", None), ("illustration", None)),
+        max_keywords=50, max_description=200),
+    "Freepik": CsvProfile(
+        (("Filename", "filename"), ("Title", "title"), ("Keywords", "keyword"), ("Prompt", None), ("Model", None)),
+        delimiter=";", keyword_separator=",", max_keywords=50, max_title=100),
+    "Vecteezy": CsvProfile(
+        (("Filename", "filename"), ("Title", "title"), ("Description", "description"), ("Keywords", "keyword"),
+         ("License", None)),
+        keyword_separator=",", max_keywords=50, max_title=200),
+    "123RF": CsvProfile(
+        (("oldfilename", "filename"), ("123rf_filename", None), ("description", "description"),
+         ("keywords", "keyword"), ("country", None)),
+        keyword_separator=",", max_keywords=50),
+}
+# Rows are flushed to disk after this many rows or seconds, whichever comes first
+FLUSH_ROWS = 50
+FLUSH_SECONDS = 2.0
+
+
+def _truncate(text, limit):
+    if not limit or len(text) <= limit:
+        return text
+    cut = text[:limit].rsplit(" ", 1)[0]
+    return (cut or text[:limit]).rstrip(" ,.;:")
+
+
+def format_row(item, profile):
+    row = []
+    for _, key in profile.columns:
+        value = "" if key is None else item.get(key, "")
+        if key == "keyword":
+            keywords = [k.strip() for k in str(value).replace(";", ",").split(",") if k.strip()]
+            if profile.max_keywords:
+                keywords = keywords[:profile.max_keywords]
+            value = profile.keyword_separator.join(keywords)
+        elif key == "title":
+            value = _truncate(str(value), profile.max_title)
+        elif key == "description":
+            value = _truncate(str(value), profile.max_description)
+        row.append(value)
+    return row
+
+
+class StreamingCsvWriter:
+    """Appends rows through one buffered file handle; safe to call from several threads"""
+
+    def __init__(self, path, profile):
+        self.profile = profile
+        self.lock = threading.Lock()
+        self.file = open(path, "w", newline="", encoding="utf-8", buffering=BUFFER_SIZE)
+        self.writer = csv.writer(self.file, delimiter=profile.delimiter)
+        self.writer.writerow([header for header, _ in profile.columns])
+        self.rows = 0
+        self.unflushed = 0
+        self.last_flush = time.monotonic()
+
+    def write(self, item):
+        with self.lock:
+            self.writer.writerow(format_row(item, self.profile))
+            self.rows += 1
+            self.unflushed += 1
+            if self.unflushed >= FLUSH_ROWS or time.monotonic() - self.last_flush >= FLUSH_SECONDS:
+                self.file.flush()
+                self.unflushed = 0
+                self.last_flush = time.monotonic()
+
+    def close(self):
+        with self.lock:
+            if not self.file.closed:
+                self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def export_items(path, items, profile):
+    """Write all items in one pass; returns the number of rows"""
+    with StreamingCsvWriter(path, profile) as writer:
+        for item in items:
+            writer.write(item)
+        return writer.rows
@@ -0,0 +1,79 @@
+"""Safe file replacement: same-directory temp files, buffered writes, fsync and atomic replace.
+
+Also home of config_dir(), the per-user settings folder the tools share.
+"""
+import os
+import pathlib
+import shutil
+import sys
+import tempfile
+
+BUFFER_SIZE = 1024 * 1024
+APP_NAME = "ImageMetadataGenerator"
+
+
+def config_dir(app_name=APP_NAME):
+    """The user's own configuration directory for app_name, created if missing"""
+    if sys.platform == "win32":
+        path = pathlib.Path(os.getenv("APPDATA", "")) / app_name
+    elif sys.platform == "darwin":
+        path = pathlib.Path.home() / "Library" / "Application Support" / app_name
+    else:
+        path = pathlib.Path.home() / ".config" / app_name
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def copy_bytes(src, dst, count):
+    """Copy exactly count bytes between file objects in BUFFER_SIZE blocks"""
+    while count > 0:
+        block = src.read(min(count, BUFFER_SIZE))
+        if not block:
+            raise ValueError("Unexpected end of file")
+        dst.write(block)
+        count -= len(block)
+
+
+def create_temp_file(target_path):
+    """Create a unique temp file next to target_path, so the final replace never crosses filesystems"""
+    directory, name = os.path.split(os.path.abspath(target_path))
+    return tempfile.mkstemp(prefix=f".{name}.", suffix=".tmp", dir=directory)
+
+
+def write_temp_file(target_path, write_func):
+    """Write a temp file for target_path through write_func(file), fsync it and return its path"""
+    fd, temp_path = create_temp_file(target_path)
+    try:
+        with os.fdopen(fd, 'wb', buffering=BUFFER_SIZE) as f:
+            write_func(f)
+            f.flush()
+            os.fsync(f.fileno())
+        if os.path.exists(target_path):
+            shutil.copymode(target_path, temp_path)
+        else:
+            os.chmod(temp_path, 0o644)  # mkstemp creates files readable by the owner only
+    except BaseException:
+        os.remove(temp_path)
+        raise
+    return temp_path
+
+
+def atomic_replace(temp_path, target_path):
+    """Atomically move temp_path over target_path and persist the directory entry"""
+    os.replace(temp_path, target_path)
+    if hasattr(os, 'O_DIRECTORY'):  # Not available on Windows
+        dir_fd = os.open(os.path.dirname(os.path.abspath(target_path)), os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+
+def replace_file(target_path, write_func):
+    """Rewrite target_path through write_func(file) without ever leaving it half-written"""
+    temp_path = write_temp_file(target_path, write_func)
+    try:
+        atomic_replace(temp_path, target_path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
@@ -0,0 +1,150 @@
+"""Load edited metadata back from CSV/JSONL and embed it in bulk.
+
+Rows are matched to files by full path, by file name or by content hash, each
+through a dict built once, so applying tens of thousands of rows is a single
+pass. Column names from every CSV profile are understood.
+"""
+import csv
+import hashlib
+import json
+import os
+
+from .fileio import BUFFER_SIZE
+from .metadata import embed_stock_metadata
+
+# Accepted column names (lower case) for each item field
+COLUMN_ALIASES = {
+    "filepath": ("filepath", "path", "file path", "full path"),
+    "filename": ("filename", "file name", "file", "oldfilename", "original filename"),
+    "title": ("title", "image name", "headline"),
+    "keyword": ("keyword", "keywords", "tags"),
+    "description": ("description", "caption"),
+    "hash": ("hash", "sha256", "sha1", "md5", "checksum"),
+}
+
+
+def _canonical(row):
+    """Map a raw row to item keys; unknown columns are dropped"""
+    lowered = {str(k).strip().lower(): v for k, v in row.items() if k is not None}
+    out = {}
+    for key, aliases in COLUMN_ALIASES.items():
+        for alias in aliases:
+            value = lowered.get(alias)
+            if value not in (None, ""):
+                if isinstance(value, (list, tuple)):
+                    value = ", ".join(str(v) for v in value)
+                out[key] = str(value).strip()
+                break
+    return out
+
+
+def read_metadata_rows(path):
+    """Rows of a CSV (any delimiter) or JSON-lines file as dicts with item keys"""
+    rows = []
+    if path.lower().endswith((".jsonl", ".ndjson", ".json")):
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    rows.append(_canonical(json.loads(line)))
+        return rows
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        sample = f.read(64 * 1024)
+        f.seek(0)
+        try:
+            dialect = csv.Sniffer().sniff(sample, delimiters=",;\t")
+        except csv.Error:
+            dialect = csv.excel
+        for row in csv.DictReader(f, dialect=dialect):
+            rows.append(_canonical(row))
+    return rows
+
+
+def file_hash(path, algorithm="sha256"):
+    digest = hashlib.new(algorithm)
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(BUFFER_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class ItemIndex:
+    """Lookup of item dicts by path, file name and (lazily) content hash"""
+
+    def __init__(self, items, workers=8):
+        self.items = items
+        self.workers = workers
+        self.by_path = {os.path.normcase(os.path.abspath(i["filepath"])): i for i in items}
+        self.by_name = {}
+        for item in items:
+            self.by_name.setdefault(os.path.normcase(item["filename"]), item)
+        self.by_hash = {}
+        self.hashed_algorithms = set()
+
+    def _hash_all(self, algorithm):
+        def one(item):
+            try:
+                return file_hash(item["filepath"], algorithm), item
+            except OSError:
+                return None, item
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            for digest, item in pool.map(one, self.items):
+                if digest:
+                    self.by_hash[digest] = item
+        self.hashed_algorithms.add(algorithm)
+
+    def find(self, row):
+        if "filepath" in row:
+            item = self.by_path.get(os.path.normcase(os.path.abspath(row["filepath"])))
+            if item:
+                return item
+        if "filename" in row:
+            item = self.by_name.get(os.path.normcase(os.path.basename(row["filename"])))
+            if item:
+                return item
+        digest = row.get("hash", "").lower()
+        if digest:
+            algorithm = {32: "md5", 40: "sha1"}.get(len(digest), "sha256")
+            if algorithm not in self.hashed_algorithms:
+                self._hash_all(algorithm)
+            return self.by_hash.get(digest)
+        return None
+
+    def register(self, item):
+        """Index an item that was appended to the list after the index was built"""
+        self.by_path[os.path.normcase(os.path.abspath(item["filepath"]))] = item
+        self.by_name.setdefault(os.path.normcase(item["filename"]), item)
+
+
+def resolve_row_path(row, base_dir):
+    """Existing file a row points at when it is not in the list yet, else None"""
+    if "filepath" in row and os.path.isfile(row["filepath"]):
+        return os.path.abspath(row["filepath"])
+    if "filename" in row:
+        candidate = os.path.join(base_dir, os.path.basename(row["filename"]))
+        if os.path.isfile(candidate):
+            return os.path.abspath(candidate)
+    return None
+
+
+def embed_items(items, workers=8, on_done=None):
+    """Embed title/keyword/description into each item's file on a thread pool
+
+    on_done(item, error) is called from the worker threads. Returns a list of
+    (item, error message) for the files that failed.
+    """
+    def one(item):
+        try:
+            embed_stock_metadata(item["filepath"], item.get("title", ""), item.get("keyword", ""),
+                                 item.get("description", ""))
+            error = None
+        except Exception as e:
+            error = str(e)
+        if on_done:
+            on_done(item, error)
+        return item, error
+
+    from concurrent.futures import ThreadPoolExecutor
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return [(item, error) for item, error in pool.map(one, items) if error]
@@ -0,0 +1,204 @@
+"""API-key pool: one reusable client per key, requests spread by remaining quota.
+
+Each key has its own clients (so its own connection), a count of requests in
+flight and the send times of the last minute. Every request goes to the key
+with the most quota left. A key that answers 429 cools down, twice as long
+for each 429 in a row, and its work moves to the other keys. When every key
+is cooling down or out of quota, callers wait for the first one to come back.
+"""
+import asyncio
+import re
+import threading
+import time
+from collections import deque
+
+RATE_WINDOW = 60.0
+COOLDOWN_SECONDS = 15.0
+MAX_COOLDOWN_SECONDS = 300.0
+# How long a waiting caller sleeps at most before looking at the keys again
+WAIT_STEP = 0.5
+# Keys are separated by commas, semicolons or whitespace; "KEY=60" sets a 60 requests/minute quota
+_KEY_SEPARATORS = re.compile(r"[,;\s]+")
+# Exception classes of google.api_core, requests and httpx that mean HTTP 429
+_RATE_LIMIT_TYPES = ("ResourceExhausted", "TooManyRequests")
+# Only for errors without a type or status code: a message starting with the status, or its reason phrase
+_RATE_LIMIT_TEXT = re.compile(r"^\s*429\b|\bresource (?:has been )?exhausted\b|\btoo many requests\b", re.IGNORECASE)
+# Gemini puts the suggested wait into 429 errors as "retry_delay { seconds: 37 }" or "retry in 37.5s"
+_RETRY_DELAY = re.compile(r"retry_delay\s*\{\s*seconds:\s*(\d+)|retry in (\d+(?:\.\d+)?)\s*s", re.IGNORECASE)
+
+
+class KeyPoolCancelled(Exception):
+    """Raised by KeyPool.call() when the cancel event is set while waiting for a key"""
+
+
+def parse_keys(text):
+    """[(key, requests per minute or 0 for unknown)] from the API key field"""
+    keys = []
+    for token in _KEY_SEPARATORS.split(text.strip()):
+        key, _, rpm = token.partition("=")
+        if key and key not in (k for k, _ in keys):
+            keys.append((key, int(rpm) if rpm.isdigit() else 0))
+    return keys
+
+
+def is_rate_limited(error):
+    """True for HTTP 429 errors: by exception type, then status code, then message"""
+    if any(cls.__name__ in _RATE_LIMIT_TYPES for cls in type(error).__mro__):
+        return True
+    for attr in ("code", "status_code"):
+        code = getattr(error, attr, None)
+        if isinstance(code, int):
+            return code == 429
+    return bool(_RATE_LIMIT_TEXT.search(str(error)))
+
+
+def retry_delay(error):
+    """Seconds the server asked us to wait, or None"""
+    match = _RETRY_DELAY.search(str(error))
+    return float(match.group(1) or match.group(2)) if match else None
+
+
+class KeySlot:
+    def __init__(self, key, rpm=0):
+        self.key = key
+        self.rpm = rpm
+        self.label = f"...{key[-4:]}"
+        self.clients = {}  # (model name, event loop or None) -> client
+        self.in_flight = 0
+        self.sent = deque()  # monotonic send times within RATE_WINDOW
+        self.cool_until = 0.0
+        self.strikes = 0  # 429s in a row
+        self.requests = 0
+        self.rate_limited = 0
+
+    def _prune(self, now):
+        while self.sent and now - self.sent[0] >= RATE_WINDOW:
+            self.sent.popleft()
+
+    def remaining(self, now):
+        """Share of this minute's quota left, 0..1 (always 1 when the quota is unknown)"""
+        self._prune(now)
+        if not self.rpm:
+            return 1.0
+        return max(0.0, (self.rpm - len(self.sent)) / self.rpm)  # sent includes the requests in flight
+
+    def ready_in(self, now):
+        """Seconds until this key can take a request (0 = now)"""
+        wait = max(0.0, self.cool_until - now)
+        if self.rpm and self.remaining(now) <= 0:
+            wait = max(wait, RATE_WINDOW - (now - self.sent[0]))  # Out of quota until the oldest request ages out
+        return wait
+
+
+class KeyPool:
+    def __init__(self, keys, make_client, cooldown=COOLDOWN_SECONDS):
+        """keys: strings or (key, requests per minute); make_client(key, model name, asynchronous) builds a client"""
+        self.slots = [KeySlot(*((k, 0) if isinstance(k, str) else k)) for k in keys]
+        if not self.slots:
+            raise ValueError("No API keys given")
+        self.make_client = make_client
+        self.cooldown = cooldown
+        self.condition = threading.Condition()
+
+    def __len__(self):
+        return len(self.slots)
+
+    def client(self, slot, model_name, loop=None):
+        """The slot's client for a model, made once (async clients once per event loop)"""
+        with self.condition:
+            for cache_key in [k for k in slot.clients if k[1] is not None and k[1].is_closed()]:
+                del slot.clients[cache_key]  # Clients of finished batches' loops
+            client = slot.clients.get((model_name, loop))
+        if client is None:
+            client = self.make_client(slot.key, model_name, loop is not None)
+            with self.condition:
+                client = slot.clients.setdefault((model_name, loop), client)
+        return client
+
+    def _pick(self):
+        """(slot, 0) for the key with the most quota left, or (None, seconds until one is ready)"""
+        now = time.monotonic()
+        ready = [s for s in self.slots if s.ready_in(now) == 0]
+        if not ready:
+            return None, min(s.ready_in(now) for s in self.slots)
+        slot = max(ready, key=lambda s: (s.remaining(now), -s.in_flight, -len(s.sent)))
+        slot.in_flight += 1
+        slot.requests += 1
+        slot.sent.append(now)
+        return slot, 0
+
+    def acquire(self, cancel=None):
+        """Reserve a key, waiting while none is available; None if cancel is set first"""
+        with self.condition:
+            while True:
+                slot, wait = self._pick()
+                if slot:
+                    return slot
+                if cancel is not None and cancel.is_set():
+                    return None
+                self.condition.wait(min(wait, WAIT_STEP))
+
+    async def acquire_async(self):
+        while True:
+            with self.condition:
+                slot, wait = self._pick()
+            if slot:
+                return slot
+            await asyncio.sleep(min(wait, WAIT_STEP))
+
+    def release(self, slot, error=None):
+        """Return a key after its request; a rate-limit error starts its cooldown"""
+        with self.condition:
+            slot.in_flight -= 1
+            if isinstance(error, Exception) and is_rate_limited(error):
+                slot.strikes += 1
+                slot.rate_limited += 1
+                seconds = retry_delay(error) or min(self.cooldown * 2 ** (slot.strikes - 1), MAX_COOLDOWN_SECONDS)
+                slot.cool_until = time.monotonic() + seconds
+                print(f"API key {slot.label} rate limited, cooling down for {seconds:.0f}s")
+            elif error is None:
+                slot.strikes = 0
+            self.condition.notify_all()
+
+    def call(self, request, model_name, cancel=None):
+        """request(client) on the best key; a 429 moves it to another key, once per key at most"""
+        last_error = None
+        for _ in range(len(self.slots) + 1):
+            slot = self.acquire(cancel)
+            if slot is None:
+                raise KeyPoolCancelled()
+            try:
+                result = request(self.client(slot, model_name))
+            except BaseException as e:
+                self.release(slot, e)
+                if not isinstance(e, Exception) or not is_rate_limited(e):
+                    raise
+                last_error = e
+                continue
+            self.release(slot)
+            return result
+        raise last_error
+
+    async def call_async(self, request, model_name):
+        """Async twin of call(); request(client) returns an awaitable"""
+        loop = asyncio.get_running_loop()
+        last_error = None
+        for _ in range(len(self.slots) + 1):
+            slot = await self.acquire_async()
+            try:
+                result = await request(self.client(slot, model_name, loop))
+            except BaseException as e:
+                self.release(slot, e)
+                if not isinstance(e, Exception) or not is_rate_limited(e):
+                    raise
+                last_error = e
+                continue
+            self.release(slot)
+            return result
+        raise last_error
+
+    def summary(self):
+        """'...ab12: 40 sent (2 429s), ...cd34: 38 sent' for the status bar"""
+        with self.condition:
+            return ", ".join(f"{s.label}: {s.requests} sent" + (f" ({s.rate_limited} 429s)" if s.rate_limited else "")
+                             for s in self.slots)
@@ -0,0 +1,134 @@
+"""Keyword clean-up: normalization, lemma/synonym folding, dedup and truncation.
+
+KeywordNormalizer turns a model's comma-separated answer into an ordered list
+of unique keywords. Case variants, stray punctuation, plurals and listed
+synonyms count as duplicates; the first spelling wins. Each distinct raw
+keyword is normalized once and memoized, so cleaning a large batch costs
+little more than splitting its strings.
+"""
+import os
+import re
+
+# Stray quotes, brackets, hashtags, bullets and end punctuation around a keyword
+_EDGE_JUNK = re.compile(r"^[\s\"'`#*•·\-\[\](){}]+|[\s\"'`*.!?:\[\](){}]+$")
+_SPACES = re.compile(r"\s+")
+_SEPARATORS = re.compile(r"[,;\n]")
+_PLURAL_RULES = (
+    (re.compile(r"(?<=[^aeiou])ies$"), "y"),
+    # Only endings whose singular cannot end in "e": dresses, boxes, buzzes, dishes, churches. Roses, houses
+    # and sizes fall through to the plain "s" rule, so they key as rose, house and size
+    (re.compile(r"(?:(?<=ss)|(?<=zz)|(?<=x)|(?<=ch)|(?<=sh))es$"), ""),
+    (re.compile(r"(?<=[^siu])s$"), ""),
+)
+# Words that end like plurals but are not, or whose singular is a different keyword
+NOT_PLURAL = frozenset((
+    "news", "series", "species", "physics", "economics", "politics", "athletics", "gymnastics", "mathematics",
+    "jeans", "pants", "shorts", "trousers", "scissors", "clothes", "glasses", "sunglasses", "binoculars",
+    "lens", "canvas", "atlas", "bias", "christmas", "texas", "paris", "thanks", "sales", "goods", "arts",
+))
+# Irregular plural -> singular, used only to detect duplicates
+LEMMAS = {
+    "children": "child", "women": "woman", "men": "man", "feet": "foot", "teeth": "tooth", "mice": "mouse",
+    "geese": "goose", "leaves": "leaf", "knives": "knife", "wolves": "wolf", "shelves": "shelf",
+    "loaves": "loaf", "halves": "half", "wives": "wife", "lives": "life", "calves": "calf", "cacti": "cactus",
+    "fungi": "fungus", "oxen": "ox", "dice": "die", "potatoes": "potato", "tomatoes": "tomato",
+    "heroes": "hero", "berries": "berry", "buses": "bus", "gases": "gas", "lenses": "lens",
+    "quizzes": "quiz", "aches": "ache", "headaches": "headache", "toothaches": "toothache",
+}
+# Spelling variants -> the spelling that is kept
+SYNONYMS = {
+    "colour": "color", "colours": "colors", "colourful": "colorful", "centre": "center", "theatre": "theater",
+    "e-mail": "email", "web site": "website", "wi-fi": "wifi", "t shirt": "t-shirt", "tshirt": "t-shirt",
+    "x-mas": "christmas", "xmas": "christmas", "3-d": "3d", "aeroplane": "airplane",
+}
+CACHE_LIMIT = 200_000
+
+
+def load_synonyms(path):
+    """Read 'variant = keyword' lines (# starts a comment); a missing file gives {}"""
+    synonyms = {}
+    if not path or not os.path.isfile(path):
+        return synonyms
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.split("#", 1)[0]
+            if "=" in line:
+                variant, keyword = (_SPACES.sub(" ", part).strip().lower() for part in line.split("=", 1))
+                if variant and keyword:
+                    synonyms[variant] = keyword
+    return synonyms
+
+
+class KeywordNormalizer:
+    def __init__(self, synonyms=None, lemmas=None):
+        self.synonyms = dict(SYNONYMS)
+        self.synonyms.update(synonyms or {})
+        self.lemmas = dict(LEMMAS)
+        self.lemmas.update(lemmas or {})
+        self.cache = {}  # raw keyword -> (kept spelling, dedup key) or None
+
+    @classmethod
+    def from_file(cls, path):
+        """Built-in tables plus the user's synonym file, loaded once"""
+        return cls(load_synonyms(path))
+
+    def _singular(self, word):
+        if word in self.lemmas:
+            return self.lemmas[word]
+        if len(word) <= 3 or word in NOT_PLURAL:
+            return word
+        for pattern, replacement in _PLURAL_RULES:
+            singular, count = pattern.subn(replacement, word)
+            if count:
+                return singular
+        return word
+
+    def normalize(self, raw):
+        """(kept spelling, dedup key) for one raw keyword, or None when nothing is left"""
+        cached = self.cache.get(raw)
+        if cached is not None or raw in self.cache:
+            return cached
+        keyword = _SPACES.sub(" ", _EDGE_JUNK.sub("", raw))
+        if keyword:
+            folded = keyword.casefold()  # Case only matters for the dedup key; the spelling is kept as written
+            if folded in self.synonyms:
+                keyword = folded = self.synonyms[folded]
+            head, _, last = folded.rpartition(" ")
+            key = (head + " " if head else "") + self._singular(last)
+            result = (keyword, self.synonyms.get(key, key))
+        else:
+            result = None
+        if len(self.cache) >= CACHE_LIMIT:
+            self.cache.clear()
+        self.cache[raw] = result
+        return result
+
+    def clean(self, keywords, limit=0):
+        """Ordered unique keywords from a separated string or a list, at most limit (0 = all)"""
+        if isinstance(keywords, str):
+            keywords = _SEPARATORS.split(keywords)
+        normalize = self.normalize
+        seen, out = set(), []
+        for raw in keywords:
+            result = normalize(raw)
+            if result is None or result[1] in seen:
+                continue
+            seen.add(result[1])
+            out.append(result[0])
+            if limit and len(out) >= limit:
+                break
+        return out
+
+    def clean_text(self, keywords, limit=0, separator=", "):
+        return separator.join(self.clean(keywords, limit))
+
+    def clean_items(self, items, limit=0, key="keyword"):
+        """Clean every item's keyword string in place; returns how many changed"""
+        changed = 0
+        for item in items:
+            before = item.get(key, "")
+            after = self.clean_text(before, limit)
+            if after != before:
+                item[key] = after
+                changed += 1
+        return changed
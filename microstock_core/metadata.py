@@ -0,0 +1,491 @@
+"""GUI-free metadata engine: header-only reading and lossless EXIF/XMP writing.
+
+PIL is only imported for formats that need it (TIFF and others), and piexif
+only when EXIF is parsed or written, so the tools using this module start
+without loading either.
+"""
+import io
+import os
+import shutil
+import struct
+import zlib
+from datetime import datetime
+from functools import lru_cache
+from typing import NamedTuple
+from html import escape
+import xml.etree.ElementTree as ET
+
+from .fileio import BUFFER_SIZE, copy_bytes, replace_file
+
+XMP_APP1_HEADER = b"http://ns.adobe.com/xap/1.0/\x00"
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+EMBEDDABLE_EXTENSIONS = ('.jpg', '.jpeg', '.tif', '.tiff')
+TIFF_XMP_TAG = 700
+NS = {
+    "rdf": "http://www.w3.org/1999/02/22-rdf-syntax-ns#",
+    "dc": "http://purl.org/dc/elements/1.1/",
+    "xmp": "http://ns.adobe.com/xap/1.0/",
+}
+
+
+def _is_png_xmp_chunk(chunk_type, payload):
+    return chunk_type == b"iTXt" and payload.startswith(b"XML:com.adobe.xmp\x00")
+
+
+def _png_chunk(chunk_type, payload):
+    return (struct.pack(">I", len(payload)) + chunk_type + payload
+            + struct.pack(">I", zlib.crc32(chunk_type + payload) & 0xFFFFFFFF))
+
+
+def _read_png_xmp(payload):
+    # keyword\0 compression_flag compression_method language\0 translated\0 text
+    rest = payload[len(b"XML:com.adobe.xmp\x00") + 2:]
+    rest = rest[rest.index(b"\x00") + 1:]
+    text = rest[rest.index(b"\x00") + 1:]
+    return zlib.decompress(text) if payload[18] == 1 else text
+
+
+def read_metadata_blocks(f):
+    """Return the raw (exif, xmp, iptc) blocks of a JPEG or PNG file object.
+
+    Only the header segments/chunks are read, pixel data is skipped with seek().
+    """
+    exif_bytes, xmp_bytes, iptc_bytes = None, None, None
+    signature = f.read(8)
+    if signature[:2] == b"\xff\xd8":
+        f.seek(2)
+        while True:
+            head = f.read(2)
+            if len(head) < 2 or head[0] != 0xFF:
+                break
+            marker = head[1]
+            while marker == 0xFF:  # Fill bytes
+                marker = f.read(1)[0]
+            if marker in (0xDA, 0xD9):  # Start of scan / end of image
+                break
+            if marker == 0x01 or 0xD0 <= marker <= 0xD7:
+                continue
+            length = struct.unpack(">H", f.read(2))[0] - 2
+            if marker not in (0xE1, 0xED):
+                f.seek(length, os.SEEK_CUR)
+                continue
+            payload = f.read(length)
+            if payload.startswith(b"Exif\x00\x00") and exif_bytes is None:
+                exif_bytes = payload
+            elif payload.startswith(XMP_APP1_HEADER) and xmp_bytes is None:
+                xmp_bytes = payload[len(XMP_APP1_HEADER):]
+            elif payload.startswith(b"Photoshop 3.0\x00") and iptc_bytes is None:
+                iptc_bytes = payload
+    elif signature == PNG_SIGNATURE:
+        while True:
+            head = f.read(8)
+            if len(head) < 8:
+                break
+            length = struct.unpack(">I", head[:4])[0]
+            chunk_type = head[4:]
+            if chunk_type == b"IEND":
+                break
+            if chunk_type not in (b"eXIf", b"iTXt"):
+                f.seek(length + 4, os.SEEK_CUR)
+                continue
+            payload = f.read(length)
+            f.seek(4, os.SEEK_CUR)  # CRC
+            if chunk_type == b"eXIf":
+                exif_bytes = b"Exif\x00\x00" + payload
+            elif _is_png_xmp_chunk(chunk_type, payload):
+                xmp_bytes = _read_png_xmp(payload)
+    else:
+        raise ValueError("Unsupported format for header-level access")
+    return exif_bytes, xmp_bytes, iptc_bytes
+
+
+def write_jpeg_metadata(src, dst, exif_bytes, xmp_bytes):
+    """Stream a JPEG from src to dst with new EXIF/XMP segments, copying the compressed image data untouched"""
+    app1 = b""
+    for payload in (exif_bytes, XMP_APP1_HEADER + xmp_bytes if xmp_bytes else None):
+        if not payload:
+            continue
+        if len(payload) + 2 > 0xFFFF:
+            raise ValueError("Metadata block too large for a JPEG segment")
+        app1 += b"\xff\xe1" + struct.pack(">H", len(payload) + 2) + payload
+
+    if src.read(2) != b"\xff\xd8":
+        raise ValueError("Not a JPEG file")
+    dst.write(b"\xff\xd8")
+    inserted = False
+    while True:
+        head = src.read(2)
+        if len(head) < 2 or head[0] != 0xFF:
+            raise ValueError("Corrupt JPEG header")
+        marker = head[1]
+        while marker == 0xFF:  # Fill bytes
+            marker = src.read(1)[0]
+        head = bytes((0xFF, marker))
+        if marker in (0xDA, 0xD9):  # Start of scan / end of image: the rest is copied as is
+            if not inserted:
+                dst.write(app1)
+            dst.write(head)
+            shutil.copyfileobj(src, dst, BUFFER_SIZE)
+            return
+        if marker == 0x01 or 0xD0 <= marker <= 0xD7:
+            dst.write(head)
+            continue
+        length_bytes = src.read(2)
+        length = struct.unpack(">H", length_bytes)[0] - 2
+        if marker == 0xE1:
+            payload = src.read(length)
+            if payload.startswith((b"Exif\x00\x00", XMP_APP1_HEADER)):
+                continue  # Replaced by the new segments
+        if not inserted and marker != 0xE0:  # Keep JFIF APP0 first
+            dst.write(app1)
+            inserted = True
+        dst.write(head + length_bytes)
+        if marker == 0xE1:
+            dst.write(payload)
+        else:
+            copy_bytes(src, dst, length)
+
+
+def write_png_metadata(src, dst, exif_bytes, xmp_bytes):
+    """Stream a PNG from src to dst with new eXIf/XMP chunks, copying the image chunks untouched"""
+    if src.read(8) != PNG_SIGNATURE:
+        raise ValueError("Not a PNG file")
+    dst.write(PNG_SIGNATURE)
+    inserted = False
+    while True:
+        head = src.read(8)
+        if len(head) < 8:
+            return
+        length = struct.unpack(">I", head[:4])[0]
+        chunk_type = head[4:]
+        if chunk_type in (b"eXIf", b"iTXt"):
+            payload = src.read(length + 4)
+            if chunk_type == b"eXIf" or _is_png_xmp_chunk(chunk_type, payload):
+                continue  # Replaced by the new chunks
+            dst.write(head + payload)
+            continue
+        if not inserted and chunk_type == b"IDAT":
+            if exif_bytes:
+                dst.write(_png_chunk(b"eXIf", exif_bytes[6:] if exif_bytes.startswith(b"Exif") else exif_bytes))
+            if xmp_bytes:
+                dst.write(_png_chunk(b"iTXt", b"XML:com.adobe.xmp\x00\x00\x00\x00\x00" + xmp_bytes))
+            inserted = True
+        dst.write(head)
+        copy_bytes(src, dst, length + 4)
+        if chunk_type == b"IEND":
+            return
+
+
+def _xmp_text(desc, path):
+    """Text of the first rdf:li under path (rdf:Alt/Seq/Bag) or of the element itself"""
+    node = desc.find(path, NS)
+    if node is None:
+        return ""
+    li = node.find("*/rdf:li", NS)
+    return ((li if li is not None else node).text or "").strip()
+
+
+def parse_xmp_fields(xmp_bytes):
+    """Parse an XMP packet into title/artist/copyright/rating/subject fields"""
+    fields = {"title": "", "description": "", "artist": "", "copyright": "",
+              "rating": None, "subject": []}
+    if not xmp_bytes:
+        return fields
+    try:
+        root = ET.fromstring(xmp_bytes.strip(b"\x00 \r\n\t"))
+    except ET.ParseError:
+        return fields
+    for desc in root.iter("{%s}Description" % NS["rdf"]):
+        rating = desc.get("{%s}Rating" % NS["xmp"])
+        if rating is None:
+            node = desc.find("xmp:Rating", NS)
+            rating = node.text if node is not None else None
+        if rating is not None:
+            try:
+                fields["rating"] = int(float(rating))
+            except ValueError:
+                pass
+        for name, path in (("title", "dc:title"), ("description", "dc:description"),
+                           ("artist", "dc:creator"), ("copyright", "dc:rights")):
+            fields[name] = fields[name] or _xmp_text(desc, path)
+        for li in desc.findall("dc:subject/*/rdf:li", NS):
+            if li.text:
+                fields["subject"].append(li.text.strip())
+    return fields
+
+
+def parse_iptc_fields(app13_bytes):
+    """Parse the IPTC-IIM record of a Photoshop APP13 segment"""
+    fields = {"title": "", "description": "", "artist": "", "copyright": "", "subject": []}
+    if not app13_bytes:
+        return fields
+    data = app13_bytes[len(b"Photoshop 3.0\x00"):]
+    pos = 0
+    iptc = b""
+    # 8BIM resource blocks: signature, id, padded pascal name, size, padded data
+    while pos + 12 <= len(data) and data[pos:pos + 4] == b"8BIM":
+        resource_id = struct.unpack(">H", data[pos + 4:pos + 6])[0]
+        name_len = data[pos + 6]
+        pos += 6 + name_len + 1 + ((name_len + 1) % 2)
+        size = struct.unpack(">I", data[pos:pos + 4])[0]
+        pos += 4
+        if resource_id == 0x0404:
+            iptc = data[pos:pos + size]
+            break
+        pos += size + (size % 2)
+    datasets = {5: "title", 120: "description", 80: "artist", 116: "copyright"}
+    pos = 0
+    while pos + 5 <= len(iptc) and iptc[pos] == 0x1C:
+        record, dataset = iptc[pos + 1], iptc[pos + 2]
+        size = struct.unpack(">H", iptc[pos + 3:pos + 5])[0]
+        if size & 0x8000:  # Extended datasets are never text fields
+            break
+        value = iptc[pos + 5:pos + 5 + size].decode('utf-8', errors='ignore').strip()
+        if record == 2 and dataset == 25:
+            fields["subject"].append(value)
+        elif record == 2 and dataset in datasets and not fields[datasets[dataset]]:
+            fields[datasets[dataset]] = value
+        pos += 5 + size
+    return fields
+
+
+class ImageMetadata(NamedTuple):
+    """Metadata record shown by the editors"""
+    title: str = ""
+    artist: str = ""
+    copyright: str = ""
+    comment: str = ""
+    rating: int = 0
+    keywords: tuple = ()
+
+
+def read_metadata(path):
+    """Read the metadata record of an image, memoized by (path, mtime, size)"""
+    st = os.stat(path)
+    return _read_metadata_cached(os.path.abspath(path), st.st_mtime_ns, st.st_size)
+
+
+@lru_cache(maxsize=4096)
+def _read_metadata_cached(path, mtime_ns, size):
+    import piexif
+    exif_source, xmp_bytes, iptc_bytes = None, None, None
+    if path.lower().endswith(('.jpg', '.jpeg', '.png')):
+        with open(path, 'rb') as f:
+            exif_source, xmp_bytes, iptc_bytes = read_metadata_blocks(f)
+    else:
+        # TIFF and others: PIL only parses the header on open
+        from PIL import Image
+        with Image.open(path) as img:
+            exif_source = img.info.get('exif') or (path if img.format == 'TIFF' else None)
+            xmp_bytes = img.info.get('xmp')
+
+    exif_dict = load_exif_dict(exif_source)
+    exif = exif_text_fields(exif_dict)
+    xmp = parse_xmp_fields(xmp_bytes)
+    iptc = parse_iptc_fields(iptc_bytes)
+
+    keywords = xmp["subject"] or iptc["subject"]
+    if not keywords:
+        xp_keywords = exif_dict["0th"].get(piexif.ImageIFD.XPKeywords)
+        if xp_keywords:
+            keywords = split_keywords(bytes(xp_keywords).decode('utf-16le', errors='ignore').rstrip("\x00"))
+    return ImageMetadata(
+        title=exif["title"] or xmp["title"] or xmp["description"] or iptc["title"] or iptc["description"],
+        artist=exif["artist"] or xmp["artist"] or iptc["artist"],
+        copyright=exif["copyright"] or xmp["copyright"] or iptc["copyright"],
+        comment=exif["comment"],
+        rating=xmp["rating"] or 0,
+        keywords=tuple(keywords),
+    )
+
+
+def prefetch_metadata(paths):
+    """Warm the metadata cache for images the user is likely to browse to next"""
+    for path in paths:
+        try:
+            read_metadata(path)
+        except Exception:
+            pass
+
+
+def build_xmp(rating, keywords):
+    """Create an XMP packet with rating and one rdf:li per keyword"""
+    items = "\n".join(f"                    <rdf:li>{escape(k, quote=False)}</rdf:li>" for k in keywords)
+    return f"""<x:xmpmeta xmlns:x="adobe:ns:meta/" x:xmptk="XMP Core 5.4.0">
+    <rdf:RDF xmlns:rdf="http://www.w3.org/1999/02/22-rdf-syntax-ns#">
+        <rdf:Description rdf:about="" xmlns:xmp="http://ns.adobe.com/xap/1.0/">
+            <xmp:Rating>{rating}</xmp:Rating>
+        </rdf:Description>
+        <rdf:Description rdf:about="" xmlns:dc="http://purl.org/dc/elements/1.1/">
+            <dc:subject>
+                <rdf:Bag>
+{items}
+                </rdf:Bag>
+            </dc:subject>
+        </rdf:Description>
+    </rdf:RDF>
+</x:xmpmeta>""".encode('utf-8')
+
+
+def merge_xmp(xmp_bytes, rating, keywords):
+    """xmp_bytes with its rating and dc:subject replaced; every other property is kept
+
+    Falls back to build_xmp() when there is no packet or it cannot be parsed.
+    """
+    data = (xmp_bytes or b"").strip(b"\x00 \r\n\t")
+    try:
+        namespaces = [ns for _, ns in ET.iterparse(io.BytesIO(data), events=("start-ns",))] if data else []
+        root = ET.fromstring(data) if data else None
+    except ET.ParseError:
+        root = None
+    descriptions = list(root.iter("{%s}Description" % NS["rdf"])) if root is not None else []
+    if not descriptions:
+        return build_xmp(rating, keywords)
+    for desc in descriptions:
+        desc.attrib.pop("{%s}Rating" % NS["xmp"], None)
+        for node in desc.findall("xmp:Rating", NS) + desc.findall("dc:subject", NS):
+            desc.remove(node)
+    ET.SubElement(descriptions[0], "{%s}Rating" % NS["xmp"]).text = str(rating)
+    bag = ET.SubElement(ET.SubElement(descriptions[0], "{%s}subject" % NS["dc"]), "{%s}Bag" % NS["rdf"])
+    for keyword in keywords:
+        ET.SubElement(bag, "{%s}li" % NS["rdf"]).text = keyword
+    # Keep the packet's own prefixes (lr:, photoshop:, ...) instead of ns0:, ns1:
+    for prefix, uri in namespaces + [("x", "adobe:ns:meta/")] + list(NS.items()):
+        try:
+            ET.register_namespace(prefix, uri)
+        except ValueError:
+            pass
+    body = ET.tostring(root, encoding="unicode").encode('utf-8')
+    # The <?xpacket?> wrapper is outside the root element, so it is carried over as text
+    head = data[:data.index(b"?>") + 2] if data.startswith(b"<?xpacket") else b""
+    tail = data[data.rindex(b"<?xpacket"):] if data.rstrip().endswith(b"?>") and b"<?xpacket end" in data else b""
+    return head + body + tail
+
+
+def split_keywords(text):
+    """Split a comma/semicolon separated keyword string"""
+    return [k.strip() for k in text.replace(";", ",").split(",") if k.strip()]
+
+
+def empty_exif_dict():
+    return {"0th": {}, "Exif": {}, "GPS": {}, "1st": {}, "thumbnail": None}
+
+
+def update_exif_fields(exif_dict, values, capture_dates=True):
+    """Write title/artist/copyright/comment values into an EXIF dictionary
+
+    DateTime is set to now; the capture dates (DateTimeOriginal/Digitized)
+    too unless capture_dates is False.
+    """
+    import piexif.helper
+    if values.get("title"):
+        exif_dict["0th"][piexif.ImageIFD.ImageDescription] = values["title"].encode('utf-8')
+    if values.get("artist"):
+        exif_dict["0th"][piexif.ImageIFD.Artist] = values["artist"].encode('utf-8')
+    if values.get("copyright"):
+        exif_dict["0th"][piexif.ImageIFD.Copyright] = values["copyright"].encode('utf-8')
+    if values.get("comment"):
+        exif_dict["Exif"][piexif.ExifIFD.UserComment] = piexif.helper.UserComment.dump(
+            values["comment"], encoding="unicode")
+
+    # Update timestamps
+    now = datetime.now().strftime("%Y:%m:%d %H:%M:%S")
+    exif_dict["0th"][piexif.ImageIFD.DateTime] = now
+    if capture_dates:
+        exif_dict["Exif"][piexif.ExifIFD.DateTimeOriginal] = now
+        exif_dict["Exif"][piexif.ExifIFD.DateTimeDigitized] = now
+
+
+def exif_text_fields(exif_dict):
+    """Extract the editable text fields from an EXIF dictionary"""
+    import piexif.helper
+    def text(ifd, tag):
+        return exif_dict[ifd].get(tag, b'').decode('utf-8', errors='ignore')
+    fields = {
+        "title": text("0th", piexif.ImageIFD.ImageDescription),
+        "artist": text("0th", piexif.ImageIFD.Artist),
+        "copyright": text("0th", piexif.ImageIFD.Copyright),
+        "comment": "",
+    }
+    user_comment = exif_dict["Exif"].get(piexif.ExifIFD.UserComment, b'')
+    if user_comment:
+        try:
+            fields["comment"] = piexif.helper.UserComment.load(user_comment)
+        except Exception:
+            pass
+    return fields
+
+
+def write_metadata(src_path, dst, exif_dict, xmp):
+    """Write src_path with new metadata into the file object dst, re-encoding only when the format requires it"""
+    import piexif
+    exif_bytes = piexif.dump(exif_dict)
+    lower = src_path.lower()
+    if lower.endswith(('.jpg', '.jpeg', '.png')):
+        with open(src_path, 'rb', buffering=BUFFER_SIZE) as src:
+            if lower.endswith('.png'):
+                write_png_metadata(src, dst, exif_bytes, xmp)
+            else:
+                write_jpeg_metadata(src, dst, exif_bytes, xmp)
+    else:
+        from PIL import Image
+        with Image.open(src_path) as img:
+            if img.format == 'TIFF':
+                # TIFF keeps XMP in tag 700 of the image IFD, and PIL copies that tag from the source on save
+                if xmp:
+                    img.tag_v2[TIFF_XMP_TAG] = xmp
+                img.save(dst, format='TIFF', exif=exif_bytes)
+            else:
+                img.save(dst, format=img.format, exif=exif_bytes, **({'xmp': xmp} if xmp else {}))
+
+
+def read_raw_metadata(path):
+    """Return the raw (exif, xmp) blocks of an image, reading only its header
+
+    PIL has no EXIF block for TIFF, whose tags live in the image IFD itself;
+    the path is returned in its place, which piexif.load reads directly.
+    """
+    if path.lower().endswith(('.jpg', '.jpeg', '.png')):
+        with open(path, 'rb') as f:
+            exif_bytes, xmp_bytes, _ = read_metadata_blocks(f)
+        return exif_bytes, xmp_bytes
+    from PIL import Image
+    with Image.open(path) as img:
+        return img.info.get('exif') or (path if img.format == 'TIFF' else None), img.info.get('xmp')
+
+
+def load_exif_dict(exif_bytes):
+    """piexif.load (of a block or a TIFF path) that falls back to an empty dictionary for missing or broken EXIF"""
+    import piexif
+    try:
+        exif_dict = piexif.load(exif_bytes) if exif_bytes else empty_exif_dict()
+    except Exception:
+        return empty_exif_dict()
+    # PIL writes UNDEFINED tags (UserComment...) of TIFFs as BYTE arrays, which piexif.dump refuses
+    for ifd in ("0th", "Exif", "GPS", "Interop", "1st"):
+        for tag, value in (exif_dict.get(ifd) or {}).items():
+            if isinstance(value, tuple) and piexif.TAGS[ifd].get(tag, {}).get("type") == piexif.TYPES.Undefined:
+                exif_dict[ifd][tag] = bytes(value)
+    return exif_dict
+
+
+def update_file_metadata(path, exif_dict, xmp):
+    """Rewrite the metadata of path in place through an atomic replace"""
+    replace_file(path, lambda f: write_metadata(path, f, exif_dict, xmp))
+
+
+def embed_stock_metadata(path, title="", keywords="", description=""):
+    """Embed generated title/keywords/description into a JPG or TIFF in place, keeping its XMP"""
+    import piexif.helper
+    if not path.lower().endswith(EMBEDDABLE_EXTENSIONS):
+        raise ValueError("Metadata can only be embedded into JPG/TIFF files")
+    exif_bytes, xmp_bytes = read_raw_metadata(path)
+    exif_dict = load_exif_dict(exif_bytes)
+    if title:
+        exif_dict["0th"][piexif.ImageIFD.XPTitle] = title.encode('utf-16le')
+    if keywords:
+        exif_dict["0th"][piexif.ImageIFD.XPKeywords] = keywords.replace(",", ";").strip().encode('utf-16le')
+    if description:
+        exif_dict["0th"][piexif.ImageIFD.ImageDescription] = description.encode('utf-8')
+        exif_dict["Exif"][piexif.ExifIFD.UserComment] = piexif.helper.UserComment.dump(description, encoding="unicode")
+    update_file_metadata(path, exif_dict, xmp_bytes)
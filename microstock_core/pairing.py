@@ -0,0 +1,90 @@
+"""Companion-file pairing: EPS/AI vectors with the JPG preview of the same name.
+
+Files are grouped by directory and lower-case stem, reading each directory
+once. A group's raster preview is what gets sent to Gemini; renames and CSV
+rows then cover every file of the group so pairs stay in sync.
+"""
+import os
+
+VECTOR_EXTENSIONS = ('.eps', '.ai', '.svg')
+# Preferred preview first when a stem has several raster files
+PREVIEW_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp', '.tiff', '.tif')
+
+
+def group_by_stem(paths):
+    """{(directory, lower-case stem): [paths]} in input order"""
+    groups = {}
+    for path in paths:
+        directory, name = os.path.split(path)
+        groups.setdefault((directory, os.path.splitext(name)[0].lower()), []).append(path)
+    return groups
+
+
+def _preview_rank(path):
+    ext = os.path.splitext(path)[1].lower()
+    return PREVIEW_EXTENSIONS.index(ext) if ext in PREVIEW_EXTENSIONS else len(PREVIEW_EXTENSIONS)
+
+
+class PairingIndex:
+    """Directory listings grouped by stem, each directory read once"""
+
+    def __init__(self, vector_extensions=VECTOR_EXTENSIONS, preview_extensions=PREVIEW_EXTENSIONS):
+        self.vector_extensions = vector_extensions
+        self.preview_extensions = preview_extensions
+        self.listings = {}  # directory -> {lower-case stem: [paths]}
+
+    def _listing(self, directory):
+        if directory not in self.listings:
+            try:
+                with os.scandir(directory or ".") as entries:
+                    names = [e.name for e in entries if e.is_file()]
+            except OSError:
+                names = []
+            stems = {}
+            for name in sorted(names):
+                stems.setdefault(os.path.splitext(name)[0].lower(), []).append(os.path.join(directory, name))
+            self.listings[directory] = stems
+        return self.listings[directory]
+
+    def group_of(self, path):
+        """Every file in path's directory with the same stem (path included)"""
+        directory, name = os.path.split(path)
+        return self._listing(directory).get(os.path.splitext(name)[0].lower(), [path])
+
+    def companions(self, path):
+        """Vector files sharing path's stem"""
+        return [p for p in self.group_of(path)
+                if p != path and p.lower().endswith(self.vector_extensions)]
+
+    def preview_for(self, vector_path):
+        """Raster preview of a vector file, or None"""
+        candidates = [p for p in self.group_of(vector_path) if p.lower().endswith(self.preview_extensions)]
+        return min(candidates, key=_preview_rank) if candidates else None
+
+    def pair(self, paths):
+        """[(preview, [companions])] for a mixed list of rasters and vectors, one entry per group
+
+        Vectors are replaced by their preview; vectors without one are
+        returned separately as the second value.
+        """
+        pairs, seen, orphans = [], set(), []
+        for path in paths:
+            if path.lower().endswith(self.vector_extensions):
+                preview = self.preview_for(path)
+                if preview is None:
+                    orphans.append(path)
+                    continue
+                path = preview
+            key = os.path.normcase(path)
+            if key not in seen:
+                seen.add(key)
+                pairs.append((path, self.companions(path)))
+        return pairs, orphans
+
+
+def expand_group_items(items):
+    """Each item followed by a copy per companion file (same metadata, companion path and name)"""
+    for item in items:
+        yield item
+        for companion in item.get("companions", ()):
+            yield dict(item, filepath=companion, filename=os.path.basename(companion))
@@ -0,0 +1,186 @@
+"""Rename patterns: new file names built from tokens, counters and regex groups.
+
+    {stem} {ext}               original name without extension / extension without the dot
+    {name}                     the base name typed next to the pattern
+    {n} {n:04}                 counter, with an optional format spec
+    {date} {date:%Y%m%d}       file modification date (strftime spec, default %Y-%m-%d)
+    {exif:DateTimeOriginal}    any EXIF tag by name; date tags take a strftime spec after a second ":"
+    {w} {h}                    pixel size from the image header
+    {1} {2} {label}            groups of the optional regex, matched against the original stem
+
+The pattern is parsed once. EXIF blocks and sizes are read only when the
+pattern uses them, from file headers, on a thread pool; files of a group
+(an EPS and its JPG preview) share one name and one counter value. The
+original extension is always kept.
+"""
+import os
+import re
+import string
+from datetime import datetime
+from functools import lru_cache
+
+from .metadata import load_exif_dict, read_raw_metadata
+from .renaming import _RESERVED
+from .scanning import IMAGE_EXTENSIONS, probe_size
+
+TOKENS = ("stem", "ext", "name", "n", "date", "exif", "w", "h")
+READ_WORKERS = 8
+EXIF_DATE_FORMAT = "%Y:%m:%d %H:%M:%S"
+# Characters no file system accepts in a name, and control characters
+_ILLEGAL = re.compile(r'[<>:"/\\|?*\x00-\x1f]+')
+
+
+@lru_cache(maxsize=None)
+def exif_tags():
+    """EXIF tag name -> (IFD, tag number), first IFD wins for names used twice"""
+    import piexif
+    tags = {}
+    for ifd in ("0th", "Exif", "GPS", "Interop"):
+        for tag, info in piexif.TAGS[ifd].items():
+            tags.setdefault(info["name"], (ifd, tag))
+    return tags
+
+
+def is_rename_pattern(text):
+    return "{" in text
+
+
+def _exif_text(value):
+    if isinstance(value, bytes):
+        return value.split(b"\x00", 1)[0].decode("utf-8", errors="ignore").strip()
+    if isinstance(value, tuple) and len(value) == 2 and all(isinstance(v, int) for v in value):
+        numerator, denominator = value  # Rational
+        return f"{numerator / denominator:g}" if denominator else ""
+    if isinstance(value, tuple):
+        return "-".join(_exif_text(v) for v in value)
+    return str(value)
+
+
+class RenamePattern:
+    def __init__(self, pattern, regex=None, start=1, step=1):
+        """Parse pattern once; raises ValueError for unknown tokens or a bad regex"""
+        self.pattern = pattern
+        try:
+            self.regex = re.compile(regex) if regex else None
+        except re.error as e:
+            raise ValueError(f"Bad regular expression: {e}") from None
+        self.start = start
+        self.step = step
+        groups = set()
+        if self.regex:
+            groups = {str(i) for i in range(self.regex.groups + 1)} | set(self.regex.groupindex)
+        self.parts = []  # (literal, field, format spec)
+        self.exif_tags = {}
+        for literal, field, spec, _ in string.Formatter().parse(pattern):
+            if field is not None and field not in TOKENS and field not in groups:
+                raise ValueError(f"Unknown token {{{field}}}" if field else "Empty {} in pattern")
+            if field == "exif":
+                tag = (spec or "").split(":", 1)[0]
+                if tag not in exif_tags():
+                    raise ValueError(f"Unknown EXIF tag '{tag}'")
+                self.exif_tags[tag] = exif_tags()[tag]
+            elif field is not None and field != "date":
+                try:  # Bad specs fail here, not mid-batch; regex groups are text like stem and name
+                    format(0 if field in ("n", "w", "h") else "", spec or "")
+                except ValueError as e:
+                    raise ValueError(f"Bad format '{spec}' for {{{field}}}: {e}") from None
+            self.parts.append((literal, field, spec or ""))
+        fields = {field for _, field, _ in self.parts}
+        self.needs_exif = "exif" in fields
+        self.needs_size = bool(fields & {"w", "h"})
+        self.needs_date = "date" in fields
+
+    def read_info(self, path):
+        """Header values the pattern uses for one file"""
+        info = {}
+        if self.needs_date:
+            info["date"] = datetime.fromtimestamp(os.stat(path).st_mtime)
+        if self.needs_size:
+            info["size"] = probe_size(path)
+        if self.needs_exif:
+            try:
+                exif_dict = load_exif_dict(read_raw_metadata(path)[0])
+            except Exception:
+                exif_dict = {}
+            info["exif"] = {name: exif_dict.get(ifd, {}).get(tag) for name, (ifd, tag) in self.exif_tags.items()}
+        return info
+
+    def _value(self, field, spec, stem, ext, name, n, info, match):
+        if field == "stem":
+            return format(stem, spec)
+        if field == "ext":
+            return format(ext, spec)
+        if field == "name":
+            return format(name, spec)
+        if field == "n":
+            return format(n, spec)
+        if field == "date":
+            return info["date"].strftime(spec or "%Y-%m-%d")
+        if field in ("w", "h"):
+            size = info["size"]
+            return format(size[field == "h"], spec) if size else ""
+        if field == "exif":
+            tag, _, date_format = spec.partition(":")
+            value = info["exif"].get(tag)
+            if value is None:
+                return ""
+            text = _exif_text(value)
+            if date_format:
+                try:
+                    return datetime.strptime(text, EXIF_DATE_FORMAT).strftime(date_format)
+                except ValueError:
+                    pass
+            return text
+        value = match.group(int(field) if field.isdigit() else field)
+        return format(value or "", spec)
+
+    def render(self, path, n, name="", info=None):
+        """New base name for path, or None when the regex does not match its stem"""
+        stem, ext = os.path.splitext(os.path.basename(path))
+        match = None
+        if self.regex:
+            match = self.regex.search(stem)
+            if match is None:
+                return None
+        out = []
+        for literal, field, spec in self.parts:
+            out.append(literal)
+            if field is not None:
+                out.append(self._value(field, spec, stem, ext[1:], name, n, info or {}, match))
+        base = _ILLEGAL.sub("_", "".join(out)).strip().rstrip(". ")
+        return f"{base}_" if _RESERVED.match(base) else base
+
+    def names(self, entries, name="", workers=READ_WORKERS):
+        """(paths, new base) for each entry (a path or a list of paths sharing a name)
+
+        Header values are read in parallel from each entry's image file.
+        Returns the renames and a list of (path, error) for entries that
+        could not be named; those do not use up a counter value.
+        """
+        entries = [[entry] if isinstance(entry, str) else list(entry) for entry in entries]
+        sources = [min(paths, key=lambda p: not p.lower().endswith(IMAGE_EXTENSIONS)) for paths in entries]
+        infos = [None] * len(entries)
+        if self.needs_exif or self.needs_size or self.needs_date:
+            from concurrent.futures import ThreadPoolExecutor
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                infos = list(pool.map(self._safe_info, sources))
+        renames, errors, n = [], [], self.start
+        for paths, source, info in zip(entries, sources, infos):
+            if isinstance(info, Exception):
+                errors.append((source, str(info)))
+                continue
+            base = self.render(source, n, name, info)
+            if base is None:
+                errors.append((source, "Name does not match the pattern's regular expression"))
+            elif not base:
+                errors.append((source, "Pattern gives an empty name"))
+            else:
+                renames.append((paths, base))
+                n += self.step
+        return renames, errors
+
+    def _safe_info(self, path):
+        try:
+            return self.read_info(path)
+        except OSError as e:
+            return e
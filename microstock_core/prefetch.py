@@ -0,0 +1,93 @@
+"""Pipelined preparation of upload payloads.
+
+UploadPrefetcher decodes, downsizes and encodes the next few images on a
+process pool while earlier ones are being uploaded. At most `ahead` payloads are
+queued or held at a time, which caps memory; take() hands out the one for a
+given key (and tops the queue up again).
+
+Starting worker processes is the expensive part, so callers that run many
+batches (watch mode starts one per file) create the pool once with
+make_prepare_executor() and pass it in. Workers are spawned rather than forked:
+the GUI forks from a process that already runs Tk, asyncio and writer threads.
+"""
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from .conversion import image_upload_part
+
+
+def prepare_upload(path, max_side, quality):
+    """Worker: returns (image part, seconds spent preparing it)"""
+    start = time.perf_counter()
+    part = image_upload_part(path, max_side, quality)
+    return part, time.perf_counter() - start
+
+
+def make_prepare_executor(workers=None, use_processes=True):
+    """Process pool (spawned workers) for prepare_upload, or a thread pool where processes are unavailable"""
+    workers = workers or os.cpu_count() or 1
+    if use_processes:
+        try:
+            import multiprocessing  # Only when used: it is a slow import
+            from concurrent.futures import ProcessPoolExecutor
+            return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+        except (OSError, NotImplementedError, ValueError) as e:
+            print(f"Process pool unavailable, preparing images on threads: {e}")
+    return ThreadPoolExecutor(max_workers=workers)
+
+
+class UploadPrefetcher:
+    def __init__(self, jobs, ahead=8, max_side=None, quality=90, workers=None, use_processes=True, executor=None):
+        """jobs is an ordered list of (key, path); a given executor is shared and left running by close()"""
+        self.order = list(jobs)
+        self.paths = dict(self.order)
+        self.ahead = max(1, ahead)
+        self.max_side = max_side
+        self.quality = quality
+        self.lock = threading.Lock()
+        self.pending = {}    # key -> Future, submitted but not yet taken
+        self.next_index = 0
+        self.taken = set()
+        self.owns_executor = executor is None
+        self.executor = executor or make_prepare_executor(workers or min(self.ahead, os.cpu_count() or 1), use_processes)
+        with self.lock:
+            self._fill()
+
+    def _submit(self, key):
+        return self.executor.submit(prepare_upload, self.paths[key], self.max_side, self.quality)
+
+    def _fill(self):
+        while len(self.pending) < self.ahead and self.next_index < len(self.order):
+            key = self.order[self.next_index][0]
+            self.next_index += 1
+            if key not in self.taken and key not in self.pending:
+                try:
+                    self.pending[key] = self._submit(key)
+                except RuntimeError:  # Executor already shut down
+                    return
+
+    def take(self, key):
+        """Future of (image part, prepare seconds) for key; submitted now if it was not queued yet"""
+        with self.lock:
+            future = self.pending.pop(key, None)
+            self.taken.add(key)
+            if future is None:
+                try:
+                    future = self._submit(key)
+                except RuntimeError as e:
+                    future = Future()
+                    future.set_exception(e)
+            self._fill()
+            return future
+
+    def close(self):
+        """Drop queued work; running preparations finish in the background"""
+        with self.lock:
+            for future in self.pending.values():
+                future.cancel()
+            self.pending.clear()
+            self.next_index = len(self.order)
+        if self.owns_executor:
+            self.executor.shutdown(wait=False, cancel_futures=True)
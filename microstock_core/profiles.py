@@ -0,0 +1,104 @@
+"""Prompt profiles: model, prompt template, limits and output schema under one name.
+
+Prompts and response schemas are compiled once per (profile, fields) and
+memoized, so a batch and every re-ask inside it reuse the same objects.
+User profiles are kept as JSON next to the generator's settings and are
+layered over the built-in ones.
+
+Templates are str.format strings with {fields} (one line per requested
+field), {example}, {title_words}, {keyword_items} and {description_words};
+literal braces are doubled.
+"""
+import json
+import os
+from functools import lru_cache
+from typing import NamedTuple
+
+from .fileio import replace_file
+from .responses import METADATA_FIELDS, generation_config
+
+DEFAULT_MODEL = "gemini-1.5-flash-latest"
+DEFAULT_TEMPLATE = """Analyze this image and generate metadata in JSON format with these fields:
+{fields}
+
+Return *only* the JSON object itself, without any surrounding text or markdown, like this:
+{{{example}}}"""
+FIELD_LINES = {
+    "title": '- "title": A descriptive title (exactly {title_words} words)',
+    "keywords": '- "keywords": Comma-separated relevant keywords (exactly {keyword_items} items)',
+    "description": '- "description": A detailed description (exactly {description_words} words)',
+}
+
+
+class PromptProfile(NamedTuple):
+    name: str
+    model: str = DEFAULT_MODEL
+    template: str = DEFAULT_TEMPLATE
+    title_words: int = 15
+    keyword_items: int = 40
+    description_words: int = 100
+    structured: bool = True         # Send the JSON response schema
+
+
+PROFILES = {
+    "Default": PromptProfile("Default"),
+    "Adobe Stock": PromptProfile(
+        "Adobe Stock", template=DEFAULT_TEMPLATE.replace(
+            "with these fields:", "for Adobe Stock with these fields (most important keywords first, no brand names):"),
+        title_words=12, keyword_items=49, description_words=30),
+    "Detailed (Pro)": PromptProfile("Detailed (Pro)", model="gemini-1.5-pro-latest", title_words=20,
+                                    keyword_items=50, description_words=150),
+}
+
+
+@lru_cache(maxsize=256)
+def compile_prompt(profile, fields=METADATA_FIELDS):
+    """Prompt text asking for fields (a tuple), built once per profile and field set"""
+    limits = {"title_words": profile.title_words, "keyword_items": profile.keyword_items,
+              "description_words": profile.description_words}
+    lines = "\n".join(FIELD_LINES[f].format(**limits) for f in fields)
+    example = ", ".join(f'"{f}": "..."' for f in fields)
+    return profile.template.format(fields=lines, example=example, **limits)
+
+
+@lru_cache(maxsize=32)
+def schema_config(fields=METADATA_FIELDS):
+    """generation_config(fields), built once per field set (fields must be a tuple)"""
+    return generation_config(fields)
+
+
+def profile_from_dict(name, values):
+    """PromptProfile from a JSON object; raises ValueError for unknown keys or a broken template"""
+    unknown = set(values) - set(PromptProfile._fields[1:])
+    if unknown:
+        raise ValueError(f"Profile '{name}': unknown setting(s) {', '.join(sorted(unknown))}")
+    profile = PromptProfile(name, **values)
+    try:
+        compile_prompt(profile)
+    except (KeyError, IndexError, ValueError) as e:
+        raise ValueError(f"Profile '{name}': bad template ({e})") from None
+    return profile
+
+
+def load_profiles(path):
+    """Built-in profiles updated with the user's file; a missing or broken file gives the built-ins"""
+    profiles = dict(PROFILES)
+    if not path or not os.path.isfile(path):
+        return profiles
+    try:
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        for name, values in data.items():
+            profiles[name] = profile_from_dict(name, values)
+    except (OSError, ValueError, TypeError) as e:
+        print(f"Could not load prompt profiles from {path}: {e}")
+    return profiles
+
+
+def save_profiles(path, profiles):
+    """Write the profiles that differ from the built-ins"""
+    data = {name: profile._asdict() for name, profile in profiles.items() if PROFILES.get(name) != profile}
+    for values in data.values():
+        del values["name"]
+    text = json.dumps(data, indent=2, ensure_ascii=False)
+    replace_file(str(path), lambda f: f.write(text.encode("utf-8")))
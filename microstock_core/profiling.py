@@ -0,0 +1,101 @@
+"""Per-stage timers and counters for batch processing.
+
+A StageProfiler is shared by the worker threads of a batch; the GUI polls
+snapshot() for its live panel and export_trace() writes every recorded event
+as one JSON object per line for offline profiling.
+"""
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+
+class StageProfiler:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self, total=0):
+        """Start a new batch of total items; earlier events are dropped"""
+        with self.lock:
+            self.total = total
+            self.done = 0
+            self.started_at = time.perf_counter()
+            self.wall_start = time.time()
+            self.stages = {}    # name -> [count, seconds]
+            self.counters = {}
+            self.events = []
+
+    @contextmanager
+    def stage(self, name, item=None):
+        """Time the enclosed block as one occurrence of stage name"""
+        start = time.perf_counter()
+        error = None
+        try:
+            yield
+        except BaseException as e:
+            error = type(e).__name__
+            raise
+        finally:
+            self.record(name, time.perf_counter() - start, item, error)
+
+    def record(self, name, seconds, item=None, error=None):
+        with self.lock:
+            entry = self.stages.setdefault(name, [0, 0.0])
+            entry[0] += 1
+            entry[1] += seconds
+            event = {"t": round(time.perf_counter() - self.started_at, 4), "stage": name,
+                     "ms": round(seconds * 1000, 3), "thread": threading.current_thread().name}
+            if item is not None:
+                event["item"] = item
+            if error:
+                event["error"] = error
+            self.events.append(event)
+
+    def count(self, name, amount=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def item_done(self, item=None, status=None):
+        with self.lock:
+            self.done += 1
+            self.events.append({"t": round(time.perf_counter() - self.started_at, 4), "stage": "done",
+                                "item": item, "status": status})
+
+    def snapshot(self):
+        """Current throughput, ETA and per-stage totals"""
+        with self.lock:
+            elapsed = time.perf_counter() - self.started_at
+            per_min = self.done / elapsed * 60 if elapsed > 0 and self.done else 0.0
+            remaining = max(0, self.total - self.done)
+            eta = remaining / per_min * 60 if per_min else None
+            stage_total = sum(seconds for _, seconds in self.stages.values()) or 1.0
+            stages = {name: {"count": count, "seconds": round(seconds, 3),
+                             "avg_ms": round(seconds / count * 1000, 1),
+                             "share": round(seconds / stage_total, 3)}
+                      for name, (count, seconds) in self.stages.items()}
+            return {"done": self.done, "total": self.total, "elapsed": round(elapsed, 2),
+                    "images_per_min": round(per_min, 1), "eta_seconds": None if eta is None else round(eta),
+                    "stages": stages, "counters": dict(self.counters)}
+
+    def summary_line(self):
+        """One-line text for the live panel"""
+        snap = self.snapshot()
+        eta = snap["eta_seconds"]
+        eta_text = "--" if eta is None else f"{eta // 60}m{eta % 60:02d}s"
+        parts = [f"{snap['done']}/{snap['total']} done", f"{snap['images_per_min']} images/min", f"ETA {eta_text}"]
+        breakdown = sorted(snap["stages"].items(), key=lambda kv: kv[1]["seconds"], reverse=True)
+        if breakdown:
+            parts.append(" · ".join(f"{name} {s['share']:.0%} ({s['avg_ms']:.0f} ms)" for name, s in breakdown))
+        return " | ".join(parts)
+
+    def export_trace(self, path):
+        """Write a header line with the batch summary followed by every event"""
+        snap = self.snapshot()
+        with self.lock:
+            events = list(self.events)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(json.dumps({"stage": "batch", "started": self.wall_start, **snap}) + "\n")
+            for event in events:
+                f.write(json.dumps(event) + "\n")
+        return len(events)
@@ -0,0 +1,139 @@
+"""File renaming engine shared by the renamer tools and the generator."""
+import errno
+import os
+import re
+from pathlib import Path
+
+# Runs of characters that are not letters, digits, "_", "-" or spaces become one "_"
+_UNSAFE_RUN = re.compile(r"[^\w \-]+")
+_SPACE_RUN = re.compile(r"\s+")
+# Device names Windows refuses as file names, with any extension
+_RESERVED = re.compile(r"^(con|prn|aux|nul|com\d|lpt\d)$", re.IGNORECASE)
+
+
+def unique_path(path):
+    """Return path, or path with _1, _2, ... appended to the stem if it already exists"""
+    path = Path(path)
+    candidate = path
+    counter = 1
+    while candidate.exists():
+        candidate = path.with_name(f"{path.stem}_{counter}{path.suffix}")
+        counter += 1
+    return candidate
+
+
+def rename_with_suffix(file_path, new_name):
+    """Rename a file to new_name keeping its extension, numbering duplicates; returns the new path"""
+    path = Path(file_path)
+    new_path = unique_path(path.with_name(f"{new_name}{path.suffix}"))
+    path.rename(new_path)
+    return new_path
+
+
+def title_to_filename(title, max_length=100):
+    """Turn a generated title into a safe file name base"""
+    name = _SPACE_RUN.sub(" ", _UNSAFE_RUN.sub("_", title)).strip(" _-")
+    name = name[:max_length].rstrip(" _-")
+    return f"{name}_" if _RESERVED.match(name) else name
+
+
+def plan_renames(renames):
+    """Target paths for (path, new base name) pairs, keeping each extension
+
+    path may also be a list of files that must end up with the same base,
+    such as an EPS and its JPG preview; such a group shares one suffix.
+    Every directory is listed once and names are reserved in memory, so
+    clashes with existing files or within the batch get _1, _2, ... suffixes
+    without a stat per file. Returns (path, new path) pairs; files already
+    named right are left out.
+    """
+    taken = {}  # directory -> lower-case names in use
+    plan = []
+    for paths, base in renames:
+        members = []
+        for path in ([paths] if isinstance(paths, str) else paths):
+            directory, name = os.path.split(path)
+            if directory not in taken:
+                with os.scandir(directory or ".") as entries:
+                    taken[directory] = {e.name.lower() for e in entries}
+            members.append((path, directory, name, os.path.splitext(name)[1]))
+
+        def clashes(suffix):
+            # A case-only change of a file's own name is not a clash
+            return any(f"{base}{suffix}{ext}".lower() in taken[directory]
+                       and f"{base}{suffix}{ext}".lower() != name.lower()
+                       for _, directory, name, ext in members)
+
+        counter, suffix = 0, ""
+        while clashes(suffix):
+            counter += 1
+            suffix = f"_{counter}"
+        for path, directory, name, ext in members:
+            candidate = f"{base}{suffix}{ext}"
+            if candidate == name:
+                continue
+            taken[directory].discard(name.lower())
+            taken[directory].add(candidate.lower())
+            plan.append((path, os.path.join(directory, candidate)))
+    return plan
+
+
+def apply_renames(plan, on_done=None):
+    """Rename every (path, new path) pair; on_done(path, new path, error) follows each one
+
+    A plan may hand a name freed by an earlier rename to a later file. If
+    that earlier rename failed, the name is still in use, so existing
+    targets are refused instead of overwritten (os.rename would replace them
+    on POSIX). Returns the number of files renamed and a list of
+    (path, error message).
+    """
+    renamed, errors = 0, []
+    for path, new_path in plan:
+        try:
+            # A case-only rename on a case-insensitive file system "exists" as the same file
+            if os.path.lexists(new_path) and not os.path.samefile(path, new_path):
+                raise FileExistsError(errno.EEXIST, "Target name is still in use", new_path)
+            os.rename(path, new_path)
+            error = None
+            renamed += 1
+        except OSError as e:
+            error = str(e)
+            errors.append((path, error))
+        if on_done:
+            on_done(path, new_path, error)
+    return renamed, errors
+
+
+def rename_batch(files, new_name, pattern=None, cancel=None, on_planned=None, on_step=None):
+    """Rename files after new_name (or a RenamePattern), then the members of the ZIPs among them
+
+    Files sharing a stem (an EPS and its JPG preview) are renamed as one
+    group. With a pattern, groups are numbered in path order and archives
+    last. on_planned(total) is called once the number of steps is known,
+    on_step(zip path or None) after each renamed file and archive. Stops
+    before the next stage when cancel is set. Returns a list of (path, error).
+    """
+    # Imported here: patterns and archives build on this module
+    from .archives import rename_archives
+    from .pairing import group_by_stem
+
+    errors = []
+    zips = sorted(f for f in files if f.lower().endswith('.zip'))
+    groups = group_by_stem([f for f in files if not f.lower().endswith('.zip')])
+    if pattern is None:
+        renames, archives = [(paths, new_name) for paths in groups.values()], [(f, new_name) for f in zips]
+    else:
+        named, errors = pattern.names(sorted(groups.values()) + zips)
+        renames = [(paths, base) for paths, base in named if not paths[0].lower().endswith('.zip')]
+        archives = [(paths[0], base) for paths, base in named if paths[0].lower().endswith('.zip')]
+    try:
+        plan = plan_renames(renames)
+    except OSError as e:
+        plan = []
+        errors.append((files[0], str(e)))
+    if on_planned:
+        on_planned(len(plan) + len(archives))  # Files already named right are not in the plan
+    if cancel is None or not cancel.is_set():
+        errors += apply_renames(plan, on_done=on_step and (lambda *args: on_step(None)))[1]
+    errors += rename_archives(archives, cancel=cancel, on_done=on_step and (lambda zip_path, error: on_step(zip_path)))
+    return errors
@@ -0,0 +1,82 @@
+"""Structured-output schema and tolerant parsing for Gemini metadata answers.
+
+parse_metadata_json() accepts fenced, prose-wrapped and truncated JSON and
+returns whatever complete fields it can recover, plus the names of the fields
+that still need to be asked for.
+"""
+import json
+import re
+from typing import TypedDict
+
+METADATA_FIELDS = ("title", "keywords", "description")
+JSON_MIME_TYPE = "application/json"
+
+
+def metadata_schema(fields=METADATA_FIELDS):
+    """TypedDict describing the requested fields, usable as response_schema"""
+    return TypedDict("StockMetadata", {name: str for name in fields})
+
+
+def generation_config(fields=METADATA_FIELDS):
+    return {"response_mime_type": JSON_MIME_TYPE, "response_schema": metadata_schema(fields)}
+
+
+def _field_value(value):
+    if isinstance(value, (list, tuple)):
+        return ", ".join(str(v).strip() for v in value if str(v).strip())
+    return str(value).strip() if value is not None else ""
+
+
+def _decode_object(text):
+    """First complete JSON object in text, or None"""
+    decoder = json.JSONDecoder()
+    start = text.find("{")
+    while start != -1:
+        try:
+            obj, _ = decoder.raw_decode(text, start)
+            if isinstance(obj, dict):
+                return obj
+        except json.JSONDecodeError:
+            pass
+        start = text.find("{", start + 1)
+    return None
+
+
+def _salvage_fields(text, fields):
+    """Fields whose string value is complete (closing quote present) in broken JSON"""
+    found = {}
+    for name in fields:
+        match = re.search(rf'"{name}"\s*:\s*"((?:[^"\\]|\\.)*)"', text, re.S)
+        if match:
+            try:
+                found[name] = json.loads(f'"{match.group(1)}"')
+            except json.JSONDecodeError:
+                found[name] = match.group(1)
+            continue
+        # Keywords sometimes come back as a JSON list
+        match = re.search(rf'"{name}"\s*:\s*(\[[^\]]*\])', text, re.S)
+        if match:
+            try:
+                found[name] = json.loads(match.group(1))
+            except json.JSONDecodeError:
+                pass
+    return found
+
+
+def parse_metadata_json(text, fields=METADATA_FIELDS):
+    """Return (metadata, missing) from a model answer
+
+    metadata holds the non-empty fields that were recovered; missing lists the
+    requested fields that were absent, empty or cut off.
+    """
+    text = (text or "").strip()
+    obj = _decode_object(text)
+    if obj is None:
+        obj = _salvage_fields(text, fields)
+    metadata = {}
+    for name in fields:
+        value = _field_value(obj.get(name))
+        if value:
+            metadata[name] = value
+    missing = [name for name in fields if name not in metadata]
+    return metadata, missing
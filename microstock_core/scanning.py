@@ -0,0 +1,84 @@
+"""Folder scanning and fast image probing."""
+import os
+import struct
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.tiff', '.tif')
+
+# Leading bytes of the formats the tools accept
+IMAGE_SIGNATURES = (
+    (b"\xff\xd8\xff", "JPEG"),
+    (b"\x89PNG\r\n\x1a\n", "PNG"),
+    (b"II*\x00", "TIFF"),
+    (b"MM\x00*", "TIFF"),
+    (b"BM", "BMP"),
+    (b"GIF87a", "GIF"),
+    (b"GIF89a", "GIF"),
+)
+
+
+def list_folder_images(folder, extensions=IMAGE_EXTENSIONS):
+    """Sorted image paths of a folder, from a single directory scan"""
+    with os.scandir(folder) as entries:
+        return sorted(os.path.join(folder, e.name) for e in entries
+                      if e.is_file() and e.name.lower().endswith(extensions))
+
+
+def walk_files(folder):
+    """All file paths below folder"""
+    file_paths = []
+    for root, _, files in os.walk(folder):
+        for file in files:
+            file_paths.append(os.path.join(root, file))
+    return file_paths
+
+
+def probe_image(path):
+    """Return the image format from the file signature, or None if it is not a supported image"""
+    try:
+        with open(path, 'rb') as f:
+            head = f.read(12)
+    except OSError:
+        return None
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "WEBP"
+    for signature, fmt in IMAGE_SIGNATURES:
+        if head.startswith(signature):
+            return fmt
+    return None
+
+
+def _jpeg_size(f):
+    f.seek(2)
+    while True:
+        head = f.read(2)
+        if len(head) < 2 or head[0] != 0xFF:
+            return None
+        marker = head[1]
+        while marker == 0xFF:  # Fill bytes
+            marker = f.read(1)[0]
+        if marker in (0xDA, 0xD9):  # Start of scan / end of image before any frame header
+            return None
+        if marker == 0x01 or 0xD0 <= marker <= 0xD7:
+            continue
+        length = struct.unpack(">H", f.read(2))[0] - 2
+        # SOF0-SOF15 except DHT (C4), JPG (C8) and DAC (CC) carry the frame size
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            height, width = struct.unpack(">xHH", f.read(5))
+            return width, height
+        f.seek(length, os.SEEK_CUR)
+
+
+def probe_size(path):
+    """(width, height) of an image from its header, or None when it cannot be read"""
+    try:
+        with open(path, 'rb') as f:
+            head = f.read(24)
+            if head.startswith(b"\xff\xd8"):
+                return _jpeg_size(f)
+            if head.startswith(b"\x89PNG\r\n\x1a\n") and head[12:16] == b"IHDR":
+                return struct.unpack(">II", head[16:24])
+        from PIL import Image  # TIFF, WebP and others: PIL only parses the header on open
+        with Image.open(path) as img:
+            return img.size
+    except Exception:
+        return None
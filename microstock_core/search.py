@@ -0,0 +1,272 @@
+"""Local full-text index over generated metadata (SQLite FTS5).
+
+MetadataIndex keeps one row per image path with its title, keywords,
+description and content hash, an FTS5 table for keyword, phrase and prefix
+search, and a keyword table for frequency stats. queue() hands records to a
+background writer so processing threads never wait for the disk.
+
+Command line:
+    python -m microstock_core.search search "red kite" [--phrase | --prefix]
+    python -m microstock_core.search stats [QUERY]
+    python -m microstock_core.search add results.csv
+"""
+import argparse
+import os
+import queue
+import sqlite3
+import sys
+import threading
+import time
+
+from .fileio import config_dir
+from .importer import file_hash
+
+SEARCH_MODES = ("words", "phrase", "prefix")
+# Pending records are committed in one transaction after this many records or seconds
+COMMIT_RECORDS = 200
+COMMIT_SECONDS = 0.5
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS images (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,
+    filename TEXT NOT NULL,
+    hash TEXT,
+    title TEXT NOT NULL DEFAULT '',
+    keywords TEXT NOT NULL DEFAULT '',
+    description TEXT NOT NULL DEFAULT '',
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS images_hash ON images(hash);
+CREATE TABLE IF NOT EXISTS image_keywords (
+    image_id INTEGER NOT NULL REFERENCES images(id) ON DELETE CASCADE,
+    keyword TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS image_keywords_keyword ON image_keywords(keyword);
+CREATE INDEX IF NOT EXISTS image_keywords_image ON image_keywords(image_id);
+CREATE VIRTUAL TABLE IF NOT EXISTS images_fts USING fts5(
+    title, keywords, description, filename,
+    content='images', content_rowid='id', tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+);
+CREATE TRIGGER IF NOT EXISTS images_ai AFTER INSERT ON images BEGIN
+    INSERT INTO images_fts(rowid, title, keywords, description, filename)
+    VALUES (new.id, new.title, new.keywords, new.description, new.filename);
+END;
+CREATE TRIGGER IF NOT EXISTS images_ad AFTER DELETE ON images BEGIN
+    INSERT INTO images_fts(images_fts, rowid, title, keywords, description, filename)
+    VALUES ('delete', old.id, old.title, old.keywords, old.description, old.filename);
+END;
+CREATE TRIGGER IF NOT EXISTS images_au AFTER UPDATE ON images BEGIN
+    INSERT INTO images_fts(images_fts, rowid, title, keywords, description, filename)
+    VALUES ('delete', old.id, old.title, old.keywords, old.description, old.filename);
+    INSERT INTO images_fts(rowid, title, keywords, description, filename)
+    VALUES (new.id, new.title, new.keywords, new.description, new.filename);
+END;
+"""
+
+
+def default_index_path():
+    """metadata_index.sqlite next to the generator's saved settings"""
+    return str(config_dir() / "metadata_index.sqlite")
+
+
+def split_index_keywords(keywords):
+    seen = []
+    for keyword in str(keywords).replace(";", ",").split(","):
+        keyword = keyword.strip().lower()
+        if keyword and keyword not in seen:
+            seen.append(keyword)
+    return seen
+
+
+def build_match(query, mode="words"):
+    """FTS5 MATCH expression for plain user input; every token is quoted so symbols are safe"""
+    tokens = [t.replace('"', '""') for t in query.replace(",", " ").split()]
+    if not tokens:
+        return None
+    if mode == "phrase":
+        return '"' + " ".join(tokens) + '"'
+    suffix = "*" if mode == "prefix" else ""
+    return " AND ".join(f'"{t}"{suffix}' for t in tokens)
+
+
+class MetadataIndex:
+    def __init__(self, path=None):
+        self.path = path or default_index_path()
+        self.db = sqlite3.connect(self.path, check_same_thread=False)
+        self.lock = threading.Lock()
+        with self.lock:
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute("PRAGMA synchronous=NORMAL")
+            self.db.execute("PRAGMA foreign_keys=ON")
+            self.db.executescript(SCHEMA)
+            self.db.commit()
+        self.pending = queue.Queue()
+        self.writer = None
+
+    # --- Writing ---
+    def _upsert(self, record):
+        path = os.path.abspath(record["filepath"])
+        keywords = record.get("keyword") or ""
+        self.db.execute(
+            "INSERT INTO images(path, filename, hash, title, keywords, description, updated) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT(path) DO UPDATE SET filename=excluded.filename, hash=COALESCE(excluded.hash, hash), "
+            "title=excluded.title, keywords=excluded.keywords, description=excluded.description, "
+            "updated=excluded.updated",
+            (path, os.path.basename(path), record.get("hash"), record.get("title") or "", keywords,
+             record.get("description") or "", time.time()))
+        image_id = self.db.execute("SELECT id FROM images WHERE path = ?", (path,)).fetchone()[0]
+        self.db.execute("DELETE FROM image_keywords WHERE image_id = ?", (image_id,))
+        self.db.executemany("INSERT INTO image_keywords(image_id, keyword) VALUES (?, ?)",
+                            [(image_id, k) for k in split_index_keywords(keywords)])
+
+    def upsert_many(self, records):
+        """Insert or update records (dicts with filepath, title, keyword, description, optional hash)"""
+        with self.lock:
+            with self.db:
+                for record in records:
+                    self._upsert(record)
+
+    def queue(self, record, with_hash=True):
+        """Index a record from a background thread; the file hash is computed there too"""
+        record = {k: record.get(k) for k in ("filepath", "title", "keyword", "description", "hash")}
+        record["_hash"] = with_hash and not record.get("hash")
+        self.pending.put(record)
+        if self.writer is None:
+            with self.lock:  # Callers from several threads must not start a second writer
+                if self.writer is None:
+                    self.writer = threading.Thread(target=self._write_pending, daemon=True)
+                    self.writer.start()
+
+    def _commit(self, batch):
+        try:
+            self.upsert_many(batch)
+        except sqlite3.Error as e:
+            print(f"Metadata index write failed: {e}")
+        for _ in batch:
+            self.pending.task_done()
+
+    def _write_pending(self):
+        batch, started = [], time.monotonic()
+        while True:
+            try:
+                record = self.pending.get(timeout=COMMIT_SECONDS)
+            except queue.Empty:
+                if batch:
+                    self._commit(batch)
+                    batch = []
+                started = time.monotonic()
+                continue
+            if record is None:
+                self._commit(batch)
+                self.pending.task_done()
+                return
+            if record.pop("_hash"):
+                try:
+                    record["hash"] = file_hash(record["filepath"])
+                except OSError:
+                    pass
+            batch.append(record)
+            if len(batch) >= COMMIT_RECORDS or time.monotonic() - started >= COMMIT_SECONDS:
+                self._commit(batch)
+                batch, started = [], time.monotonic()
+
+    def flush(self):
+        """Wait until queued records are written"""
+        if self.writer is not None:
+            self.pending.join()
+
+    def close(self):
+        with self.lock:
+            writer, self.writer = self.writer, None
+        if writer is not None:
+            self.pending.put(None)
+            writer.join()
+        with self.lock:
+            self.db.close()
+
+    # --- Reading ---
+    def count(self):
+        with self.lock:
+            return self.db.execute("SELECT COUNT(*) FROM images").fetchone()[0]
+
+    def search(self, query, mode="words", limit=100):
+        """Best matches first: list of dicts with path, title, keywords, description, hash"""
+        match = build_match(query, mode)
+        if not match:
+            return []
+        with self.lock:
+            rows = self.db.execute(
+                "SELECT i.path, i.title, i.keywords, i.description, i.hash "
+                "FROM images_fts JOIN images i ON i.id = images_fts.rowid "
+                "WHERE images_fts MATCH ? ORDER BY bm25(images_fts, 5.0, 3.0, 1.0, 0.5) LIMIT ?",
+                (match, limit)).fetchall()
+        return [dict(zip(("path", "title", "keywords", "description", "hash"), row)) for row in rows]
+
+    def keyword_stats(self, query=None, mode="words", limit=50):
+        """Most used keywords overall, or among the images matching query: list of (keyword, count)"""
+        with self.lock:
+            if not query:
+                return self.db.execute(
+                    "SELECT keyword, COUNT(*) AS n FROM image_keywords GROUP BY keyword "
+                    "ORDER BY n DESC, keyword LIMIT ?", (limit,)).fetchall()
+            match = build_match(query, mode)
+            if not match:
+                return []
+            return self.db.execute(
+                "SELECT k.keyword, COUNT(*) AS n FROM image_keywords k "
+                "WHERE k.image_id IN (SELECT rowid FROM images_fts WHERE images_fts MATCH ?) "
+                "GROUP BY k.keyword ORDER BY n DESC, k.keyword LIMIT ?", (match, limit)).fetchall()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m microstock_core.search",
+                                     description="Search the local metadata index.")
+    parser.add_argument("--db", help="Index file (default: next to the generator settings)")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_search = sub.add_parser("search", help="Find images by keywords, phrase or prefix")
+    p_search.add_argument("query")
+    group = p_search.add_mutually_exclusive_group()
+    group.add_argument("--phrase", action="store_true", help="Match the words in this order")
+    group.add_argument("--prefix", action="store_true", help="Match words starting with the given text")
+    p_search.add_argument("--limit", type=int, default=20)
+    p_stats = sub.add_parser("stats", help="Most used keywords, overall or for a query")
+    p_stats.add_argument("query", nargs="?")
+    p_stats.add_argument("--limit", type=int, default=30)
+    p_add = sub.add_parser("add", help="Index rows of an exported CSV or JSONL file")
+    p_add.add_argument("files", nargs="+")
+    args = parser.parse_args(argv)
+
+    index = MetadataIndex(args.db)
+    try:
+        if args.command == "search":
+            mode = "phrase" if args.phrase else "prefix" if args.prefix else "words"
+            start = time.perf_counter()
+            results = index.search(args.query, mode, args.limit)
+            for r in results:
+                print(f"{r['path']}\n    {r['title']}\n    {r['keywords']}")
+            print(f"{len(results)} result(s) in {(time.perf_counter() - start) * 1000:.1f} ms "
+                  f"({index.count()} indexed)")
+        elif args.command == "stats":
+            for keyword, count in index.keyword_stats(args.query, limit=args.limit):
+                print(f"{count:>8}  {keyword}")
+        elif args.command == "add":
+            from .importer import read_metadata_rows
+            for path in args.files:
+                base_dir = os.path.dirname(os.path.abspath(path))
+                records = []
+                for row in read_metadata_rows(path):
+                    if "filepath" not in row and "filename" in row:
+                        row["filepath"] = os.path.join(base_dir, row["filename"])
+                    if "filepath" in row:
+                        records.append(row)
+                index.upsert_many(records)
+                print(f"{path}: indexed {len(records)} row(s)")
+    finally:
+        index.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,64 @@
+"""Startup budget for the GUI tools.
+
+Each tool calls report_startup() right before its mainloop; the time from
+importing this package to the first drawn window is printed and compared with
+STARTUP_BUDGET_MS. Run ``python -m microstock_core.startup`` to launch every
+tool once in check mode and get a pass/fail summary.
+"""
+import os
+import subprocess
+import sys
+import time
+
+from . import IMPORTED_AT
+
+STARTUP_BUDGET_MS = 500
+# Modules that must not be loaded before the window appears
+HEAVY_MODULES = ("PIL.Image", "google.generativeai")
+CHECK_ENV = "MICROSTOCK_STARTUP_CHECK"
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TOOLS = (
+    "Metadata_Generator_Gemini.py",
+    os.path.join("Image Metadata Editor", "image_metadata_editor.py"),
+    os.path.join("metadata editing and batch renaming", "metadata editing and batch renaming.py"),
+    os.path.join("File Renamer", "File renamer.py"),
+)
+
+
+def report_startup(root, tool_name):
+    """Print how long the window took to appear once Tk has drawn it"""
+    def done():
+        elapsed_ms = (time.perf_counter() - IMPORTED_AT) * 1000
+        status = "OK" if elapsed_ms <= STARTUP_BUDGET_MS else "OVER BUDGET"
+        print(f"{tool_name}: window ready in {elapsed_ms:.0f} ms (budget {STARTUP_BUDGET_MS} ms) {status}")
+        eager = [name for name in HEAVY_MODULES if name in sys.modules]
+        if eager:
+            print(f"  loaded before the window appeared: {', '.join(eager)}")
+        if os.environ.get(CHECK_ENV):
+            root.destroy()
+
+    root.after_idle(done)
+
+
+def check_all():
+    """Start every tool in check mode and return the number of tools over budget"""
+    env = dict(os.environ, **{CHECK_ENV: "1"})
+    failures = 0
+    for tool in TOOLS:
+        script = os.path.join(REPO_DIR, tool)
+        started = time.perf_counter()
+        result = subprocess.run([sys.executable, script], env=env, cwd=os.path.dirname(script),
+                                capture_output=True, text=True, timeout=60)
+        total_ms = (time.perf_counter() - started) * 1000
+        report = [line for line in result.stdout.splitlines() if "window ready" in line or "loaded before" in line]
+        print(f"{tool} (process lifetime {total_ms:.0f} ms)")
+        for line in report or [f"  no startup report, exit code {result.returncode}: {result.stderr.strip()[-200:]}"]:
+            print(f"  {line.strip()}")
+        if not report or "OVER BUDGET" in report[0]:
+            failures += 1
+    return failures
+
+
+if __name__ == "__main__":
+    sys.exit(1 if check_all() else 0)
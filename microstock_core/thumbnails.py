@@ -0,0 +1,197 @@
+"""Preview thumbnails: embedded EXIF thumbnails or draft-mode decodes, cached on disk.
+
+Cache files are keyed by path, mtime and size, so an edited image gets a new
+thumbnail and stale ones are simply never read again. Reading a cache file
+touches it, and on startup prune_cache deletes the least recently used files
+once the folder is over its size cap, which also clears those orphans. Creation runs on a
+small thread pool (Pillow releases the GIL while decoding); LruCache keeps the
+most recently shown results in memory.
+"""
+import hashlib
+import io
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from .fileio import create_temp_file
+from .metadata import load_exif_dict, read_raw_metadata
+
+THUMB_SIZE = 240
+# Embedded EXIF thumbnails smaller than this on the long side are not used
+MIN_EMBEDDED_SIDE = 160
+THUMB_QUALITY = 85
+CACHE_MAX_BYTES = 200 * 1024 * 1024  # About 15,000 thumbnails
+# Temp files younger than this may still be being written
+TEMP_GRACE_SECONDS = 3600
+
+
+class LruCache:
+    """Thread-safe mapping that drops the least recently used entry past maxsize"""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+
+    def get(self, key, default=None):
+        with self.lock:
+            if key not in self.entries:
+                return default
+            self.entries.move_to_end(key)
+            return self.entries[key]
+
+    def put(self, key, value):
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def __contains__(self, key):
+        with self.lock:
+            return key in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+
+def _orient(image, orientation):
+    from PIL import Image
+    transpose = {2: Image.Transpose.FLIP_LEFT_RIGHT, 3: Image.Transpose.ROTATE_180,
+                 4: Image.Transpose.FLIP_TOP_BOTTOM, 5: Image.Transpose.TRANSPOSE, 6: Image.Transpose.ROTATE_270,
+                 7: Image.Transpose.TRANSVERSE, 8: Image.Transpose.ROTATE_90}.get(orientation)
+    return image.transpose(transpose) if transpose else image
+
+
+def embedded_thumbnail(path, min_side=MIN_EMBEDDED_SIDE):
+    """The EXIF thumbnail of a JPEG, upright, or None when missing or too small"""
+    if not path.lower().endswith((".jpg", ".jpeg")):
+        return None
+    from PIL import Image
+    exif_dict = load_exif_dict(read_raw_metadata(path)[0])
+    data = exif_dict.get("thumbnail")
+    if not data:
+        return None
+    try:
+        image = Image.open(io.BytesIO(data))
+        image.load()
+    except Exception:
+        return None
+    if max(image.size) < min_side:
+        return None
+    return _orient(image.convert("RGB"), exif_dict["0th"].get(274, 1))
+
+
+def make_thumbnail(path, size=THUMB_SIZE):
+    """RGB thumbnail fitting size x size, decoding as little of the image as possible"""
+    from PIL import Image, ImageOps
+    image = embedded_thumbnail(path, min(size, MIN_EMBEDDED_SIDE))
+    if image is None:
+        with Image.open(path) as source:
+            source.draft("RGB", (size, size))  # JPEG: decode at 1/2, 1/4 or 1/8 scale
+            image = ImageOps.exif_transpose(source).convert("RGB")
+    image.thumbnail((size, size), Image.Resampling.LANCZOS, reducing_gap=2.0)
+    return image
+
+
+def prune_cache(cache_dir, max_bytes=CACHE_MAX_BYTES):
+    """Delete the least recently used cache files until the folder fits max_bytes; returns how many went"""
+    entries, total, now = [], 0, time.time()
+    for folder, _, names in os.walk(cache_dir):
+        for name in names:
+            path = os.path.join(folder, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            if name.endswith(".tmp"):
+                if now - stat.st_mtime < TEMP_GRACE_SECONDS:
+                    continue
+                entries.append((0, stat.st_size, path))  # Left behind by a crash: goes first
+            else:
+                entries.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+    removed = 0
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= size
+        removed += 1
+    return removed
+
+
+class ThumbnailCache:
+    def __init__(self, cache_dir, size=THUMB_SIZE, workers=2, max_bytes=CACHE_MAX_BYTES):
+        self.cache_dir = str(cache_dir)
+        self.size = size
+        from concurrent.futures import ThreadPoolExecutor
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="thumbnail")
+        self.lock = threading.Lock()
+        self.pending = {}  # path -> Future, so repeated requests share one job
+        if max_bytes:
+            self.pool.submit(prune_cache, self.cache_dir, max_bytes)
+
+    def cache_path(self, path):
+        stat = os.stat(path)
+        key = hashlib.sha1(f"{os.path.abspath(path)}|{stat.st_mtime_ns}|{stat.st_size}|{self.size}".encode()).hexdigest()
+        return os.path.join(self.cache_dir, key[:2], key + ".jpg")
+
+    def load(self, path):
+        """Thumbnail image for path, from the disk cache or freshly made and stored"""
+        from PIL import Image
+        cached = self.cache_path(path)
+        if os.path.exists(cached):
+            try:
+                with Image.open(cached) as image:
+                    image.load()
+                    image = image.copy()
+            except OSError:
+                pass  # Corrupt cache file; make it again
+            else:
+                try:
+                    os.utime(cached)  # Marks it recently used for prune_cache
+                except OSError:
+                    pass
+                return image
+        image = make_thumbnail(path, self.size)
+        os.makedirs(os.path.dirname(cached), exist_ok=True)
+        fd, temp_path = create_temp_file(cached)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                image.save(f, "JPEG", quality=THUMB_QUALITY)
+            os.replace(temp_path, cached)
+        except OSError:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        return image
+
+    def submit(self, path, callback=None):
+        """Future of load(path) on the pool; callback(path, image, error) runs on the worker thread"""
+        with self.lock:
+            future = self.pending.get(path)
+            if future is None:
+                future = self.pool.submit(self.load, path)
+                self.pending[path] = future
+                future.add_done_callback(lambda f: self._forget(path))
+        if callback:
+            def done(f):
+                error = None if f.cancelled() else f.exception()
+                callback(path, None if f.cancelled() or error else f.result(), error)
+            future.add_done_callback(done)
+        return future
+
+    def _forget(self, path):
+        with self.lock:
+            self.pending.pop(path, None)
+
+    def close(self):
+        self.pool.shutdown(wait=False, cancel_futures=True)
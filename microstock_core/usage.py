@@ -0,0 +1,104 @@
+"""Token and cost accounting for Gemini requests.
+
+UsageTotals adds up response.usage_metadata per batch; estimate_batch() predicts
+tokens, cost and time for a run before it starts.
+"""
+import math
+import threading
+
+# USD per million tokens (input, output), paid tier, prompts up to 128k tokens
+MODEL_PRICES = {
+    "gemini-1.5-flash": (0.075, 0.30),
+    "gemini-1.5-flash-8b": (0.0375, 0.15),
+    "gemini-1.5-pro": (1.25, 5.00),
+    "gemini-2.0-flash": (0.10, 0.40),
+    "gemini-2.0-flash-lite": (0.075, 0.30),
+}
+# Gemini 1.5 bills every image at this flat rate; later models bill it per 768x768 tile
+IMAGE_TOKENS = 258
+IMAGE_TILE = 768
+# Rough averages used for estimates when no usage has been recorded yet
+CHARS_PER_TOKEN = 4
+TOKENS_PER_WORD = 1.4
+TOKENS_PER_KEYWORD = 2.5
+JSON_OVERHEAD_TOKENS = 25
+DEFAULT_SECONDS_PER_IMAGE = 4.0
+
+
+def model_prices(model_name):
+    """(input, output) USD per million tokens; the longest matching family wins"""
+    name = model_name.lower().replace("models/", "")
+    matches = [family for family in MODEL_PRICES if name.startswith(family)]
+    if not matches:
+        return MODEL_PRICES["gemini-1.5-flash"]
+    return MODEL_PRICES[max(matches, key=len)]
+
+
+def cost_usd(input_tokens, output_tokens, model_name):
+    price_in, price_out = model_prices(model_name)
+    return (input_tokens * price_in + output_tokens * price_out) / 1_000_000
+
+
+def image_tokens(width, height, model_name):
+    """Tokens one image costs as prompt input"""
+    if model_name.lower().replace("models/", "").startswith("gemini-1.5") or (width <= 384 and height <= 384):
+        return IMAGE_TOKENS
+    return math.ceil(width / IMAGE_TILE) * math.ceil(height / IMAGE_TILE) * IMAGE_TOKENS
+
+
+def usage_counts(response):
+    """(input, output) tokens from a generate_content response, (0, 0) when absent"""
+    usage = getattr(response, "usage_metadata", None)
+    if usage is None:
+        return 0, 0
+    return (getattr(usage, "prompt_token_count", 0) or 0), (getattr(usage, "candidates_token_count", 0) or 0)
+
+
+class UsageTotals:
+    """Thread-safe running totals for one batch"""
+
+    def __init__(self, model_name):
+        self.model_name = model_name
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.requests = 0
+            self.input_tokens = 0
+            self.output_tokens = 0
+
+    def add(self, input_tokens, output_tokens):
+        """Record one request; returns its cost in USD"""
+        with self.lock:
+            self.requests += 1
+            self.input_tokens += input_tokens
+            self.output_tokens += output_tokens
+        return cost_usd(input_tokens, output_tokens, self.model_name)
+
+    @property
+    def cost(self):
+        return cost_usd(self.input_tokens, self.output_tokens, self.model_name)
+
+    def summary(self):
+        return (f"{self.requests} requests, {self.input_tokens:,} in / {self.output_tokens:,} out tokens, "
+                f"~${self.cost:.4f}")
+
+
+def estimate_output_tokens(title_words, keyword_items, desc_words):
+    return int((title_words + desc_words) * TOKENS_PER_WORD + keyword_items * TOKENS_PER_KEYWORD
+               + JSON_OVERHEAD_TOKENS)
+
+
+def estimate_batch(image_sizes, prompt, limits, model_name, seconds_per_image=None, workers=1):
+    """Predict tokens, cost and duration for a run
+
+    image_sizes is a list of (width, height), limits is (title_words, keyword_items,
+    desc_words) as set on the sliders.
+    """
+    prompt_tokens = math.ceil(len(prompt) / CHARS_PER_TOKEN)
+    input_tokens = sum(prompt_tokens + image_tokens(w, h, model_name) for w, h in image_sizes)
+    output_tokens = estimate_output_tokens(*limits) * len(image_sizes)
+    seconds = len(image_sizes) * (seconds_per_image or DEFAULT_SECONDS_PER_IMAGE) / max(1, workers)
+    return {"images": len(image_sizes), "input_tokens": input_tokens, "output_tokens": output_tokens,
+            "cost_usd": cost_usd(input_tokens, output_tokens, model_name), "seconds": seconds}
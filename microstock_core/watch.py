@@ -0,0 +1,163 @@
+"""Watch a folder for new images: inotify on Linux, directory polling elsewhere.
+
+A new file is reported only after its size and mtime have stopped changing
+for `settle` seconds, so half-copied exports are never picked up. Files that
+were already in the folder when watching started are ignored. With inotify the
+folder is still rescanned now and then, because network shares do not always
+deliver events.
+"""
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import threading
+import time
+
+from .scanning import IMAGE_EXTENSIONS, probe_image
+
+SETTLE_SECONDS = 1.0
+POLL_SECONDS = 1.0
+RESCAN_SECONDS = 30.0
+# Names that copy tools, browsers and our own atomic writes use while a file is incomplete
+TEMP_SUFFIXES = (".tmp", ".part", ".crdownload", ".download", ".partial")
+
+IN_MODIFY = 0x002
+IN_CLOSE_WRITE = 0x008
+IN_MOVED_TO = 0x080
+IN_CREATE = 0x100
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+_EVENT_HEADER = struct.Struct("iIII")
+
+
+class _Inotify:
+    """Minimal inotify binding through libc (no third-party dependency)"""
+
+    def __init__(self, folder):
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        mask = IN_CREATE | IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO
+        if libc.inotify_add_watch(self.fd, os.fsencode(folder), mask) < 0:
+            error = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(error, f"inotify_add_watch failed for {folder}")
+
+    def read(self, timeout):
+        """File names with events, waiting up to timeout seconds for the first one"""
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+        names, offset = [], 0
+        while offset + _EVENT_HEADER.size <= len(data):
+            _, _, _, length = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b"\x00")
+            offset += length
+            if name:
+                names.append(os.fsdecode(name))
+        return names
+
+    def close(self):
+        os.close(self.fd)
+
+
+class FolderWatcher:
+    """Calls on_files(paths) from a background thread with each group of new, settled images"""
+
+    def __init__(self, folder, on_files, extensions=IMAGE_EXTENSIONS, settle=SETTLE_SECONDS,
+                 poll_interval=POLL_SECONDS, use_inotify=True):
+        self.folder = os.path.abspath(folder)
+        self.on_files = on_files
+        self.extensions = tuple(e.lower() for e in extensions)
+        self.settle = settle
+        self.poll_interval = poll_interval
+        self.use_inotify = use_inotify and sys.platform.startswith("linux")
+        self.mode = None  # "inotify" or "polling" once started
+        self.stop_event = threading.Event()
+        self.known = set()
+        self.candidates = {}  # path -> ((size, mtime_ns), time the signature was first seen)
+        self.thread = None
+
+    def _wanted(self, name):
+        lowered = name.lower()
+        return not name.startswith(".") and lowered.endswith(self.extensions) and not lowered.endswith(TEMP_SUFFIXES)
+
+    def _scan(self):
+        try:
+            with os.scandir(self.folder) as entries:
+                names = [e.name for e in entries if self._wanted(e.name)]
+        except OSError as e:
+            print(f"Watch folder scan failed: {e}")
+            return
+        for name in names:
+            path = os.path.join(self.folder, name)
+            if path not in self.known:
+                self.candidates.setdefault(path, None)
+
+    def _settled(self):
+        now, ready = time.monotonic(), []
+        for path, seen in list(self.candidates.items()):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                del self.candidates[path]  # Moved away or deleted before it settled
+                continue
+            signature = (stat.st_size, stat.st_mtime_ns)
+            if seen is None or seen[0] != signature:
+                self.candidates[path] = (signature, now)
+            elif stat.st_size and now - seen[1] >= self.settle:
+                del self.candidates[path]
+                self.known.add(path)
+                ready.append(path)
+        return ready
+
+    def start(self):
+        with os.scandir(self.folder) as entries:
+            self.known = {os.path.join(self.folder, e.name) for e in entries}
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join(timeout=2)
+
+    def _run(self):
+        notifier = None
+        if self.use_inotify:
+            try:
+                notifier = _Inotify(self.folder)
+            except (OSError, AttributeError) as e:
+                print(f"inotify unavailable ({e}), polling {self.folder}")
+        self.mode = "inotify" if notifier else "polling"
+        last_scan = time.monotonic()
+        try:
+            while not self.stop_event.is_set():
+                if notifier:
+                    # Wake often while files are settling, otherwise sleep until an event arrives
+                    for name in notifier.read(0.25 if self.candidates else self.poll_interval):
+                        path = os.path.join(self.folder, name)
+                        if self._wanted(name) and path not in self.known:
+                            self.candidates.setdefault(path, None)
+                    if time.monotonic() - last_scan >= RESCAN_SECONDS:
+                        self._scan()
+                        last_scan = time.monotonic()
+                else:
+                    self.stop_event.wait(min(self.poll_interval, 0.25) if self.candidates else self.poll_interval)
+                    self._scan()
+                ready = [p for p in self._settled() if probe_image(p)]
+                if ready and not self.stop_event.is_set():
+                    self.on_files(sorted(ready))
+        finally:
+            if notifier:
+                notifier.close()